@@ -5,19 +5,17 @@ veristat=$(realpath selftests/bpf/veristat)
 # Dump verifier logs for a list of programs
 # Usage: dump_failed_logs <progs_file>
 # - progs_file: file with lines of format "file_name,prog_name"
+# Full logs are packed into veristat-logs.tar.gz, only excerpts are printed.
 dump_failed_logs() {
     local progs_file="$1"
     local objects_dir="${VERISTAT_OBJECTS_DIR:-$(pwd)}"
 
-    while read -r line; do
-        local file prog
-        file=$(echo "$line" | cut -d',' -f1)
-        prog=$(echo "$line" | cut -d',' -f2)
-        echo "VERIFIER LOG FOR $file/$prog:"
-        echo "=================================================================="
-        $veristat -v "$objects_dir/$file" -f "$prog"
-        echo "=================================================================="
-    done < "$progs_file"
+    python3 ./.github/scripts/dump_veristat_logs.py \
+        --veristat "$veristat" \
+        --objects-dir "$objects_dir" \
+        --output-dir veristat-logs \
+        --archive veristat-logs.tar.gz \
+        "$progs_file"
 }
 
 if [[ ! -f "${BASELINE_PATH}" ]]; then
@@ -41,25 +39,22 @@ if [[ ! -f "${BASELINE_PATH}" ]]; then
     exit 0
 fi
 
-cmp_out=$(mktemp veristate_compare_out_XXXXXX.csv)
+failed_progs=$(mktemp failed_progs_XXXXXX.txt)
 
-$veristat \
-    --output-format csv \
-    --emit file,prog,verdict,states \
-    --compare "${BASELINE_PATH}" "${VERISTAT_OUTPUT}" > $cmp_out
-
-python3 ./.github/scripts/veristat_compare.py $cmp_out
+python3 ./.github/scripts/veristat_compare.py \
+    --baseline "${BASELINE_PATH}" \
+    --failed-progs "$failed_progs" \
+    --full-table veristat-changes.csv \
+    --records veristat-records.ndjson \
+    --rollup veristat-rollup.json \
+    "${VERISTAT_OUTPUT}"
 exit_code=$?
 
 # print verifier log for progs that failed to load
-if [[ -n "$VERISTAT_DUMP_LOG_ON_FAILURE" ]]; then
-    failed_progs=$(mktemp failed_progs_XXXXXX.txt)
-    awk -F',' '$4 == "failure" { print $1","$2 }' "$cmp_out" > "$failed_progs"
-    if [[ -s "$failed_progs" ]]; then
-        echo && dump_failed_logs "$failed_progs"
-    fi
-    rm -f "$failed_progs"
+if [[ -n "$VERISTAT_DUMP_LOG_ON_FAILURE" && -s "$failed_progs" ]]; then
+    echo && dump_failed_logs "$failed_progs"
 fi
+rm -f "$failed_progs"
 
 if [[ $exit_code -eq 0 ]]; then
     echo "$(basename "$0"): veristat output matches the baseline"
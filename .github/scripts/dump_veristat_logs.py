@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# Dumps verifier logs of the programs listed in a file with lines of format
+# "file_name,prog_name", as written by veristat_compare.py --failed-progs.
+#
+# Programs are grouped per object file and each object file is verified by a
+# single `veristat -v` invocation with one -f filter per program. Object
+# files are processed by a pool of workers. veristat starts the log of each
+# program with a line like:
+#
+#   PROCESSING file.bpf.o/prog, DURATION US: 123, VERDICT: failure, VERIFIER LOG:
+#
+# which is used to split the output into one file per program in
+# --output-dir. The results table veristat prints after the last log is
+# not part of any log. Each log is capped at --max-log-size bytes, keeping its head
+# and its tail (where the error is). Only --max-logs programs are dumped.
+# The output directory is packed into --archive for upload as an artifact,
+# and only the last --excerpt-lines lines of each log are printed.
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import re
+import subprocess
+import sys
+import tarfile
+from typing import Deque, Dict, Final, List, Tuple
+
+DEFAULT_JOBS: Final[int] = os.cpu_count() or 1
+DEFAULT_MAX_LOG_SIZE: Final[int] = 1024 * 1024
+DEFAULT_MAX_LOGS: Final[int] = 100
+DEFAULT_EXCERPT_LINES: Final[int] = 20
+
+PROCESSING_LINE_RE: Final[re.Pattern] = re.compile(
+    r"^PROCESSING (?P<file_name>.*)/(?P<prog_name>[^/,]+), DURATION US:"
+)
+# Header of the results table following the logs
+RESULTS_TABLE_RE: Final[re.Pattern] = re.compile(r"^File\s+Program\s+Verdict\b")
+
+SEPARATOR: Final[str] = "=" * 66
+
+
+class ProgramLog:
+    """
+    Verifier log capped to `max_size` bytes: the first half of the budget
+    is written out as it comes, the last half is kept in a ring of lines.
+    """
+
+    def __init__(self, path: str, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self._head_size = 0
+        self._file = open(path, "w", encoding="utf-8")
+        self._tail: Deque[str] = collections.deque()
+        self._tail_size = 0
+
+    def write(self, line: str) -> None:
+        size = len(line.encode("utf-8"))
+        self.size += size
+        if not self._tail and self._head_size + size <= self.max_size // 2:
+            self._head_size += size
+            self._file.write(line)
+            return
+
+        self._tail.append(line)
+        self._tail_size += size
+        while self._tail_size > self.max_size // 2 and len(self._tail) > 1:
+            self._tail_size -= len(self._tail.popleft().encode("utf-8"))
+
+    def close(self) -> None:
+        truncated = self.size - self._head_size - self._tail_size
+        if truncated > 0:
+            self._file.write(f"\n[... {truncated} bytes truncated ...]\n\n")
+        self._file.writelines(self._tail)
+        self._file.close()
+
+    def excerpt(self, lines: int) -> List[str]:
+        # [-0:] would be the whole tail
+        if lines <= 0:
+            return []
+        if len(self._tail) >= lines:
+            return list(self._tail)[-lines:]
+        with open(self.path, encoding="utf-8") as file:
+            return list(collections.deque(file, maxlen=lines))
+
+
+def log_filename(file_name: str, prog_name: str) -> str:
+    return f"{file_name}-{prog_name}.log".replace(os.sep, "_")
+
+
+def dump_object_logs(
+    veristat: str,
+    objects_dir: str,
+    file_name: str,
+    prog_names: List[str],
+    output_dir: str,
+    max_log_size: int,
+    excerpt_lines: int,
+) -> List[Tuple[str, str, List[str]]]:
+    """
+    Run veristat once for all `prog_names` of `file_name`, returning
+    (file_name, prog_name, excerpt) of every log found in the output.
+    """
+    command = [veristat, "-v", os.path.join(objects_dir, file_name)]
+    for prog_name in prog_names:
+        command += ["-f", prog_name]
+
+    logs: List[Tuple[str, ProgramLog]] = []
+
+    with subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        encoding="utf-8",
+        errors="replace",
+    ) as process:
+        for line in process.stdout:
+            if RESULTS_TABLE_RE.match(line):
+                # Drain the rest, veristat would block on a full pipe
+                for _ in process.stdout:
+                    pass
+                break
+            matches = PROCESSING_LINE_RE.match(line)
+            if matches:
+                if logs:
+                    logs[-1][1].close()
+                prog_name = matches.group("prog_name")
+                path = os.path.join(output_dir, log_filename(file_name, prog_name))
+                logs.append((prog_name, ProgramLog(path, max_log_size)))
+            if logs:
+                logs[-1][1].write(line)
+    if logs:
+        logs[-1][1].close()
+
+    return [
+        (file_name, prog_name, log.excerpt(excerpt_lines)) for prog_name, log in logs
+    ]
+
+
+def read_programs(progs_filename: str) -> List[Tuple[str, str]]:
+    programs = []
+    with open(progs_filename, encoding="utf-8") as file:
+        for line in file:
+            file_name, _, prog_name = line.strip().partition(",")
+            if file_name and prog_name:
+                programs.append((file_name, prog_name))
+    return programs
+
+
+def main(args: argparse.Namespace) -> int:
+    programs = read_programs(args.progs_file)
+    if len(programs) > args.max_logs:
+        print(
+            f"{len(programs)} programs failed, dumping logs of the first "
+            f"{args.max_logs} only"
+        )
+        programs = programs[: args.max_logs]
+
+    by_file: Dict[str, List[str]] = {}
+    for file_name, prog_name in programs:
+        by_file.setdefault(file_name, []).append(prog_name)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [
+            pool.submit(
+                dump_object_logs,
+                args.veristat,
+                args.objects_dir,
+                file_name,
+                prog_names,
+                args.output_dir,
+                args.max_log_size,
+                args.excerpt_lines,
+            )
+            for file_name, prog_names in by_file.items()
+        ]
+        # Print in submission order, so the output does not depend on timing
+        for future in futures:
+            for file_name, prog_name, excerpt in future.result():
+                if args.excerpt_lines <= 0:
+                    continue
+                print(f"VERIFIER LOG EXCERPT FOR {file_name}/{prog_name}:")
+                print(SEPARATOR)
+                sys.stdout.writelines(excerpt)
+                print(SEPARATOR)
+
+    if args.archive:
+        with tarfile.open(args.archive, "w:gz") as archive:
+            archive.add(args.output_dir, arcname=os.path.basename(args.output_dir))
+        print(f"Full verifier logs are in {args.archive}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Dump veristat verifier logs for a list of programs"
+    )
+    parser.add_argument("progs_file", help="File with 'file_name,prog_name' lines")
+    parser.add_argument("--veristat", default="veristat", help="veristat binary")
+    parser.add_argument("--objects-dir", default=os.getcwd())
+    parser.add_argument("--output-dir", default="veristat-logs")
+    parser.add_argument("--archive", help="Pack the output dir into this .tar.gz")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS)
+    parser.add_argument(
+        "--max-log-size",
+        type=int,
+        default=DEFAULT_MAX_LOG_SIZE,
+        help="Maximum size of a single log in bytes",
+    )
+    parser.add_argument(
+        "--max-logs",
+        type=int,
+        default=DEFAULT_MAX_LOGS,
+        help="Maximum number of program logs to dump",
+    )
+    parser.add_argument(
+        "--excerpt-lines",
+        type=int,
+        default=DEFAULT_EXCERPT_LINES,
+        help="Number of trailing lines of each log to print, 0 for none",
+    )
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+
+# Tracks test_progs results across CI runs in a local SQLite database to
+# find flaky tests, and writes the lists needed to deal with them.
+#
+# Usage:
+#
+#   flaky_tests.py --db flakes.db ingest \
+#       --run 12345678-1 --arch x86_64 --flavor gcc-test_progs summary.json
+#
+#   flaky_tests.py --db flakes.db rates --days 30 --min-runs 10
+#
+#   flaky_tests.py retry-list summary.json --output /tmp/retry-allowlist
+#
+#   flaky_tests.py --db flakes.db propose --days 30 \
+#       --denylist ci/vmtest/configs/DENYLIST --expire-days 30
+#
+#   flaky_tests.py expired ci/vmtest/configs/DENYLIST*
+#
+# Summaries are the JSON written by `test_progs -J`. Every test and subtest
+# of a run is stored as passed or failed, with the run's arch and flavor
+# (e.g. toolchain and test_progs variant), so the flake rate of a subtest is
+# its failure share among the runs of one arch and flavor that ran it. Only
+# tests that both passed and failed in the window count as flaky, a test
+# failing every run is broken rather than flaky.
+#
+# retry-list needs no database: it writes an allowlist with only the failed
+# subtests of one summary, or the failed test when no subtest failed, so a
+# retry runs just those.
+#
+# propose prints DENYLIST entries for flaky tests with their evidence and an
+# "expires" date in the comment, grouped by the DENYLIST file they belong
+# in: DENYLIST.<arch> when only one arch is flaky. expired lists the entries
+# whose date has passed.
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Final, Iterable, List, Optional, Tuple
+
+DAY_S: Final[int] = 24 * 60 * 60
+EXPIRES_RE: Final[re.Pattern] = re.compile(r"expires (\d{4}-\d{2}-\d{2})")
+
+SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_key TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    flavor TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    UNIQUE (run_key, arch, flavor)
+);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY,
+    test TEXT NOT NULL,
+    subtest TEXT NOT NULL,
+    UNIQUE (test, subtest)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    test_id INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    PRIMARY KEY (run_id, test_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_test ON results (test_id, run_id);
+"""
+
+
+def connect(db_filename: os.PathLike) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_filename)
+    # The database is carried between runs as a single file, e.g. in the
+    # Actions cache or an artifact, a WAL file next to it would be left behind
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def test_results(summary: Dict[str, Any]) -> List[Tuple[str, str, bool]]:
+    """
+    (test, subtest, failed) of every test and subtest of a test_progs JSON
+    summary, with an empty subtest for the test itself. Skipped ones are left
+    out.
+    """
+    results = []
+    for test in summary.get("results", []):
+        if test.get("skipped"):
+            continue
+        results.append((test["name"], "", bool(test.get("failed"))))
+        for subtest in test.get("subtests", []):
+            if not subtest.get("skipped"):
+                results.append(
+                    (test["name"], subtest["name"], bool(subtest.get("failed")))
+                )
+    return results
+
+
+def ingest(
+    conn: sqlite3.Connection,
+    summary: Dict[str, Any],
+    run_key: str,
+    arch: str,
+    flavor: str,
+    created_at: Optional[int] = None,
+) -> int:
+    """
+    Store the results of a summary. Ingesting the same run, arch and flavor
+    again replaces them. Returns the number of stored results.
+    """
+    results = test_results(summary)
+    with conn:
+        conn.execute(
+            "DELETE FROM results WHERE run_id IN "
+            "(SELECT id FROM runs WHERE run_key = ? AND arch = ? AND flavor = ?)",
+            (run_key, arch, flavor),
+        )
+        conn.execute(
+            "DELETE FROM runs WHERE run_key = ? AND arch = ? AND flavor = ?",
+            (run_key, arch, flavor),
+        )
+        run_id = conn.execute(
+            "INSERT INTO runs (run_key, arch, flavor, created_at) VALUES (?, ?, ?, ?)",
+            (run_key, arch, flavor, created_at or int(time.time())),
+        ).lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO tests (test, subtest) VALUES (?, ?)",
+            ((test, subtest) for test, subtest, _ in results),
+        )
+        test_ids = {
+            (test, subtest): test_id
+            for test_id, test, subtest in conn.execute(
+                "SELECT id, test, subtest FROM tests"
+            )
+        }
+        conn.executemany(
+            "INSERT OR REPLACE INTO results (run_id, test_id, failed) VALUES (?, ?, ?)",
+            (
+                (run_id, test_ids[(test, subtest)], failed)
+                for test, subtest, failed in results
+            ),
+        )
+    return len(results)
+
+
+@dataclass
+class FlakeRate:
+    test: str
+    subtest: str
+    arch: str
+    flavor: str
+    runs: int
+    failures: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.test}/{self.subtest}" if self.subtest else self.test
+
+    @property
+    def rate(self) -> float:
+        return self.failures / self.runs
+
+
+def flake_rates(
+    conn: sqlite3.Connection,
+    since: int,
+    min_runs: int = 1,
+) -> List[FlakeRate]:
+    """
+    Tests and subtests that both passed and failed in runs created at or
+    after `since`, per arch and flavor, flakiest first.
+    """
+    rows = conn.execute(
+        """
+        SELECT t.test, t.subtest, r.arch, r.flavor,
+               COUNT(*) AS runs, SUM(res.failed) AS failures
+        FROM results AS res
+        JOIN runs AS r ON r.id = res.run_id
+        JOIN tests AS t ON t.id = res.test_id
+        WHERE r.created_at >= ?
+        GROUP BY res.test_id, r.arch, r.flavor
+        HAVING runs >= ? AND failures > 0 AND failures < runs
+        """,
+        (since, min_runs),
+    )
+    rates = [FlakeRate(*row) for row in rows]
+    rates.sort(key=lambda flake: (-flake.rate, flake.name, flake.arch, flake.flavor))
+    return rates
+
+
+def retry_list(summary: Dict[str, Any]) -> List[str]:
+    """Allowlist entries rerunning only what failed in a summary."""
+    entries = []
+    for test in summary.get("results", []):
+        if not test.get("failed"):
+            continue
+        failed = [
+            subtest["name"]
+            for subtest in test.get("subtests", [])
+            if subtest.get("failed")
+        ]
+        if failed:
+            entries += [f"{test['name']}/{subtest}" for subtest in failed]
+        else:
+            entries.append(test["name"])
+    return entries
+
+
+def denied_patterns(filenames: Iterable[str]) -> set:
+    patterns = set()
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            continue
+        with open(filename, encoding="utf-8") as file:
+            for line in file:
+                pattern = line.split("#", 1)[0].strip()
+                if pattern:
+                    patterns.add(pattern)
+    return patterns
+
+
+def format_date(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(
+        "%Y-%m-%d"
+    )
+
+
+def propose_denylist(
+    rates: List[FlakeRate],
+    denied: set,
+    min_rate: float,
+    since: int,
+    expires_at: int,
+) -> Dict[str, List[str]]:
+    """
+    DENYLIST lines for the flaky tests at or above `min_rate`, keyed by the
+    DENYLIST file they belong in. A test is left out when one of its subtests
+    is flaky, as the subtest explains its failures.
+    """
+    subtest_tests = {flake.test for flake in rates if flake.subtest}
+    flaky: Dict[str, List[FlakeRate]] = {}
+    for flake in rates:
+        if flake.rate < min_rate or flake.name in denied:
+            continue
+        if not flake.subtest and flake.test in subtest_tests:
+            continue
+        flaky.setdefault(flake.name, []).append(flake)
+
+    proposals: Dict[str, List[str]] = {}
+    for name, flakes in sorted(flaky.items()):
+        arches = {flake.arch for flake in flakes}
+        target = f"DENYLIST.{arches.pop()}" if len(arches) == 1 else "DENYLIST"
+        evidence = ", ".join(
+            f"{flake.failures}/{flake.runs} on {flake.arch}/{flake.flavor}"
+            for flake in flakes
+        )
+        proposals.setdefault(target, []).append(
+            f"{name}  # flaky: failed {evidence} since {format_date(since)}; "
+            f"expires {format_date(expires_at)}"
+        )
+    return proposals
+
+
+def expired_entries(
+    lines: Iterable[str], source: str, now: float
+) -> List[Tuple[str, int, str]]:
+    """(source, lineno, line) of entries whose "expires" date has passed."""
+    today = format_date(now)
+    expired = []
+    for lineno, line in enumerate(lines, start=1):
+        match = EXPIRES_RE.search(line.partition("#")[2])
+        if match and match.group(1) < today:
+            expired.append((source, lineno, line.rstrip("\n")))
+    return expired
+
+
+def read_summary(filename: str) -> Dict[str, Any]:
+    with open(filename, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main(args: argparse.Namespace) -> int:
+    now = time.time()
+
+    if args.command == "retry-list":
+        entries = retry_list(read_summary(args.summary))
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.writelines(f"{entry}\n" for entry in entries)
+        print(f"{len(entries)} failed tests and subtests to retry")
+        return 0
+
+    if args.command == "expired":
+        expired = []
+        for filename in args.denylist:
+            with open(filename, encoding="utf-8") as file:
+                expired += expired_entries(file, filename, now)
+        for source, lineno, line in expired:
+            print(f"{source}:{lineno}: {line}")
+        return 1 if expired and args.fail else 0
+
+    if not args.db:
+        print(f"--db is required for {args.command}", file=sys.stderr)
+        return 2
+    conn = connect(args.db)
+    try:
+        return run_command(conn, args, now)
+    finally:
+        conn.close()
+
+
+def run_command(conn: sqlite3.Connection, args: argparse.Namespace, now: float) -> int:
+    if args.command == "ingest":
+        count = ingest(
+            conn, read_summary(args.summary), args.run, args.arch, args.flavor
+        )
+        print(f"Stored {count} results of {args.run} on {args.arch}/{args.flavor}")
+    elif args.command == "rates":
+        since = int(now - args.days * DAY_S)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["test", "arch", "flavor", "runs", "failures", "rate"])
+        for flake in flake_rates(conn, since, args.min_runs):
+            writer.writerow(
+                [
+                    flake.name,
+                    flake.arch,
+                    flake.flavor,
+                    flake.runs,
+                    flake.failures,
+                    f"{flake.rate:.3f}",
+                ]
+            )
+    elif args.command == "propose":
+        since = int(now - args.days * DAY_S)
+        proposals = propose_denylist(
+            flake_rates(conn, since, args.min_runs),
+            denied_patterns(args.denylist or []),
+            args.min_rate,
+            since,
+            int(now + args.expire_days * DAY_S),
+        )
+        for target, lines in sorted(proposals.items()):
+            print(f"# {target}")
+            print("\n".join(lines))
+            print()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find flaky selftests and write retry lists and DENYLIST entries"
+    )
+    parser.add_argument("--db", help="SQLite database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Store the results of a test_progs JSON summary"
+    )
+    ingest_parser.add_argument("summary", help="test_progs -J output")
+    ingest_parser.add_argument(
+        "--run", required=True, help="Unique run key, e.g. run id and attempt"
+    )
+    ingest_parser.add_argument("--arch", required=True)
+    ingest_parser.add_argument(
+        "--flavor", required=True, help="e.g. toolchain and test, gcc-test_progs"
+    )
+
+    rates_parser = subparsers.add_parser("rates", help="Flake rates as CSV")
+    rates_parser.add_argument("--days", type=float, default=30)
+    rates_parser.add_argument("--min-runs", type=int, default=10)
+
+    retry_parser = subparsers.add_parser(
+        "retry-list", help="Allowlist of the failed subtests of a summary"
+    )
+    retry_parser.add_argument("summary", help="test_progs -J output")
+    retry_parser.add_argument("--output", required=True)
+
+    propose_parser = subparsers.add_parser(
+        "propose", help="DENYLIST entries for flaky tests"
+    )
+    propose_parser.add_argument("--days", type=float, default=30)
+    propose_parser.add_argument("--min-runs", type=int, default=10)
+    propose_parser.add_argument("--min-rate", type=float, default=0.02)
+    propose_parser.add_argument("--expire-days", type=float, default=30)
+    propose_parser.add_argument(
+        "--denylist",
+        action="append",
+        help="Existing DENYLIST file whose entries are not proposed again",
+    )
+
+    expired_parser = subparsers.add_parser(
+        "expired", help="DENYLIST entries past their expires date"
+    )
+    expired_parser.add_argument("denylist", nargs="+")
+    expired_parser.add_argument(
+        "--fail", action="store_true", help="Exit with 1 if any entry expired"
+    )
+
+    sys.exit(main(parser.parse_args()))
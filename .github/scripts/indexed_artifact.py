@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+
+# Repacks a kernel build artifact (vmlinux-*.tar.zst) into independent zstd
+# frames with a member index, so a job can extract only the files it needs
+# instead of decompressing the whole kernel, selftests and sched_ext build.
+#
+# Usage:
+#
+#   indexed_artifact.py pack --in-place vmlinux-x86_64-gcc.tar.zst
+#   indexed_artifact.py list vmlinux-x86_64-gcc.tar.zst
+#   indexed_artifact.py extract vmlinux-x86_64-gcc.tar.zst \
+#       vmlinuz 'selftests/bpf/test_progs*' 'selftests/bpf/*.bpf.o'
+#   indexed_artifact.py extract vmlinux-x86_64-gcc.tar.zst \
+#       --exclude selftests/sched_ext
+#
+# The packed file stays a plain .tar.zst: the frames hold consecutive
+# members of the original tar, with the end of archive blocks only in the
+# last one, so `zstd -d --stdout | tar -xf -` still extracts everything.
+# Members are never split across frames, and a frame is cut once it holds
+# FRAME_SIZE bytes of tar data, so large files like vmlinux get a frame of
+# their own. A frame also never mixes members of different top-level
+# directories or of different directories right below them, so excluding
+# e.g. selftests/sched_ext skips whole frames.
+#
+# The index is stored in a zstd skippable frame at the end of the file,
+# which decompressors ignore. It is zlib-compressed JSON with the offset
+# and size of every frame and the frame of every member, and ends with a
+# fixed size footer (payload size and INDEX_TAG) to find it from the end.
+#
+# Patterns are fnmatch patterns on member names, a pattern also selects
+# everything under a matching directory. extract falls back to extracting
+# the whole archive with tar when it has no index or selective extraction
+# fails, and reports the compressed and tar bytes it read and the time it
+# took against the whole archive. Each run of selected frames is streamed
+# from the file through `zstd -d` into tar, it is never held in memory.
+
+import argparse
+import fnmatch
+import json
+import os
+import struct
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import IO, Dict, Final, Iterator, List, Optional, Tuple
+
+FRAME_SIZE: Final[int] = 8 * 1024 * 1024
+# Directory levels a frame never crosses, 2 keeps selftests/bpf and
+# selftests/sched_ext apart
+FRAME_DIR_DEPTH: Final[int] = 2
+COPY_CHUNK: Final[int] = 1024 * 1024
+ZSTD_LEVEL: Final[int] = 3
+# Last of the zstd skippable frame magic numbers 0x184D2A50..0x184D2A5F
+SKIPPABLE_MAGIC: Final[int] = 0x184D2A5F
+INDEX_TAG: Final[bytes] = b"KPIDX001"
+FOOTER: Final[struct.Struct] = struct.Struct("<I8s")
+SKIPPABLE_HEADER: Final[struct.Struct] = struct.Struct("<II")
+INDEX_VERSION: Final[int] = 1
+
+# Kinds of members in the index, directories, symlinks and the like are OTHER
+REGULAR: Final[str] = "file"
+HARDLINK: Final[str] = "link"
+OTHER: Final[str] = "other"
+
+
+@dataclass
+class Frame:
+    offset: int
+    size: int
+    raw_size: int
+
+
+@dataclass
+class Member:
+    name: str
+    frame: int
+    size: int
+    kind: str
+    linkname: str = ""
+
+
+@dataclass
+class Index:
+    frames: List[Frame]
+    members: List[Member]
+
+    @property
+    def size(self) -> int:
+        return sum(frame.size for frame in self.frames)
+
+    @property
+    def raw_size(self) -> int:
+        return sum(frame.raw_size for frame in self.frames)
+
+    def to_bytes(self) -> bytes:
+        data = {
+            "version": INDEX_VERSION,
+            "frames": [[f.offset, f.size, f.raw_size] for f in self.frames],
+            "members": [
+                [m.name, m.frame, m.size, m.kind, m.linkname] for m in self.members
+            ],
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "Index":
+        data = json.loads(zlib.decompress(payload))
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {data.get('version')}")
+        return cls(
+            [Frame(*frame) for frame in data["frames"]],
+            [Member(*member) for member in data["members"]],
+        )
+
+
+def zstd_compress(data: bytes) -> bytes:
+    return subprocess.run(
+        ["zstd", "-q", "-c", f"-{ZSTD_LEVEL}", "-T0"],
+        input=data,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+
+
+def member_kind(info: tarfile.TarInfo) -> str:
+    if info.isreg():
+        return REGULAR
+    if info.islnk():
+        return HARDLINK
+    return OTHER
+
+
+def tar_records(archive: str) -> Iterator[Tuple[tarfile.TarInfo, bytes]]:
+    """Members of a .tar.zst with their tar header and data blocks."""
+    proc = subprocess.Popen(
+        ["zstd", "-q", "-d", "-c", "-T0", archive], stdout=subprocess.PIPE
+    )
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            for info in tar:
+                record = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+                if info.isreg():
+                    data = tar.extractfile(info).read()
+                    padding = -len(data) % tarfile.BLOCKSIZE
+                    record += data + tarfile.NUL * padding
+                yield info, record
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"zstd failed to decompress {archive}")
+
+
+def frame_dir(info: tarfile.TarInfo) -> Tuple[str, ...]:
+    """The directory a member belongs to, up to FRAME_DIR_DEPTH levels."""
+    parts = normalize(info.name).split("/")
+    if not info.isdir():
+        parts = parts[:-1]
+    return tuple(parts[:FRAME_DIR_DEPTH])
+
+
+def pack(archive: str, output: str) -> Index:
+    """Write the members of `archive` to `output` as indexed frames."""
+    frames: List[Frame] = []
+    members: List[Member] = []
+    pending: List[bytes] = []
+    pending_size = 0
+    pending_dir: Optional[Tuple[str, ...]] = None
+
+    with open(output, "wb") as out:
+
+        def flush(last: bool = False) -> None:
+            nonlocal pending, pending_size
+            if last:
+                # End of archive marker, once for the whole tar
+                pending.append(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+            raw = b"".join(pending)
+            compressed = zstd_compress(raw)
+            frames.append(Frame(out.tell(), len(compressed), len(raw)))
+            out.write(compressed)
+            pending, pending_size = [], 0
+
+        for info, record in tar_records(archive):
+            directory = frame_dir(info)
+            if pending and (pending_size >= FRAME_SIZE or directory != pending_dir):
+                flush()
+            pending_dir = directory
+            members.append(
+                Member(
+                    info.name,
+                    len(frames),
+                    info.size if info.isreg() else 0,
+                    member_kind(info),
+                    info.linkname if info.islnk() else "",
+                )
+            )
+            pending.append(record)
+            pending_size += len(record)
+        flush(last=True)
+
+        index = Index(frames, members)
+        payload = index.to_bytes()
+        payload += FOOTER.pack(len(payload), INDEX_TAG)
+        out.write(SKIPPABLE_HEADER.pack(SKIPPABLE_MAGIC, len(payload)))
+        out.write(payload)
+    return index
+
+
+def read_index(file: IO[bytes]) -> Optional[Index]:
+    """The index at the end of `file`, None for a plain .tar.zst."""
+    file.seek(0, os.SEEK_END)
+    end = file.tell()
+    if end < SKIPPABLE_HEADER.size + FOOTER.size:
+        return None
+    file.seek(end - FOOTER.size)
+    size, tag = FOOTER.unpack(file.read(FOOTER.size))
+    if tag != INDEX_TAG or size > end - FOOTER.size:
+        return None
+    file.seek(end - FOOTER.size - size)
+    return Index.from_bytes(file.read(size))
+
+
+def normalize(name: str) -> str:
+    """Member names and patterns with or without a leading ./ are the same."""
+    while name.startswith("./"):
+        name = name[2:]
+    return name.rstrip("/")
+
+
+def matches(name: str, patterns: List[str]) -> bool:
+    name = normalize(name)
+    for pattern in patterns:
+        pattern = normalize(pattern)
+        if fnmatch.fnmatchcase(name, pattern):
+            return True
+        # Everything under a matching directory
+        parts = name.split("/")
+        for depth in range(1, len(parts)):
+            if fnmatch.fnmatchcase("/".join(parts[:depth]), pattern):
+                return True
+    return False
+
+
+def select_members(
+    index: Index, patterns: List[str], excludes: List[str]
+) -> List[Member]:
+    """
+    Members matching any of `patterns` (all of them without patterns) and
+    none of `excludes`, with the targets of selected hard links.
+    """
+    selected = [
+        member
+        for member in index.members
+        if (not patterns or matches(member.name, patterns))
+        and not matches(member.name, excludes)
+    ]
+    names = {member.name for member in selected}
+    by_name = {member.name: member for member in index.members}
+    targets = [
+        by_name[member.linkname]
+        for member in selected
+        if member.kind == HARDLINK
+        and member.linkname in by_name
+        and member.linkname not in names
+    ]
+    return sorted(selected + targets, key=lambda member: member.frame)
+
+
+def frame_runs(frames: List[int]) -> List[Tuple[int, int]]:
+    """Sorted frame numbers as (first, last) runs of consecutive frames."""
+    runs: List[Tuple[int, int]] = []
+    for frame in sorted(set(frames)):
+        if runs and runs[-1][1] == frame - 1:
+            runs[-1] = (runs[-1][0], frame)
+        else:
+            runs.append((frame, frame))
+    return runs
+
+
+def extraction_filter() -> Dict[str, str]:
+    # Python 3.12 warns when extracting without a filter, the artifact is
+    # ours and gets the same trust as with tar
+    return {"filter": "fully_trusted"} if hasattr(tarfile, "data_filter") else {}
+
+
+@dataclass
+class ExtractStats:
+    members: int
+    total_members: int
+    read_bytes: int
+    total_bytes: int
+    raw_bytes: int
+    total_raw_bytes: int
+    seconds: float
+    indexed: bool
+
+    def describe(self) -> str:
+        if not self.indexed:
+            return (
+                f"No usable index, extracted the whole archive "
+                f"({self.total_bytes} bytes) in {self.seconds:.1f}s"
+            )
+        # Decompression and tar extraction time grow with the tar bytes
+        full = self.seconds * self.total_raw_bytes / max(self.raw_bytes, 1)
+        return (
+            f"Extracted {self.members} of {self.total_members} members: "
+            f"read {self.read_bytes} of {self.total_bytes} compressed bytes "
+            f"({self.total_bytes - self.read_bytes} saved), "
+            f"{self.raw_bytes} of {self.total_raw_bytes} tar bytes, "
+            f"in {self.seconds:.1f}s (about {full - self.seconds:.1f}s saved)"
+        )
+
+
+def copy_range(file: IO[bytes], start: int, size: int, out: IO[bytes]) -> None:
+    """Write `size` bytes of `file` from `start` to `out`, then close it."""
+    try:
+        file.seek(start)
+        while size > 0:
+            chunk = file.read(min(size, COPY_CHUNK))
+            if not chunk:
+                break
+            out.write(chunk)
+            size -= len(chunk)
+    except BrokenPipeError:
+        # zstd failed, its exit status reports it
+        pass
+    finally:
+        try:
+            out.close()
+        except BrokenPipeError:
+            pass
+
+
+def extract_selected(
+    file: IO[bytes], index: Index, selected: List[Member], directory: str
+) -> Tuple[int, int]:
+    """Extract `selected` frame run by frame run, returns bytes read."""
+    wanted = {member.name for member in selected}
+    read_bytes = raw_bytes = 0
+    for first, last in frame_runs([member.frame for member in selected]):
+        start = index.frames[first].offset
+        end = index.frames[last].offset + index.frames[last].size
+        read_bytes += end - start
+        raw_bytes += sum(f.raw_size for f in index.frames[first : last + 1])
+
+        zstd = subprocess.Popen(
+            ["zstd", "-q", "-d", "-c"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        writer = threading.Thread(
+            target=copy_range, args=(file, start, end - start, zstd.stdin)
+        )
+        writer.start()
+        try:
+            # A run of frames is a tar without its end of archive marker
+            with tarfile.open(fileobj=zstd.stdout, mode="r|") as tar:
+                for info in tar:
+                    if info.name in wanted:
+                        tar.extract(info, directory, **extraction_filter())
+        finally:
+            zstd.stdout.close()
+            writer.join()
+            returncode = zstd.wait()
+        if returncode != 0:
+            raise RuntimeError(f"zstd failed to decompress frames {first}-{last}")
+    return read_bytes, raw_bytes
+
+
+def extract_all(archive: str, directory: str, excludes: List[str]) -> None:
+    """The extraction jobs did before artifacts had an index."""
+    zstd = subprocess.Popen(
+        ["zstd", "-d", "-T0", archive, "--stdout"], stdout=subprocess.PIPE
+    )
+    tar = subprocess.run(
+        ["tar", "-xf", "-", "-C", directory]
+        + [f"--exclude={pattern}" for pattern in excludes],
+        stdin=zstd.stdout,
+    )
+    zstd.stdout.close()
+    if zstd.wait() != 0 or tar.returncode != 0:
+        raise RuntimeError(f"Failed to extract {archive}")
+
+
+def extract(
+    archive: str,
+    patterns: List[str],
+    excludes: List[str],
+    directory: str = ".",
+) -> ExtractStats:
+    start = time.monotonic()
+    with open(archive, "rb") as file:
+        total_bytes = os.fstat(file.fileno()).st_size
+        try:
+            index = read_index(file)
+        except (ValueError, zlib.error) as e:
+            print(f"Warning: ignoring the index of {archive}: {e}")
+            index = None
+
+        if index is not None:
+            selected = select_members(index, patterns, excludes)
+            try:
+                read_bytes, raw_bytes = extract_selected(
+                    file, index, selected, directory
+                )
+                return ExtractStats(
+                    len(selected),
+                    len(index.members),
+                    read_bytes,
+                    index.size,
+                    raw_bytes,
+                    index.raw_size,
+                    time.monotonic() - start,
+                    indexed=True,
+                )
+            except (
+                OSError,
+                RuntimeError,
+                subprocess.CalledProcessError,
+                tarfile.TarError,
+            ) as e:
+                print(f"Warning: selective extraction failed, extracting all: {e}")
+
+    extract_all(archive, directory, excludes)
+    return ExtractStats(
+        0, 0, total_bytes, total_bytes, 0, 0, time.monotonic() - start, indexed=False
+    )
+
+
+def main(args: argparse.Namespace) -> int:
+    if args.command == "pack":
+        output = args.output or (args.archive + ".tmp" if args.in_place else None)
+        if output is None:
+            print("pack needs --output or --in-place", file=sys.stderr)
+            return 2
+        index = pack(args.archive, output)
+        if args.in_place:
+            os.replace(output, args.archive)
+        print(
+            f"Packed {len(index.members)} members into {len(index.frames)} frames, "
+            f"{index.size} bytes"
+        )
+    elif args.command == "list":
+        with open(args.archive, "rb") as file:
+            index = read_index(file)
+        if index is None:
+            print(f"{args.archive} has no index", file=sys.stderr)
+            return 1
+        for member in index.members:
+            print(f"{member.frame:6} {member.size:12} {member.name}")
+    elif args.command == "extract":
+        os.makedirs(args.directory, exist_ok=True)
+        stats = extract(args.archive, args.patterns, args.exclude or [], args.directory)
+        print(stats.describe())
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pack and partially extract indexed .tar.zst build artifacts"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Repack a .tar.zst with an index")
+    pack_parser.add_argument("archive")
+    pack_parser.add_argument("--output")
+    pack_parser.add_argument("--in-place", action="store_true")
+
+    list_parser = subparsers.add_parser("list", help="List the indexed members")
+    list_parser.add_argument("archive")
+
+    extract_parser = subparsers.add_parser(
+        "extract", help="Extract matching members, all of them without patterns"
+    )
+    extract_parser.add_argument("archive")
+    extract_parser.add_argument("patterns", nargs="*")
+    extract_parser.add_argument(
+        "--exclude", action="append", help="Skip matching members, repeatable"
+    )
+    extract_parser.add_argument("--directory", "-C", default=".")
+
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Collects the durations of past CI jobs from the GitHub Actions API into the
+# history files matrix.py reads.
+#
+# Usage:
+#
+#   job_history.py --workflow test.yml --days 14 \
+#       --job-durations job-durations.json --test-durations test-durations.csv
+#
+# Jobs are read from the latest completed runs of the workflow on the
+# repository's branches (GITHUB_REPOSITORY) created within --days, at most
+# --max-runs of them. Only jobs that succeeded count, a failed or cancelled
+# job stopped before doing all of its work.
+#
+# Job names are the ones test.yml gives its reusable workflows, e.g.
+#
+#   x86_64 gcc-15 / build / build kernel and selftests
+#   x86_64 gcc-15 / test (test_progs, false, 360) / test_progs on x86_64 with gcc-15
+#
+# --job-durations writes the median build and test job minutes per arch
+# as JOB_DURATIONS_FILE for the build placement of matrix.py, e.g.
+# {"build": {"x86_64": 24.5}, "test": {"x86_64": 18.0}}. Release (-O2)
+# builds and test shards are left out: they are not what the placement
+# model estimates.
+#
+# --test-durations writes the minutes of every test job as
+# TEST_DURATIONS_FILE for the adaptive timeouts of matrix.py, one
+# "test,arch,toolchain,minutes" line per job, e.g.
+# "test_maps,x86_64,gcc,4.5".
+
+import argparse
+import concurrent.futures
+import csv
+import dataclasses
+import json
+import math
+import os
+import re
+import statistics
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Final, List, Optional, TextIO
+
+import requests
+import requests.adapters
+
+DEFAULT_GITHUB_API_URL: Final[str] = "https://api.github.com"
+PER_PAGE: Final[int] = 100
+FETCH_WORKERS: Final[int] = 8
+DEFAULT_DAYS: Final[int] = 14
+DEFAULT_MAX_RUNS: Final[int] = 30
+
+BUILD: Final[str] = "build"
+TEST: Final[str] = "test"
+
+# First segment of a job name: "<arch> <toolchain>-<version>"
+CONFIG_RE: Final[re.Pattern] = re.compile(r"^(?P<arch>\w+) (?P<toolchain>[a-z]+)-")
+BUILD_JOB_RE: Final[re.Pattern] = re.compile(r"^build kernel and selftests\s*$")
+TEST_JOB_RE: Final[re.Pattern] = re.compile(
+    r"^(?P<test>\S+)(?P<shard> \([^)]*\))? on (?P<arch>\w+) with (?P<toolchain>[a-z]+)"
+)
+
+
+@dataclasses.dataclass
+class JobRecord:
+    kind: str
+    arch: str
+    toolchain: str
+    minutes: float
+    # The test run by a test job, empty for builds
+    test: str = ""
+
+
+def parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def parse_job(job: Dict[str, Any]) -> Optional[JobRecord]:
+    """The record of a successful build or unsharded test job, else None."""
+    if job.get("conclusion") != "success":
+        return None
+    if not job.get("started_at") or not job.get("completed_at"):
+        return None
+    segments = job.get("name", "").split(" / ")
+    config = CONFIG_RE.match(segments[0])
+    if len(segments) < 2 or not config:
+        return None
+    minutes = (
+        parse_time(job["completed_at"]) - parse_time(job["started_at"])
+    ).total_seconds() / 60
+
+    if BUILD_JOB_RE.match(segments[-1]):
+        return JobRecord(BUILD, config["arch"], config["toolchain"], minutes)
+    test = TEST_JOB_RE.match(segments[-1])
+    if test and not test["shard"]:
+        return JobRecord(
+            TEST, test["arch"], test["toolchain"], minutes, test=test["test"]
+        )
+    return None
+
+
+def job_durations(records: List[JobRecord]) -> Dict[str, Dict[str, float]]:
+    """Median build and test job minutes per arch, as JOB_DURATIONS_FILE."""
+    minutes: Dict[str, Dict[str, List[float]]] = {BUILD: {}, TEST: {}}
+    for record in records:
+        minutes[record.kind].setdefault(record.arch, []).append(record.minutes)
+    return {
+        kind: {
+            arch: round(statistics.median(values), 1)
+            for arch, values in sorted(by_arch.items())
+        }
+        for kind, by_arch in minutes.items()
+    }
+
+
+def write_test_durations(records: List[JobRecord], file: TextIO) -> None:
+    """Test job minutes as TEST_DURATIONS_FILE lines."""
+    writer = csv.writer(file, lineterminator="\n")
+    writer.writerow(["test", "arch", "toolchain", "minutes"])
+    for record in records:
+        if record.kind == TEST:
+            writer.writerow(
+                [record.test, record.arch, record.toolchain, f"{record.minutes:.1f}"]
+            )
+
+
+class GitHubClient:
+    def __init__(self, repo: str, token: str, api_url: str):
+        self.repo = repo
+        self.api_url = api_url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=FETCH_WORKERS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+        }
+
+    def get(self, endpoint: str) -> Dict[str, Any]:
+        response = self.session.get(
+            f"{self.api_url}/repos/{self.repo}{endpoint}", headers=self.headers
+        )
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to query {endpoint}: {response.status_code}\n"
+                f"response: {response.text}"
+            )
+        return response.json()
+
+    def run_ids(self, workflow: str, since: datetime, max_runs: int) -> List[int]:
+        data = self.get(
+            f"/actions/workflows/{workflow}/runs?status=completed"
+            f"&created=>={since.strftime('%Y-%m-%d')}"
+            f"&per_page={min(max_runs, PER_PAGE)}"
+        )
+        return [run["id"] for run in data.get("workflow_runs", [])][:max_runs]
+
+    def jobs(self, run_id: int) -> List[Dict[str, Any]]:
+        def page(number: int) -> Dict[str, Any]:
+            return self.get(
+                f"/actions/runs/{run_id}/jobs?per_page={PER_PAGE}&page={number}"
+            )
+
+        first = page(1)
+        jobs = list(first.get("jobs", []))
+        pages = math.ceil(first.get("total_count", 0) / PER_PAGE)
+        for number in range(2, pages + 1):
+            jobs += page(number).get("jobs", [])
+        return jobs
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def collect(
+    client: GitHubClient, workflow: str, since: datetime, max_runs: int
+) -> List[JobRecord]:
+    """Records of the jobs of the latest runs, fetched concurrently."""
+    run_ids = client.run_ids(workflow, since, max_runs)
+    records = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        for jobs in pool.map(client.jobs, run_ids):
+            records += filter(None, map(parse_job, jobs))
+    print(f"{len(records)} job durations from {len(run_ids)} runs of {workflow}")
+    return records
+
+
+def main(args: argparse.Namespace) -> int:
+    client = GitHubClient(
+        os.environ["GITHUB_REPOSITORY"],
+        os.environ.get("GITHUB_TOKEN", ""),
+        os.environ.get("GITHUB_API_URL", DEFAULT_GITHUB_API_URL),
+    )
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+    try:
+        records = collect(client, args.workflow, since, args.max_runs)
+    finally:
+        client.close()
+    if not records:
+        print("No job durations found, leaving the history files alone")
+        return 1
+
+    if args.job_durations:
+        durations = job_durations(records)
+        with open(args.job_durations, "w", encoding="utf-8") as file:
+            json.dump(durations, file, indent=2)
+        print(f"Job durations: {json.dumps(durations)}")
+    if args.test_durations:
+        with open(args.test_durations, "w", newline="", encoding="utf-8") as file:
+            write_test_durations(records, file)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Collect past CI job durations for matrix.py"
+    )
+    parser.add_argument("--workflow", default="test.yml", help="Workflow file name")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--max-runs", type=int, default=DEFAULT_MAX_RUNS)
+    parser.add_argument(
+        "--job-durations", help="Write JOB_DURATIONS_FILE for the build placement"
+    )
+    parser.add_argument(
+        "--test-durations", help="Write TEST_DURATIONS_FILE for the test timeouts"
+    )
+    sys.exit(main(parser.parse_args()))
@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 
+import argparse
+import concurrent.futures
+import csv
 import dataclasses
+import heapq
+import itertools
 import json
+import math
 import os
+import re
 
 from enum import Enum
-from typing import Any, Dict, Final, List, Optional, Set, Union
+from typing import Any, Dict, Final, List, Optional, Sequence, Set, Tuple, Union
 
 import requests
-import requests.utils
+import requests.adapters
 
 MANAGED_OWNER: Final[str] = "kernel-patches"
 MANAGED_REPOS: Final[Set[str]] = {
@@ -23,6 +30,52 @@ DEFAULT_LLVM_VERSION: Final[int] = 21
 
 RUNNERS_BUSY_THRESHOLD: Final[float] = 0.8
 
+DEFAULT_GITHUB_API_URL: Final[str] = "https://api.github.com"
+RUNNERS_PER_PAGE: Final[int] = 100
+RUNNERS_FETCH_WORKERS: Final[int] = 8
+
+# Build placement model, see place_builds(). Durations are in minutes and
+# can be replaced by historical values from JOB_DURATIONS_FILE, a JSON file
+# like {"build": {"x86_64": 25}, "test": {"x86_64": 20}}, written by
+# job_history.py in the set-matrix job of test.yml.
+CODEBUILD_STARTUP_MINUTES: Final[float] = 3.0
+MAX_PLACEMENT_CHOICES: Final[int] = 10
+
+# Test flavors that can be split into shards by allowlist, see shard_tests().
+# Per-test durations in seconds come from TEST_TIMINGS_FILE, a JSON file like
+# {"x86_64": {"verifier_basic": 12.5, ...}}. Without timings no sharding.
+# Sharding is opt-in: CI records no per-test durations, job_history.py
+# only sees whole jobs, so test.yml does not set TEST_TIMINGS_FILE and
+# every flavor runs as one job.
+SHARDABLE_TESTS: Final[Set[str]] = {
+    "test_progs",
+    "test_progs_no_alu32",
+    "test_progs_cpuv4",
+}
+MAX_TEST_SHARDS: Final[int] = 4
+# Don't split flavors into shards shorter than this
+MIN_SHARD_SECONDS: Final[float] = 300.0
+# Jobs a repository outside of MANAGED_REPOS can run at once on GitHub runners
+GITHUB_HOSTED_CONCURRENCY: Final[int] = 20
+
+# Test job timeouts, see adaptive_timeout(). Past run durations come from
+# TEST_DURATIONS_FILE, a CSV with "test,arch,toolchain,minutes" lines where
+# toolchain is the kernel compiler, e.g. "test_maps,x86_64,gcc,4.5", written
+# by job_history.py in the set-matrix job of test.yml.
+DEFAULT_TIMEOUT_MINUTES: Final[int] = 360
+PARALLEL_TIMEOUT_MINUTES: Final[int] = 30
+TIMEOUT_PERCENTILE: Final[float] = 99.0
+TIMEOUT_SAFETY_FACTOR: Final[float] = 2.0
+TIMEOUT_FLOOR_MINUTES: Final[int] = 10
+# Fewer runs than this are not enough to trust the percentile
+MIN_TIMEOUT_SAMPLES: Final[int] = 10
+
+# Change-aware pruning of the matrix for pull requests, see select_matrix()
+DEFAULT_MATRIX_RULES_FILE: Final[str] = "ci/vmtest/configs/matrix-rules.json"
+VERISTAT_WORKFLOWS: Final[List[str]] = ["kernel", "meta", "scx", "cilium"]
+# The pull request files API lists at most this many files
+MAX_PR_FILES: Final[int] = 3000
+
 
 class Arch(str, Enum):
     """
@@ -39,6 +92,39 @@ class Compiler(str, Enum):
     LLVM = "llvm"
 
 
+def github_api_url() -> str:
+    return os.environ.get("GITHUB_API_URL", DEFAULT_GITHUB_API_URL)
+
+
+github_session_cached: Optional[requests.Session] = None
+
+
+def github_session() -> requests.Session:
+    """Session with a connection pool large enough for concurrent fetches."""
+    global github_session_cached
+    if github_session_cached is None:
+        github_session_cached = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=RUNNERS_FETCH_WORKERS)
+        github_session_cached.mount("https://", adapter)
+        github_session_cached.mount("http://", adapter)
+    return github_session_cached
+
+
+def fetch_runners_page(
+    session: requests.Session,
+    url: str,
+    headers: Dict[str, str],
+) -> Dict[str, Any]:
+    response = session.get(url, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Failed to query runners: {response.status_code}\n"
+            f"response: {response.text}"
+        )
+
+    return response.json()
+
+
 def query_runners_from_github() -> List[Dict[str, Any]]:
     if "GITHUB_TOKEN" not in os.environ:
         return []
@@ -48,26 +134,29 @@ def query_runners_from_github() -> List[Dict[str, Any]]:
         "Accept": "application/vnd.github.v3+json",
     }
     owner = os.environ["GITHUB_REPOSITORY_OWNER"]
-    url: Optional[str] = f"https://api.github.com/orgs/{owner}/actions/runners"
-    # GitHub returns 30 runners per page, fetch all
-    all_runners = []
+    base_url = f"{github_api_url()}/orgs/{owner}/actions/runners"
+
+    def page_url(page: int) -> str:
+        return f"{base_url}?per_page={RUNNERS_PER_PAGE}&page={page}"
+
+    # The first page tells the total, the remaining pages are then fetched
+    # concurrently over the pooled session. There is no cache across runs:
+    # Actions caches are scoped to the ref, so a pull request run only sees
+    # those of earlier runs of the same pull request and of its base branch,
+    # and runner states saved there are too old for If-None-Match to match.
     try:
-        while url is not None:
-            response = requests.get(url, headers=headers)
-            if response.status_code != 200:
-                print(f"Failed to query runners: {response.status_code}")
-                print(f"response: {response.text}")
-                return []
-            data = response.json()
-            all_runners.extend(data.get("runners", []))
-            # Check for next page URL in Link header
-            url = None
-            if "Link" in response.headers:
-                links = requests.utils.parse_header_links(response.headers["Link"])
-                for link in links:
-                    if link["rel"] == "next":
-                        url = link["url"]
-                        break
+        session = github_session()
+        first = fetch_runners_page(session, page_url(1), headers)
+        all_runners = list(first.get("runners", []))
+        pages = math.ceil(first.get("total_count", 0) / RUNNERS_PER_PAGE)
+        if pages > 1:
+            workers = min(RUNNERS_FETCH_WORKERS, pages - 1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                for data in pool.map(
+                    lambda page: fetch_runners_page(session, page_url(page), headers),
+                    range(2, pages + 1),
+                ):
+                    all_runners.extend(data.get("runners", []))
         return all_runners
     except Exception as e:
         print(f"Warning: Failed to query runner status due to exception: {e}")
@@ -125,6 +214,448 @@ def count_by_status(runners: List[Dict[str, Any]]) -> Dict[str, int]:
     return result
 
 
+@dataclasses.dataclass
+class JobDurations:
+    """Expected build and test job durations in minutes, per arch."""
+
+    build: Dict[str, float] = dataclasses.field(
+        default_factory=lambda: {
+            Arch.X86_64.value: 25.0,
+            Arch.AARCH64.value: 35.0,
+            Arch.S390X.value: 35.0,
+        }
+    )
+    test: Dict[str, float] = dataclasses.field(
+        default_factory=lambda: {
+            Arch.X86_64.value: 20.0,
+            Arch.AARCH64.value: 30.0,
+            Arch.S390X.value: 40.0,
+        }
+    )
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "JobDurations":
+        durations = cls()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            durations.build.update(data.get("build", {}))
+            durations.test.update(data.get("test", {}))
+        return durations
+
+
+@dataclasses.dataclass
+class PoolSnapshot:
+    """State of the self-hosted runners of one arch at a point in time."""
+
+    online: int = 0
+    busy: int = 0
+    queued: int = 0
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, int]) -> "PoolSnapshot":
+        return cls(**{k: data[k] for k in ("online", "busy", "queued") if k in data})
+
+
+def snapshot_from_runners() -> Dict[Arch, PoolSnapshot]:
+    snapshot = {}
+    for arch in Arch:
+        counts = count_by_status(runners_by_arch(arch))
+        snapshot[arch] = PoolSnapshot(
+            online=counts["idle"] + counts["busy"], busy=counts["busy"]
+        )
+    return snapshot
+
+
+class RunnerPool:
+    """
+    Self-hosted runners of one arch as a heap of the times (in minutes from
+    now) at which each runner becomes free. Busy runners are assumed to be
+    half way through a job, queued jobs are served first.
+
+    Without online runners the capacity of the pool is unknown, e.g. the
+    runners are being replaced, and its jobs are assumed to start as soon
+    as they are ready: such a pool must not make every placement look
+    equally bad.
+    """
+
+    def __init__(self, snapshot: PoolSnapshot, job_minutes: float) -> None:
+        idle = max(snapshot.online - snapshot.busy, 0)
+        self.free_at = [0.0] * idle + [job_minutes / 2] * min(
+            snapshot.busy, snapshot.online
+        )
+        heapq.heapify(self.free_at)
+        for _ in range(snapshot.queued):
+            self.run(0.0, job_minutes)
+
+    def run(self, ready: float, minutes: float) -> float:
+        if not self.free_at:
+            return ready + minutes
+        start = max(ready, heapq.heappop(self.free_at))
+        heapq.heappush(self.free_at, start + minutes)
+        return start + minutes
+
+
+def test_job_minutes(
+    durations: JobDurations, arch: Arch, test_config: Dict[str, Any]
+) -> float:
+    """Expected minutes of a test job, shards split the duration of their test."""
+    minutes = durations.test[arch.value]
+    if "shard" in test_config:
+        minutes /= int(test_config["shard"].rpartition("-of-")[2])
+    return minutes
+
+
+def estimate_completions(
+    configs: Sequence["BuildConfig"],
+    on_codebuild: Sequence[bool],
+    snapshot: Dict[Arch, PoolSnapshot],
+    durations: JobDurations,
+) -> List[float]:
+    """
+    Minutes until each build and test job of the matrix is done, with builds
+    placed as given and every job started on the first free runner.
+    """
+    pools = {
+        arch: RunnerPool(snapshot.get(arch, PoolSnapshot()), durations.test[arch.value])
+        for arch in Arch
+    }
+
+    build_done = []
+    for config, codebuild in zip(configs, on_codebuild):
+        minutes = durations.build[config.arch.value]
+        if codebuild:
+            build_done.append(CODEBUILD_STARTUP_MINUTES + minutes)
+        else:
+            # Cross-compilation jobs run on x86_64, see BuildConfig.build_runs_on
+            build_done.append(pools[Arch.X86_64].run(0.0, minutes))
+
+    completions = list(build_done)
+    tests = sorted(
+        (done, idx, config.arch, test_job_minutes(durations, config.arch, test))
+        for idx, (config, done) in enumerate(zip(configs, build_done))
+        for test in config.tests["include"]
+    )
+    for done, _, arch, minutes in tests:
+        completions.append(pools[arch].run(done, minutes))
+    return completions
+
+
+def estimate_makespan(
+    configs: Sequence["BuildConfig"],
+    on_codebuild: Sequence[bool],
+    snapshot: Dict[Arch, PoolSnapshot],
+    durations: JobDurations,
+) -> float:
+    """Minutes until the last build and test job of the matrix is done."""
+    return max(
+        estimate_completions(configs, on_codebuild, snapshot, durations),
+        default=0.0,
+    )
+
+
+def place_builds(
+    configs: Sequence["BuildConfig"],
+    snapshot: Dict[Arch, PoolSnapshot],
+    durations: JobDurations,
+) -> List[bool]:
+    """
+    Decide which builds go to codebuild, minimizing the summed completion
+    time of all jobs of the matrix. The longest aarch64 and s390x tests
+    decide the wall-clock time of the whole matrix whatever the x86_64
+    builds do, the sum still sees every job done earlier. Only native
+    x86_64 builds may go to codebuild. On equal estimates the shorter
+    matrix, then fewer codebuild jobs win.
+    """
+    choices = [idx for idx, config in enumerate(configs) if config.arch == Arch.X86_64][
+        :MAX_PLACEMENT_CHOICES
+    ]
+
+    best: Optional[tuple] = None
+    for assignment in itertools.product([False, True], repeat=len(choices)):
+        on_codebuild = [False] * len(configs)
+        for idx, codebuild in zip(choices, assignment):
+            on_codebuild[idx] = codebuild
+        completions = estimate_completions(configs, on_codebuild, snapshot, durations)
+        key = (sum(completions), max(completions, default=0.0), sum(on_codebuild))
+        if best is None or key < best[0]:
+            best = (key, on_codebuild)
+
+    return best[1] if best else [False] * len(configs)
+
+
+def threshold_placement(
+    configs: Sequence["BuildConfig"], snapshot: Dict[Arch, PoolSnapshot]
+) -> List[bool]:
+    """The former single busy-ratio rule, kept for comparison."""
+    placement = []
+    for config in configs:
+        pool = snapshot.get(config.arch, PoolSnapshot())
+        placement.append(
+            config.arch == Arch.X86_64
+            and pool.online > 0
+            and pool.busy / pool.online > RUNNERS_BUSY_THRESHOLD
+        )
+    return placement
+
+
+def load_run_durations(path: Optional[str]) -> Dict[Tuple[str, str, str], List[float]]:
+    """Past run durations in minutes, keyed by (test, arch, toolchain)."""
+    durations: Dict[Tuple[str, str, str], List[float]] = {}
+    if not path or not os.path.exists(path):
+        return durations
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.reader(file):
+            try:
+                test, arch, toolchain, minutes = row
+                value = float(minutes)
+            except ValueError:
+                # Header or malformed line
+                continue
+            durations.setdefault((test, arch, toolchain), []).append(value)
+    return durations
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(rank - 1, 0)]
+
+
+def adaptive_timeout(durations: List[float], default: int) -> int:
+    """
+    Timeout in minutes of a test job from its past run durations: a high
+    percentile times a safety factor, between TIMEOUT_FLOOR_MINUTES and
+    `default`. Falls back to `default` without enough history.
+    """
+    if len(durations) < MIN_TIMEOUT_SAMPLES:
+        return default
+    timeout = math.ceil(
+        percentile(durations, TIMEOUT_PERCENTILE) * TIMEOUT_SAFETY_FACTOR
+    )
+    return max(TIMEOUT_FLOOR_MINUTES, min(timeout, default))
+
+
+def load_test_timings(path: Optional[str]) -> Dict[str, Dict[str, float]]:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def lpt_shards(timings: Dict[str, float], shards: int) -> List[List[str]]:
+    """
+    Split tests into `shards` bins of similar total duration: the longest
+    test goes first, always into the least loaded bin.
+    """
+    bins: List[List[str]] = [[] for _ in range(shards)]
+    loads = [(0.0, idx) for idx in range(shards)]
+    for name, seconds in sorted(timings.items(), key=lambda item: (-item[1], item[0])):
+        load, idx = heapq.heappop(loads)
+        bins[idx].append(name)
+        heapq.heappush(loads, (load + seconds, idx))
+    return [sorted(tests) for tests in bins]
+
+
+def choose_test_shards(timings: Dict[str, float], flavors: int, capacity: int) -> int:
+    """
+    Number of shards per flavor, so that all shards of all flavors fit on
+    the available runners at once and none of them is too short to pay for
+    its VM boot.
+    """
+    if not timings or flavors <= 0:
+        return 1
+    by_capacity = capacity // flavors
+    by_duration = int(sum(timings.values()) // MIN_SHARD_SECONDS)
+    return max(1, min(MAX_TEST_SHARDS, by_capacity, by_duration))
+
+
+def shard_tests(
+    test_config: Dict[str, Any], timings: Dict[str, float], shards: int
+) -> List[Dict[str, Any]]:
+    """
+    Copies of `test_config` for `shards` shards of its test. All shards but the shortest
+    one run an allowlist, the shortest one runs everything else, so tests
+    missing from the timings are still run.
+    """
+    bins = lpt_shards(timings, shards)
+    rest = min(range(shards), key=lambda idx: sum(timings[name] for name in bins[idx]))
+
+    configs = []
+    for idx, tests in enumerate(bins):
+        config = dict(test_config)
+        config["shard"] = f"{idx + 1}-of-{shards}"
+        if idx == rest:
+            config["denylist"] = sorted(
+                name
+                for other, names in enumerate(bins)
+                if other != rest
+                for name in names
+            )
+        else:
+            config["allowlist"] = tests
+        configs.append(config)
+    return configs
+
+
+def fetch_pr_changed_paths(pr_number: str) -> Optional[List[str]]:
+    """
+    Paths changed by a pull request, None if they can't all be listed.
+    """
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if "GITHUB_TOKEN" in os.environ:
+        headers["Authorization"] = f"token {os.environ['GITHUB_TOKEN']}"
+    base_url = (
+        f"{github_api_url()}/repos/{os.environ['GITHUB_REPOSITORY']}"
+        f"/pulls/{pr_number}/files"
+    )
+
+    paths: List[str] = []
+    try:
+        session = github_session()
+        for page in range(1, MAX_PR_FILES // RUNNERS_PER_PAGE + 1):
+            response = session.get(
+                f"{base_url}?per_page={RUNNERS_PER_PAGE}&page={page}",
+                headers=headers,
+            )
+            response.raise_for_status()
+            files = response.json()
+            for file in files:
+                paths.append(file["filename"])
+                # Renames touch the old path too
+                if "previous_filename" in file:
+                    paths.append(file["previous_filename"])
+            if len(files) < RUNNERS_PER_PAGE:
+                return paths
+    except Exception as e:
+        print(f"Warning: Failed to list pull request files due to exception: {e}")
+        return None
+
+    # Anything beyond MAX_PR_FILES is not listed by GitHub
+    return None
+
+
+def read_changed_paths(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def load_matrix_rules(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["rules"]
+
+
+@dataclasses.dataclass
+class MatrixSelection:
+    """
+    What a change needs. None means everything along that dimension.
+    """
+
+    arches: Optional[Set[str]] = None
+    tests: Optional[Set[str]] = None
+    veristat: Optional[Set[str]] = None
+    reasons: List[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def run_all(self) -> bool:
+        return self.arches is None and self.tests is None and self.veristat is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        def dump(values: Optional[Set[str]]) -> Union[str, List[str]]:
+            return "all" if values is None else sorted(values)
+
+        return {
+            "pruned": not self.run_all,
+            "arches": dump(self.arches),
+            "tests": dump(self.tests),
+            "veristat": dump(self.veristat),
+            "reasons": self.reasons,
+        }
+
+
+def path_glob_re(glob: str) -> re.Pattern:
+    """
+    A path glob anchored at the tree root: "*" and "?" stay within one path
+    component, "**" spans any number of them, e.g. "Documentation/**".
+    """
+    parts = []
+    for token in re.split(r"(\*\*|\*|\?)", glob):
+        if token == "**":
+            parts.append(".*")
+        elif token == "*":
+            parts.append("[^/]*")
+        elif token == "?":
+            parts.append("[^/]")
+        else:
+            parts.append(re.escape(token))
+    return re.compile("".join(parts) + r"\Z")
+
+
+def select_matrix(
+    paths: Optional[List[str]], rules: List[Dict[str, Any]]
+) -> MatrixSelection:
+    """
+    Union of the needs of the rules matching each changed path. A rule has
+    "paths" globs, see path_glob_re(), and "arches", "tests" and "veristat"
+    lists, or "all" for any of them. A path matching no rule, like a core kernel file, needs
+    the whole matrix, and so does an unknown set of changed paths.
+    """
+    if paths is None:
+        return MatrixSelection(reasons=["changed paths unknown"])
+    if not paths:
+        return MatrixSelection(reasons=["no changed paths"])
+
+    selection = MatrixSelection(arches=set(), tests=set(), veristat=set())
+    globs = [[path_glob_re(glob) for glob in rule["paths"]] for rule in rules]
+
+    def merge(current: Optional[Set[str]], needed: Union[str, List[str]]):
+        if current is None or needed == "all":
+            return None
+        return current | set(needed)
+
+    for path in paths:
+        matched = [
+            rule
+            for rule, rule_globs in zip(rules, globs)
+            if any(glob.match(path) for glob in rule_globs)
+        ]
+        if not matched:
+            return MatrixSelection(reasons=[f"{path} matches no rule"])
+        for rule in matched:
+            selection.arches = merge(selection.arches, rule.get("arches", []))
+            selection.tests = merge(selection.tests, rule.get("tests", []))
+            selection.veristat = merge(selection.veristat, rule.get("veristat", []))
+            reason = f"{path}: {rule['name']}"
+            if reason not in selection.reasons:
+                selection.reasons.append(reason)
+    return selection
+
+
+def apply_selection(
+    matrix: List["BuildConfig"], selection: MatrixSelection
+) -> List["BuildConfig"]:
+    """
+    Drop the build configs, tests and veristat workflows a change does not
+    need. The first config is kept if no arch is needed, so the change is
+    still built once.
+    """
+    if selection.arches is not None:
+        selected = [c for c in matrix if c.arch.value in selection.arches]
+        matrix = selected or matrix[:1]
+    for config in matrix:
+        if selection.tests is not None:
+            config.selected_tests = set(selection.tests)
+        if selection.veristat is not None:
+            config.veristat_workflows = [
+                name for name in VERISTAT_WORKFLOWS if name in selection.veristat
+            ]
+            config.run_veristat = config.run_veristat and bool(
+                config.veristat_workflows
+            )
+    return matrix
+
+
 @dataclasses.dataclass
 class BuildConfig:
     arch: Arch
@@ -136,6 +667,18 @@ class BuildConfig:
     parallel_tests: bool = False
     build_release: bool = False
     is_netdev: bool = False
+    # Set by place_builds(), None falls back to the busy ratio threshold
+    build_on_codebuild: Optional[bool] = None
+    # Per-test durations in seconds, used to shard SHARDABLE_TESTS
+    test_timings: Dict[str, float] = dataclasses.field(default_factory=dict)
+    test_shards: int = 1
+    # Past run durations in minutes per test, used for test timeouts
+    run_durations: Dict[str, List[float]] = dataclasses.field(default_factory=dict)
+    # Set by apply_selection(), None runs all tests
+    selected_tests: Optional[Set[str]] = None
+    veristat_workflows: List[str] = dataclasses.field(
+        default_factory=lambda: list(VERISTAT_WORKFLOWS)
+    )
 
     @property
     def runs_on(self) -> List[str]:
@@ -156,6 +699,11 @@ class BuildConfig:
             case Arch.AARCH64:
                 return DEFAULT_SELF_HOSTED_RUNNER_TAGS + [Arch.X86_64.value]
 
+        if self.build_on_codebuild is not None:
+            if self.build_on_codebuild:
+                return ["codebuild"]
+            return DEFAULT_SELF_HOSTED_RUNNER_TAGS + [self.arch.value]
+
         # For managed repos, check the busyness of relevant self-hosted runners
         # If they are too busy, use codebuild
         runner_arch = self.arch
@@ -191,7 +739,17 @@ class BuildConfig:
         if not self.parallel_tests:
             tests_list = [test for test in tests_list if not test.endswith("parallel")]
 
-        return {"include": [generate_test_config(test) for test in tests_list]}
+        if self.selected_tests is not None:
+            tests_list = [test for test in tests_list if test in self.selected_tests]
+
+        include = []
+        for test in tests_list:
+            config = generate_test_config(test, self.run_durations.get(test, []))
+            if test in SHARDABLE_TESTS and self.test_shards > 1 and self.test_timings:
+                include += shard_tests(config, self.test_timings, self.test_shards)
+            else:
+                include.append(config)
+        return {"include": include}
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -206,6 +764,8 @@ class BuildConfig:
             "is_netdev": self.is_netdev,
             "runs_on": self.runs_on,
             "tests": self.tests,
+            "run_tests": bool(self.tests["include"]),
+            "veristat_workflows": self.veristat_workflows,
             "build_runs_on": self.build_runs_on,
         }
 
@@ -223,8 +783,13 @@ def set_output(name, value):
         file.write(f"{name}={value}\n")
 
 
-def generate_test_config(test: str) -> Dict[str, Union[str, int]]:
-    """Create the configuration for the provided test."""
+def generate_test_config(
+    test: str, durations: Optional[List[float]] = None
+) -> Dict[str, Any]:
+    """
+    Create the configuration for the provided test, with a timeout derived
+    from its past run `durations` in minutes when there are enough of them.
+    """
     is_parallel = test.endswith("_parallel")
     config = {
         "test": test,
@@ -238,13 +803,16 @@ def generate_test_config(test: str) -> Dict[str, Union[str, int]]:
         # non-experimental jobs, 360 is the default which will be
         # superseded by the overall workflow timeout (but we need to
         # specify something).
-        "timeout_minutes": 30 if is_parallel else 360,
+        "timeout_minutes": adaptive_timeout(
+            durations or [],
+            PARALLEL_TIMEOUT_MINUTES if is_parallel else DEFAULT_TIMEOUT_MINUTES,
+        ),
     }
     return config
 
 
-if __name__ == "__main__":
-    matrix = [
+def default_matrix() -> List[BuildConfig]:
+    return [
         BuildConfig(
             arch=Arch.X86_64,
             run_veristat=True,
@@ -263,6 +831,55 @@ if __name__ == "__main__":
         ),
     ]
 
+
+def simulate(snapshots_filename: str, durations: JobDurations) -> None:
+    """
+    Replay recorded runner snapshots, a JSON list of objects like
+    {"x86_64": {"online": 10, "busy": 8, "queued": 3}, ...}, through the
+    predictive and the threshold placement of the default matrix.
+    """
+    with open(snapshots_filename, encoding="utf-8") as file:
+        snapshots = json.load(file)
+
+    configs = default_matrix()
+    print("snapshot,policy,codebuild_builds,estimated_minutes,job_minutes")
+    for idx, recorded in enumerate(snapshots):
+        snapshot = {
+            Arch(arch): PoolSnapshot.from_dict(pool) for arch, pool in recorded.items()
+        }
+        policies = {
+            "predictive": place_builds(configs, snapshot, durations),
+            "threshold": threshold_placement(configs, snapshot),
+        }
+        for policy, placement in policies.items():
+            completions = estimate_completions(configs, placement, snapshot, durations)
+            print(
+                f"{idx},{policy},{sum(placement)},{max(completions):.1f},"
+                f"{sum(completions):.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the CI build matrix")
+    parser.add_argument(
+        "--simulate",
+        metavar="SNAPSHOTS",
+        help="Replay recorded runner snapshots through the placement policies",
+    )
+    parser.add_argument(
+        "--changed-files",
+        help="File listing the paths changed by a pull request, one per line, "
+        "e.g. from `git diff --name-only BASE...HEAD`",
+    )
+    args = parser.parse_args()
+    durations = JobDurations.load(os.environ.get("JOB_DURATIONS_FILE"))
+
+    if args.simulate:
+        simulate(args.simulate, durations)
+        raise SystemExit(0)
+
+    matrix = default_matrix()
+
     # Outside of managed repositories only run on x86_64
     if not is_managed_repo():
         matrix = [config for config in matrix if config.arch == Arch.X86_64]
@@ -278,6 +895,57 @@ if __name__ == "__main__":
             config.build_release = False
             config.is_netdev = True
 
+    # Prune the matrix to what a pull request needs
+    pr_number = os.environ.get("PR_NUMBER", "")
+    if args.changed_files or pr_number:
+        if args.changed_files:
+            changed_paths = read_changed_paths(args.changed_files)
+        else:
+            changed_paths = fetch_pr_changed_paths(pr_number)
+        rules_file = os.environ.get("MATRIX_RULES_FILE", DEFAULT_MATRIX_RULES_FILE)
+        selection = select_matrix(changed_paths, load_matrix_rules(rules_file))
+        matrix = apply_selection(matrix, selection)
+        print("Matrix selection: " + json.dumps(selection.to_dict(), indent=4))
+        set_output("matrix_selection", json.dumps(selection.to_dict()))
+
+    run_durations = load_run_durations(os.environ.get("TEST_DURATIONS_FILE"))
+    for config in matrix:
+        for (test, arch, toolchain), minutes in run_durations.items():
+            if arch == config.arch.value and toolchain == config.kernel_compiler.value:
+                config.run_durations[test] = minutes
+
+    test_timings = load_test_timings(os.environ.get("TEST_TIMINGS_FILE"))
+    for config in matrix:
+        config.test_timings = test_timings.get(config.arch.value, {})
+        if not config.test_timings:
+            continue
+        if is_managed_repo():
+            # Configs of the same arch share its runners
+            same_arch = sum(other.arch == config.arch for other in matrix)
+            counts = count_by_status(runners_by_arch(config.arch))
+            capacity = counts["idle"] // same_arch
+        else:
+            capacity = GITHUB_HOSTED_CONCURRENCY // len(matrix)
+        flavors = sum(
+            test["test"] in SHARDABLE_TESTS for test in config.tests["include"]
+        )
+        config.test_shards = choose_test_shards(config.test_timings, flavors, capacity)
+        print(
+            f"{config.arch.value}: {config.test_shards} shard(s) per test_progs flavor"
+        )
+
+    # After sharding, which changes the test jobs of the configs
+    if is_managed_repo():
+        snapshot = snapshot_from_runners()
+        # Without runner data there is nothing to predict from, keep builds
+        # on self-hosted runners as the threshold rule would.
+        if snapshot[Arch.X86_64].online > 0:
+            placement = place_builds(matrix, snapshot, durations)
+            for config, codebuild in zip(matrix, placement):
+                config.build_on_codebuild = codebuild
+            estimate = estimate_makespan(matrix, placement, snapshot, durations)
+            print(f"Estimated matrix wall-clock time: {estimate:.0f} minutes")
+
     json_matrix = json.dumps({"include": [config.to_dict() for config in matrix]})
     print(json.dumps(json.loads(json_matrix), indent=4))
     set_output("build_matrix", json_matrix)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+# Merges selftests ALLOWLIST and DENYLIST files into one list each, and
+# compiles them into a matcher deciding whether a test or subtest runs.
+#
+# List files have one "test" or "test/subtest" entry per line, optionally
+# with a trailing "#" comment, and may use "*" globs as test_progs does.
+# Missing files are skipped, so the pipe-separated lists exported by
+# ci/vmtest/configs/run-vmtest.env can be passed as they are:
+#
+#   merge_test_lists.py \
+#       --allow "$SELFTESTS_BPF_ALLOWLIST_FILES" \
+#       --deny "$SELFTESTS_BPF_DENYLIST_FILES" \
+#       --merged-allowlist /tmp/allowlist --merged-denylist /tmp/denylist \
+#       --matcher /tmp/test-lists.json \
+#       --inventory tests.txt
+#
+# Precedence follows test_progs: with any allow entry only allowed tests
+# run, and a deny entry always wins over an allow entry. Allow entries made
+# useless by a deny entry are dropped from the merged allowlist.
+#
+# The matcher is a trie keyed on the test name, then the subtest name, so a
+# lookup costs two dict lookups plus the few glob entries of a level. It is
+# written as JSON for other tools to load with TestListMatcher.load().
+#
+# With --inventory, a file listing the known tests and subtests one per line
+# ("test" or "test/subtest", e.g. from `test_progs --list`), entries that
+# match nothing in it are reported as dead.
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Final, Iterable, List, Optional, Tuple
+
+LIST_SEPARATOR: Final[str] = "|"
+
+
+@dataclass
+class ListEntry:
+    pattern: str
+    source: str
+    lineno: int
+
+    @property
+    def test(self) -> str:
+        return self.pattern.partition("/")[0]
+
+    @property
+    def subtest(self) -> Optional[str]:
+        test, sep, subtest = self.pattern.partition("/")
+        return subtest if sep else None
+
+    def describe(self) -> str:
+        return f"{self.source}:{self.lineno}: {self.pattern}"
+
+
+def parse_list(lines: Iterable[str], source: str) -> List[ListEntry]:
+    entries = []
+    for lineno, line in enumerate(lines, start=1):
+        pattern = line.split("#", 1)[0].strip()
+        if pattern:
+            entries.append(ListEntry(pattern, source, lineno))
+    return entries
+
+
+def read_lists(filenames: Iterable[str]) -> List[ListEntry]:
+    """Entries of all existing files."""
+    entries = []
+    for filename in filenames:
+        if not filename or not os.path.isfile(filename):
+            continue
+        with open(filename, encoding="utf-8") as file:
+            entries += parse_list(file, filename)
+    return entries
+
+
+def unique_entries(entries: Iterable[ListEntry]) -> List[ListEntry]:
+    """The first occurrence of each pattern."""
+    unique: Dict[str, ListEntry] = {}
+    for entry in entries:
+        unique.setdefault(entry.pattern, entry)
+    return list(unique.values())
+
+
+def split_files(values: Optional[List[str]]) -> List[str]:
+    return [name for value in values or [] for name in value.split(LIST_SEPARATOR)]
+
+
+def is_glob(pattern: str) -> bool:
+    return any(char in pattern for char in "*?[")
+
+
+class TrieLevel:
+    """Exact names of one level in a dict, glob patterns on the side."""
+
+    def __init__(self) -> None:
+        self.exact: Dict[str, Dict[str, Any]] = {}
+        self.globs: Dict[str, Dict[str, Any]] = {}
+
+    def node(self, name: str) -> Dict[str, Any]:
+        nodes = self.globs if is_glob(name) else self.exact
+        return nodes.setdefault(name, {})
+
+    def matches(self, name: str) -> Iterable[Dict[str, Any]]:
+        if name in self.exact:
+            yield self.exact[name]
+        for pattern, node in self.globs.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                yield node
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"exact": self.exact, "globs": self.globs}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TrieLevel":
+        level = cls()
+        level.exact = data["exact"]
+        level.globs = data["globs"]
+        return level
+
+
+class TestListMatcher:
+    """
+    Decides if a test or subtest runs under merged allow and deny lists.
+    Test nodes carry "allow"/"deny" flags for whole-test entries and a
+    "subtests" level for "test/subtest" entries.
+    """
+
+    def __init__(self) -> None:
+        self.tests = TrieLevel()
+        self.has_allowlist = False
+
+    def add(self, entry: ListEntry, kind: str) -> None:
+        node = self.tests.node(entry.test)
+        if entry.subtest is None:
+            node[kind] = True
+            return
+        subtests = node.setdefault("subtests", {"exact": {}, "globs": {}})
+        level = TrieLevel.from_dict(subtests)
+        level.node(entry.subtest)[kind] = True
+        if kind == "allow":
+            # A test with an allowed subtest has to run at all
+            node["allow_some"] = True
+
+    def _flags(self, test: str, subtest: Optional[str]) -> Tuple[bool, bool, bool]:
+        allowed = denied = allow_some = False
+        for node in self.tests.matches(test):
+            allowed |= node.get("allow", False)
+            denied |= node.get("deny", False)
+            allow_some |= node.get("allow_some", False)
+            if subtest is None or "subtests" not in node:
+                continue
+            for sub in TrieLevel.from_dict(node["subtests"]).matches(subtest):
+                allowed |= sub.get("allow", False)
+                denied |= sub.get("deny", False)
+        return allowed, denied, allow_some
+
+    def runs(self, test: str, subtest: Optional[str] = None) -> bool:
+        allowed, denied, allow_some = self._flags(test, subtest)
+        if denied:
+            return False
+        if not self.has_allowlist:
+            return True
+        return allowed or (subtest is None and allow_some)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"has_allowlist": self.has_allowlist, "tests": self.tests.to_dict()}
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "TestListMatcher":
+        matcher = cls()
+        matcher.has_allowlist = data["has_allowlist"]
+        matcher.tests = TrieLevel.from_dict(data["tests"])
+        return matcher
+
+
+@dataclass
+class MergedLists:
+    allow: List[ListEntry]
+    deny: List[ListEntry]
+    # Allow entries dropped because a deny entry covers them
+    shadowed: List[ListEntry]
+    matcher: TestListMatcher
+
+
+def merge_lists(allow: List[ListEntry], deny: List[ListEntry]) -> MergedLists:
+    allow, deny = unique_entries(allow), unique_entries(deny)
+    matcher = TestListMatcher()
+    for entry in deny:
+        matcher.add(entry, "deny")
+
+    kept, shadowed = [], []
+    for entry in allow:
+        # Only exact entries can be shadowed for sure, a glob may still
+        # allow tests the deny entries don't cover
+        if not is_glob(entry.pattern) and not matcher.runs(entry.test, entry.subtest):
+            shadowed.append(entry)
+        else:
+            kept.append(entry)
+
+    for entry in kept:
+        matcher.add(entry, "allow")
+    matcher.has_allowlist = bool(kept)
+    return MergedLists(kept, deny, shadowed, matcher)
+
+
+def entry_matches(entry: ListEntry, name: str) -> bool:
+    test, sep, subtest = name.partition("/")
+    if not fnmatch.fnmatchcase(test, entry.test):
+        return False
+    if entry.subtest is None:
+        return True
+    return bool(sep) and fnmatch.fnmatchcase(subtest, entry.subtest)
+
+
+def dead_entries(entries: List[ListEntry], inventory: List[str]) -> List[ListEntry]:
+    """Entries matching no test or subtest of the inventory."""
+    names = set(inventory)
+    tests = {name.partition("/")[0] for name in names}
+    dead = []
+    for entry in entries:
+        if not is_glob(entry.pattern):
+            known = tests if entry.subtest is None else names
+            if entry.pattern not in known:
+                dead.append(entry)
+        elif not any(entry_matches(entry, name) for name in names):
+            dead.append(entry)
+    return dead
+
+
+def write_list(filename: str, entries: List[ListEntry]) -> None:
+    with open(filename, "w", encoding="utf-8") as file:
+        file.writelines(f"{entry.pattern}\n" for entry in entries)
+
+
+def main(args: argparse.Namespace) -> int:
+    merged = merge_lists(
+        read_lists(split_files(args.allow)), read_lists(split_files(args.deny))
+    )
+    print(
+        f"{len(merged.allow)} allow and {len(merged.deny)} deny entries, "
+        f"{len(merged.shadowed)} allow entries shadowed by deny entries"
+    )
+    for entry in merged.shadowed:
+        print(f"Shadowed: {entry.describe()}")
+
+    if args.merged_allowlist:
+        write_list(args.merged_allowlist, merged.allow)
+    if args.merged_denylist:
+        write_list(args.merged_denylist, merged.deny)
+    if args.matcher:
+        with open(args.matcher, "w", encoding="utf-8") as file:
+            json.dump(merged.matcher.to_dict(), file)
+
+    if args.inventory:
+        with open(args.inventory, encoding="utf-8") as file:
+            inventory = [line.strip() for line in file if line.strip()]
+        dead = dead_entries(merged.allow + merged.deny, inventory)
+        for entry in dead:
+            print(f"Dead: {entry.describe()}")
+        if dead and args.fail_on_dead:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge and compile selftests allow and deny lists"
+    )
+    parser.add_argument(
+        "--allow",
+        action="append",
+        help="Allowlist files, repeatable or separated by '|'",
+    )
+    parser.add_argument(
+        "--deny",
+        action="append",
+        help="Denylist files, repeatable or separated by '|'",
+    )
+    parser.add_argument("--merged-allowlist", help="Write the merged allowlist here")
+    parser.add_argument("--merged-denylist", help="Write the merged denylist here")
+    parser.add_argument("--matcher", help="Write the compiled matcher as JSON here")
+    parser.add_argument(
+        "--inventory", help="File with known 'test' and 'test/subtest' names"
+    )
+    parser.add_argument(
+        "--fail-on-dead",
+        action="store_true",
+        help="Exit with 1 if any entry matches nothing in the inventory",
+    )
+    sys.exit(main(parser.parse_args()))
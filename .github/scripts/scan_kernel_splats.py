@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+# Scans a kernel log for splats, with the SPLAT_DENYLIST and SPLAT_ALLOWLIST
+# files of ci/vmtest/configs: a line matching a denylist regex is a splat
+# unless it also matches an allowlist regex.
+#
+# Usage:
+#
+#   scan_kernel_splats.py dmesg.txt \
+#       --denylist "$SPLAT_DENYLIST_FILE" --allowlist "$SPLAT_ALLOWLIST_FILE"
+#   scan_kernel_splats.py --benchmark 4096
+#
+# Each list is compiled into a single alternation with one named group per
+# pattern, so the log is searched once for all denylist patterns, and only
+# denylist hits are tested against the allowlist. The log is mmap-ed and
+# searched as a whole rather than line by line; the extended regexes are
+# translated so that no match can cross a line boundary.
+#
+# Every splat is printed with its trace block, the lines following it up to
+# the "---[ end trace" marker or the next splat. The hit count of every
+# pattern is printed too, so allowlist entries that no longer match anything
+# stand out. Exits with 1 if any splat is found.
+#
+# --benchmark writes a synthetic log of the given size in MiB and reports
+# the scan throughput.
+
+import argparse
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Final, Iterator, List, Optional, Tuple
+
+CONTEXT_BEFORE: Final[int] = 2
+COUNT_CHUNK: Final[int] = 64 * 1024 * 1024
+MAX_TRACE_LINES: Final[int] = 60
+END_TRACE_RE: Final[re.Pattern] = re.compile(rb"---\[ end trace")
+
+# POSIX classes that Python's re does not know, as used inside brackets
+POSIX_CLASSES: Final[Dict[str, str]] = {
+    "[:alnum:]": "a-zA-Z0-9",
+    "[:alpha:]": "a-zA-Z",
+    "[:digit:]": "0-9",
+    "[:lower:]": "a-z",
+    "[:upper:]": "A-Z",
+    "[:space:]": " \\t\\r\\f\\v",
+    "[:xdigit:]": "0-9a-fA-F",
+    "[:punct:]": "!-/:-@\\x5b-`{-~",
+}
+
+
+@dataclass
+class Splat:
+    lineno: int
+    pattern: str
+    trace: List[str]
+
+
+@dataclass
+class ScanResult:
+    splats: List[Splat] = field(default_factory=list)
+    deny_hits: Dict[str, int] = field(default_factory=dict)
+    allow_hits: Dict[str, int] = field(default_factory=dict)
+    scanned_bytes: int = 0
+
+
+def read_patterns(filename: str) -> List[str]:
+    """One extended regex per line, `#` comments and blank lines ignored."""
+    with open(filename, encoding="utf-8") as file:
+        return [
+            line.rstrip("\n")
+            for line in file
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def bracket_end(pattern: str, idx: int) -> int:
+    """Index of the "]" closing the bracket expression opened at `idx`."""
+    end = idx + 1
+    if end < len(pattern) and pattern[end] == "^":
+        end += 1
+    # "]" right after "[" or "[^" is a literal
+    if end < len(pattern) and pattern[end] == "]":
+        end += 1
+    while end < len(pattern) and pattern[end] != "]":
+        if pattern.startswith("[:", end):
+            end = pattern.index(":]", end) + 2
+        else:
+            end += 1
+    return end
+
+
+def split_points(pattern: str) -> Optional[List[int]]:
+    """
+    Offsets where `pattern` can be cut into two concatenated regexes: outside
+    of groups and brackets, and not before a quantifier. None if the pattern
+    has a top-level alternation, which cutting would change.
+    """
+    points = []
+    depth = 0
+    idx = 0
+    while idx < len(pattern):
+        if depth == 0 and pattern[idx] not in "*+?{":
+            points.append(idx)
+        char = pattern[idx]
+        if char == "\\":
+            idx += 2
+            continue
+        if char == "[":
+            idx = bracket_end(pattern, idx) + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return None
+        idx += 1
+    return points
+
+
+def ere_to_python(pattern: str) -> str:
+    """
+    Translate an extended regex applied to single lines into a Python regex
+    applied to a whole log: negated brackets and \\s must not eat newlines.
+    """
+    out = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == "\\" and idx + 1 < len(pattern):
+            escape = pattern[idx : idx + 2]
+            out.append(r"[^\S\n]" if escape == r"\s" else escape)
+            idx += 2
+            continue
+        if char != "[":
+            out.append(char)
+            idx += 1
+            continue
+
+        end = bracket_end(pattern, idx)
+        negated = pattern.startswith("[^", idx)
+        body = pattern[idx + 1 : end]
+        for posix, chars in POSIX_CLASSES.items():
+            body = body.replace(posix, chars)
+        # A literal "[" inside brackets needs escaping in Python
+        body = body.replace("[", "\\[")
+        if negated:
+            body += "\\n"
+        out.append(f"[{body}]")
+        idx = end + 1
+    return "".join(out)
+
+
+def common_prefix(patterns: List[str]) -> str:
+    """The longest prefix all patterns can be cut after."""
+    prefix = os.path.commonprefix(patterns)
+    cuts = [split_points(pattern) for pattern in patterns]
+    if any(points is None for points in cuts):
+        return ""
+    common = set.intersection(*(set(points) for points in cuts))
+    return prefix[: max((cut for cut in common if cut <= len(prefix)), default=0)]
+
+
+class CompiledList:
+    """
+    Patterns compiled into one alternation with a named group per pattern.
+
+    When every pattern is anchored at the line start, the "^" is replaced by
+    a literal newline, which lets the regex engine skip ahead to the next
+    line instead of trying every offset, and the first line is matched on
+    its own. A prefix shared by all patterns, like the one eating the dmesg
+    timestamp, is matched once before the alternation.
+    """
+
+    def __init__(self, patterns: List[str], prefix: str) -> None:
+        self.patterns = patterns
+        self.anchored = all(pattern.startswith("^") for pattern in patterns)
+        if self.anchored:
+            patterns = [pattern[1:] for pattern in patterns]
+        shared = common_prefix(patterns)
+        alternation = "|".join(
+            f"(?P<{prefix}{idx}>{ere_to_python(pattern[len(shared):])})"
+            for idx, pattern in enumerate(patterns)
+        )
+        body = f"{ere_to_python(shared)}(?:{alternation})"
+        if self.anchored:
+            self.regex = re.compile(b"\\n" + body.encode())
+            self.first_line = re.compile(body.encode())
+        else:
+            self.regex = re.compile(body.encode(), re.MULTILINE)
+
+    def pattern(self, match: re.Match) -> str:
+        return self.patterns[int(match.lastgroup[1:])]
+
+    def search(self, line: bytes) -> Optional[re.Match]:
+        if self.anchored:
+            return self.first_line.match(line)
+        return self.regex.search(line)
+
+    def finditer(self, data: bytes) -> Iterator[Tuple[int, str]]:
+        """(line start offset, pattern) of every matching line."""
+        if self.anchored:
+            first_end = data.find(b"\n")
+            first_end = len(data) if first_end < 0 else first_end
+            match = self.first_line.match(data[:first_end])
+            if match:
+                yield 0, self.pattern(match)
+            for match in self.regex.finditer(data):
+                yield match.start() + 1, self.pattern(match)
+            return
+        for match in self.regex.finditer(data):
+            yield data.rfind(b"\n", 0, match.start()) + 1, self.pattern(match)
+
+
+def count_newlines(data: bytes, start: int, end: int) -> int:
+    """mmap has no count(), copy the range out in bounded chunks instead."""
+    count = 0
+    for offset in range(start, end, COUNT_CHUNK):
+        count += data[offset : min(offset + COUNT_CHUNK, end)].count(b"\n")
+    return count
+
+
+def trace_block(data: bytes, start: int, limit: int) -> List[str]:
+    """
+    Lines around the splat starting at offset `start`: a few lines before,
+    then up to the end of trace marker, and never past offset `limit`.
+    """
+    begin = start
+    for _ in range(CONTEXT_BEFORE):
+        if begin == 0:
+            break
+        begin = data.rfind(b"\n", 0, begin - 1) + 1
+
+    lines = []
+    end = begin
+    while end < limit and len(lines) < CONTEXT_BEFORE + MAX_TRACE_LINES:
+        next_end = data.find(b"\n", end)
+        next_end = len(data) if next_end < 0 else next_end + 1
+        line = data[end:next_end]
+        lines.append(line.rstrip(b"\n").decode("utf-8", "replace"))
+        end = next_end
+        if end > start and END_TRACE_RE.search(line):
+            break
+    return lines
+
+
+def scan(
+    data: bytes, deny_patterns: List[str], allow_patterns: List[str]
+) -> ScanResult:
+    result = ScanResult(
+        deny_hits={pattern: 0 for pattern in deny_patterns},
+        allow_hits={pattern: 0 for pattern in allow_patterns},
+        scanned_bytes=len(data),
+    )
+    if not deny_patterns:
+        raise ValueError("No splat denylist patterns, nothing would be checked")
+    deny = CompiledList(deny_patterns, "d")
+    allow = CompiledList(allow_patterns, "a") if allow_patterns else None
+
+    hits = []
+    for line_start, pattern in deny.finditer(data):
+        line_end = data.find(b"\n", line_start)
+        line_end = len(data) if line_end < 0 else line_end
+        result.deny_hits[pattern] += 1
+
+        allowed = allow.search(data[line_start:line_end]) if allow else None
+        if allowed:
+            result.allow_hits[allow.pattern(allowed)] += 1
+            continue
+        hits.append((line_start, pattern))
+
+    # The trace block of a splat stops where the next splat starts
+    lineno = 1
+    counted_to = 0
+    limits = [line_start for line_start, _ in hits[1:]] + [len(data)]
+    for (line_start, pattern), limit in zip(hits, limits):
+        lineno += count_newlines(data, counted_to, line_start)
+        counted_to = line_start
+        trace = trace_block(data, line_start, limit)
+        result.splats.append(Splat(lineno, pattern, trace))
+    return result
+
+
+def scan_file(
+    filename: str, deny_patterns: List[str], allow_patterns: List[str]
+) -> ScanResult:
+    with open(filename, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return scan(b"", deny_patterns, allow_patterns)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return scan(data, deny_patterns, allow_patterns)
+
+
+def synthetic_log(size: int) -> Iterator[bytes]:
+    """Chunks of a dmesg-like log of about `size` bytes, with a few splats."""
+    lines = [
+        b"[%8d.%06d] bpf_testmod: loading out-of-tree module taints kernel.\n",
+        b"[%8d.%06d] IPv6: ADDRCONF(NETDEV_CHANGE): veth0: link becomes ready\n",
+        b"[%8d.%06d] test_progs[1234]: segfault at 0 ip 0000000000401000\n",
+        b"[%8d.%06d] clocksource: timekeeping watchdog on CPU1: hpet retried 2\n",
+    ]
+    allowed = b"[%8d.%06d] WARNING: Unprivileged eBPF is enabled, data leaks\n"
+    splat = (
+        b"[%8d.%06d] BUG: KASAN: slab-use-after-free in bpf_prog_run+0x10/0x20\n"
+        b"[%8d.%06d] Call Trace:\n"
+        b"[%8d.%06d]  <TASK>\n"
+        b"[%8d.%06d] ---[ end trace 0000000000000000 ]---\n"
+    )
+    written = 0
+    counter = 0
+    while written < size:
+        chunk = []
+        for _ in range(10000):
+            counter += 1
+            if counter % 1000000 == 0:
+                chunk.append(splat % ((counter, 0) * 4))
+            elif counter % 100000 == 0:
+                chunk.append(allowed % (counter, 0))
+            else:
+                chunk.append(lines[counter % len(lines)] % (counter, 0))
+        data = b"".join(chunk)
+        written += len(data)
+        yield data
+
+
+def benchmark(size_mib: int, deny_patterns: List[str], allow_patterns: List[str]):
+    with tempfile.NamedTemporaryFile(suffix=".log") as file:
+        for chunk in synthetic_log(size_mib * 1024 * 1024):
+            file.write(chunk)
+        file.flush()
+        start = time.perf_counter()
+        result = scan_file(file.name, deny_patterns, allow_patterns)
+        elapsed = time.perf_counter() - start
+    mib = result.scanned_bytes / 1024 / 1024
+    print(
+        f"Scanned {mib:.0f} MiB in {elapsed:.2f}s ({mib / elapsed:.0f} MiB/s), "
+        f"{len(result.splats)} splats"
+    )
+
+
+def report(result: ScanResult) -> None:
+    for splat in result.splats:
+        print(f"Kernel splat at line {splat.lineno} matching '{splat.pattern}':")
+        print("\n".join(splat.trace))
+        print()
+
+    print("Denylist hits:")
+    for pattern, hits in result.deny_hits.items():
+        print(f"{hits:>8}  {pattern}")
+    print("Allowlist hits:")
+    for pattern, hits in result.allow_hits.items():
+        stale = "  (no match, stale?)" if hits == 0 else ""
+        print(f"{hits:>8}  {pattern}{stale}")
+
+
+def main(args: argparse.Namespace) -> int:
+    deny_patterns = read_patterns(args.denylist)
+    allow_patterns = read_patterns(args.allowlist) if args.allowlist else []
+
+    if args.benchmark:
+        benchmark(args.benchmark, deny_patterns, allow_patterns)
+        return 0
+
+    result = scan_file(args.log, deny_patterns, allow_patterns)
+    report(result)
+    if result.splats:
+        print(f"{len(result.splats)} kernel splat(s) found in {args.log}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    configs = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "../../ci/vmtest/configs"
+    )
+    parser = argparse.ArgumentParser(description="Scan a kernel log for splats")
+    parser.add_argument("log", nargs="?", help="Kernel log, e.g. dmesg.txt")
+    parser.add_argument(
+        "--denylist",
+        default=os.environ.get(
+            "SPLAT_DENYLIST_FILE", os.path.join(configs, "SPLAT_DENYLIST")
+        ),
+    )
+    parser.add_argument(
+        "--allowlist",
+        default=os.environ.get(
+            "SPLAT_ALLOWLIST_FILE", os.path.join(configs, "SPLAT_ALLOWLIST")
+        ),
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="MIB",
+        help="Scan a synthetic log of this size instead",
+    )
+    args = parser.parse_args()
+    if not args.log and not args.benchmark:
+        parser.error("a log file or --benchmark is required")
+    sys.exit(main(args))
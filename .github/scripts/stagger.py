@@ -2,8 +2,8 @@
 """Stagger CI runs during KPD rebase storms.
 
 When KPD rebases all PR branches after an upstream commit, hundreds of
-workflow runs fire at once.  This script detects the storm and sleeps
-for a random delay to spread the load.
+workflow runs fire at once.  This script detects the storm and holds each
+run until its turn to spread the load.
 
 Storm = all of:
   1. PR synchronize event (force-push rebase, not a new PR)
@@ -11,28 +11,50 @@ Storm = all of:
   3. More than 5 active workflow runs (queued + in-progress)
   4. Active runs >= 20% of open PRs
 
-If detected, sleeps a random 1-10 minutes then proceeds.
+The three probes run concurrently over a pooled session.
+
+If detected, each run gets a deterministic slot in a window sized to the
+active runs over the runner capacity: the PR number is spread over [0, 1)
+by the golden ratio, so consecutive PRs land far apart, and the slot is
+that fraction of the window (1-10 minutes).  While waiting, the run
+re-checks the active run count every 30 seconds.  The window shrinks as
+runs finish, so waiting runs start early in the same order, and all of
+them proceed once the storm is over.
 cancel-in-progress on the concurrency group kills sleeping runs on new pushes.
 """
 
+import concurrent.futures
+import math
 import os
-import random
 import time
 from datetime import datetime, timezone
 
 import requests
+import requests.adapters
 
 BASE_BRANCH_RECENCY_S = 1800  # base branch "just updated" threshold
 STORM_RATIO = 0.2  # active runs / open PRs threshold
 STORM_MIN_ACTIVE = 5  # minimum active runs to consider a storm
-WAIT_MIN_S = 60  # min delay
-WAIT_MAX_S = 600  # max delay
+WAIT_MIN_S = 60  # min window
+WAIT_MAX_S = 600  # max window
+RUN_CAPACITY = 40  # runs the runners absorb at once, RUN_CAPACITY env overrides
+WAVE_S = 120  # time for a wave of RUN_CAPACITY runs to get going
+RECHECK_S = 30  # how often a waiting run re-checks the load
+GOLDEN_RATIO_FRACTION = (math.sqrt(5) - 1) / 2
+
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
+
+session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(pool_maxsize=4)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
 
 
 def gh_api(endpoint):
     token = os.environ.get("GITHUB_TOKEN", "")
-    resp = requests.get(
-        f"https://api.github.com{endpoint}",
+    api_url = os.environ.get("GITHUB_API_URL", DEFAULT_GITHUB_API_URL)
+    resp = session.get(
+        f"{api_url}{endpoint}",
         headers={
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json",
@@ -76,10 +98,63 @@ def open_pr_count(repo):
         return 0
 
 
-def main():
-    action = os.environ.get("GITHUB_EVENT_ACTION", "")
-    repo = os.environ.get("GITHUB_REPOSITORY", "")
-    base = os.environ.get("PR_BASE_BRANCH", "")
+def probe(repo, base_branch):
+    """Run the three storm probes concurrently."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+        age = pool.submit(base_branch_age_s, repo, base_branch)
+        active = pool.submit(active_run_count, repo)
+        open_prs = pool.submit(open_pr_count, repo)
+        return age.result(), active.result(), open_prs.result()
+
+
+def slot_fraction(pr_number):
+    """Deterministic position of a PR in the window, in [0, 1)."""
+    return (pr_number * GOLDEN_RATIO_FRACTION) % 1
+
+
+def window_s(active, capacity):
+    """Time it takes the runners to absorb `active` runs, within bounds."""
+    window = WAVE_S * active / max(capacity, 1)
+    return min(WAIT_MAX_S, max(WAIT_MIN_S, window))
+
+
+def wait_for_slot(
+    pr_number,
+    active,
+    capacity,
+    count_active,
+    clock=time.monotonic,
+    sleep=time.sleep,
+):
+    """
+    Wait until the slot of `pr_number` in a window sized by the active run
+    count, re-measured with `count_active` every RECHECK_S. Returns the
+    number of seconds waited. `clock` and `sleep` can be replaced to drive
+    the scheduler without real time passing.
+    """
+    fraction = slot_fraction(pr_number)
+    start = clock()
+    while True:
+        waited = clock() - start
+        if active <= STORM_MIN_ACTIVE:
+            return waited
+        delay = fraction * window_s(active, capacity)
+        if waited >= delay:
+            return waited
+        sleep(min(RECHECK_S, delay - waited))
+        active = count_active()
+
+
+def main(environ=os.environ, clock=time.monotonic, sleep=time.sleep):
+    """
+    `environ`, `clock` and `sleep` default to the real ones, stagger_sim.py
+    replaces them to replay many runs against a virtual clock.
+    """
+    action = environ.get("GITHUB_EVENT_ACTION", "")
+    repo = environ.get("GITHUB_REPOSITORY", "")
+    base = environ.get("PR_BASE_BRANCH", "")
+    pr_number = int(environ.get("PR_NUMBER") or 0)
+    capacity = int(environ.get("RUN_CAPACITY") or RUN_CAPACITY)
 
     if action != "synchronize":
         return
@@ -87,17 +162,15 @@ def main():
     if not repo or not base:
         return
 
-    age = base_branch_age_s(repo, base)
+    age, active, open_prs = probe(repo, base)
     if age is None or age > BASE_BRANCH_RECENCY_S:
         print(f"Base branch {base} updated {age}s ago — no storm.")
         return
 
-    active = active_run_count(repo)
     if active <= STORM_MIN_ACTIVE:
         print(f"Only {active} active runs — no storm.")
         return
 
-    open_prs = open_pr_count(repo)
     if open_prs == 0:
         return
 
@@ -106,14 +179,21 @@ def main():
         print(f"{active} active / {open_prs} PRs ({ratio:.0%}) — no storm.")
         return
 
-    delay = random.randint(WAIT_MIN_S, WAIT_MAX_S)
+    window = window_s(active, capacity)
     print(
         f"Storm detected: base {base} updated {age:.0f}s ago, "
         f"{active} active / {open_prs} PRs ({ratio:.0%}). "
-        f"Waiting {delay}s."
+        f"Slot at {slot_fraction(pr_number) * window:.0f}s of a {window:.0f}s window."
+    )
+    waited = wait_for_slot(
+        pr_number,
+        active,
+        capacity,
+        lambda: active_run_count(repo),
+        clock=clock,
+        sleep=sleep,
     )
-    time.sleep(delay)
-    print("Proceeding.")
+    print(f"Proceeding after {waited:.0f}s.")
 
 
 if __name__ == "__main__":
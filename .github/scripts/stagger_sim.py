@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Replay a KPD rebase storm through stagger.py to compare policies.
+
+Every synchronize event of the storm runs the real stagger.main() in its
+own thread, against a local fake of the GitHub endpoints it queries
+(branches, commits, actions runs and issue search) and with a virtual
+clock: stagger sleeps block until the simulation reaches their wake time,
+and time jumps to the next event as soon as every run is blocked.
+
+Once stagger returns, the run's CI jobs queue for a fixed pool of
+runners.  A run is active from its event until its CI jobs are done.
+
+Policies are sets of overrides of the stagger.py constants, e.g.
+
+  python3 -m scripts.stagger_sim --runs 400 --runners 40 \\
+      --policy off:STORM_MIN_ACTIVE=1000000000 \\
+      --policy default \\
+      --policy slow:WAVE_S=240,RECHECK_S=60
+
+For each policy the report has the p50/p95 time from event to CI start,
+the set-matrix runner minutes spent waiting in stagger, the maximum
+runner queue depth and when the last CI job finished.  --timeline writes
+the runner queue depth per minute of every policy as CSV.
+"""
+
+import argparse
+import contextlib
+import csv
+import heapq
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import stagger
+
+REPO = "kernel-patches/bpf"
+BASE_BRANCH = "bpf-next_base"
+FIRST_PR_NUMBER = 10000
+# Shortest virtual sleep, so that float rounding of what is left of a wait
+# can't keep a run sleeping without time passing
+MIN_SLEEP_S = 0.001
+
+
+class Simulation:
+    """State of one storm replay, advanced by run() on a virtual clock."""
+
+    def __init__(self, args):
+        self.args = args
+        self.cond = threading.Condition()
+        self.now = 0.0
+        self.seq = itertools.count()
+        # Threads not blocked in a virtual sleep
+        self.running = 0
+        self.sleepers = []
+        self.events = []
+        self.waiting = []
+        self.free_runners = args.runners
+        self.active = 0
+        self.triggered_at = {}
+        self.staggered = {}
+        self.started = {}
+        self.finished_at = 0.0
+        self.depth = []
+
+        rng = random.Random(args.seed)
+        for idx in range(args.runs):
+            at = rng.uniform(0, args.arrival_s)
+            self.schedule(at, "trigger", FIRST_PR_NUMBER + idx)
+
+    def schedule(self, at, kind, pr_number):
+        heapq.heappush(self.events, (at, next(self.seq), kind, pr_number))
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        wake = threading.Event()
+        with self.cond:
+            at = self.now + max(seconds, MIN_SLEEP_S)
+            heapq.heappush(self.sleepers, (at, next(self.seq), wake))
+            self.running -= 1
+            self.cond.notify_all()
+        wake.wait()
+
+    def run_stagger(self, pr_number):
+        environ = {
+            "GITHUB_EVENT_ACTION": "synchronize",
+            "GITHUB_REPOSITORY": REPO,
+            "PR_BASE_BRANCH": BASE_BRANCH,
+            "PR_NUMBER": str(pr_number),
+        }
+        try:
+            stagger.main(environ, clock=self.clock, sleep=self.sleep)
+        finally:
+            with self.cond:
+                self.staggered[pr_number] = self.now
+                self.waiting.append(pr_number)
+                self.running -= 1
+                self.cond.notify_all()
+
+    def start_jobs(self):
+        while self.waiting and self.free_runners:
+            pr_number = self.waiting.pop(0)
+            self.free_runners -= 1
+            self.started[pr_number] = self.now
+            self.schedule(self.now + self.args.job_s, "done", pr_number)
+
+    def run(self):
+        threads = []
+        with self.cond:
+            while True:
+                self.cond.wait_for(lambda: self.running == 0)
+                self.start_jobs()
+                self.depth.append((self.now, len(self.waiting)))
+
+                upcoming = [
+                    queue[0][0] for queue in (self.events, self.sleepers) if queue
+                ]
+                if not upcoming:
+                    break
+                self.now = max(self.now, min(upcoming))
+
+                while self.events and self.events[0][0] <= self.now:
+                    _, _, kind, pr_number = heapq.heappop(self.events)
+                    if kind == "trigger":
+                        self.active += 1
+                        self.triggered_at[pr_number] = self.now
+                        self.running += 1
+                        thread = threading.Thread(
+                            target=self.run_stagger, args=(pr_number,)
+                        )
+                        thread.start()
+                        threads.append(thread)
+                    else:
+                        self.active -= 1
+                        self.free_runners += 1
+                        self.finished_at = self.now
+
+                while self.sleepers and self.sleepers[0][0] <= self.now:
+                    _, _, wake = heapq.heappop(self.sleepers)
+                    self.running += 1
+                    wake.set()
+
+        for thread in threads:
+            thread.join()
+
+    def queue_depth_per_minute(self):
+        """Maximum runner queue depth within each minute of the replay."""
+        minutes = int(self.now // 60) + 1
+        depth = [0] * minutes
+        for at, queued in self.depth:
+            minute = int(at // 60)
+            depth[minute] = max(depth[minute], queued)
+        return depth
+
+    def report(self):
+        to_start = sorted(
+            (self.started[pr] - self.triggered_at[pr]) / 60 for pr in self.started
+        )
+        percentiles = statistics.quantiles(to_start, n=20, method="inclusive")
+        waited = sum(
+            self.staggered[pr] - self.triggered_at[pr] for pr in self.staggered
+        )
+        return {
+            "p50_start_min": round(statistics.median(to_start), 1),
+            "p95_start_min": round(percentiles[18], 1),
+            "stagger_runner_min": round(waited / 60, 1),
+            "max_queue_depth": max(queued for _, queued in self.depth),
+            "last_done_min": round(self.finished_at / 60, 1),
+        }
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """The endpoints stagger.py queries, answered from the simulation."""
+
+    simulation = None
+    open_prs = 0
+
+    def do_GET(self):
+        sim = self.simulation
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path == f"/repos/{REPO}/branches/{BASE_BRANCH}":
+            body = {"commit": {"sha": "0" * 40}}
+        elif url.path.startswith(f"/repos/{REPO}/commits/"):
+            # The base branch was updated when the storm started, stagger
+            # compares against the real time
+            updated = datetime.now(timezone.utc) - timedelta(seconds=sim.now)
+            date = updated.strftime("%Y-%m-%dT%H:%M:%SZ")
+            body = {"commit": {"committer": {"date": date}}}
+        elif url.path == f"/repos/{REPO}/actions/runs":
+            with sim.cond:
+                queued = len(sim.waiting)
+                in_progress = sim.active - queued
+            count = queued if query.get("status") == ["queued"] else in_progress
+            body = {"total_count": count}
+        elif url.path == "/search/issues":
+            body = {"total_count": self.open_prs}
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_policy(spec):
+    """'name:KEY=VALUE,KEY=VALUE' into a name and stagger.py overrides."""
+    name, _, assignments = spec.partition(":")
+    overrides = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, _, value = assignment.partition("=")
+        if not hasattr(stagger, key):
+            raise ValueError(f"stagger.py has no constant {key}")
+        overrides[key] = type(getattr(stagger, key))(float(value))
+    return name, overrides
+
+
+def simulate(args, overrides):
+    defaults = {key: getattr(stagger, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(stagger, key, value)
+    try:
+        sim = Simulation(args)
+        FakeGitHubHandler.simulation = sim
+        # stagger.py logs every run, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim.run()
+        return sim
+    finally:
+        for key, value in defaults.items():
+            setattr(stagger, key, value)
+
+
+def main(args):
+    policies = [parse_policy(spec) for spec in args.policy or ["default"]]
+
+    # Hundreds of concurrent runs overflow the stagger.py connection pool
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+
+    FakeGitHubHandler.open_prs = args.open_prs
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["GITHUB_API_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+    timelines = {}
+    writer = None
+    try:
+        for name, overrides in policies:
+            sim = simulate(args, overrides)
+            report = sim.report()
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout, ["policy", *report])
+                writer.writeheader()
+            writer.writerow({"policy": name, **report})
+            timelines[name] = sim.queue_depth_per_minute()
+    finally:
+        server.shutdown()
+        server.server_close()
+        # Connections to the fake server are left in the stagger.py pool
+        stagger.session.close()
+
+    if args.timeline:
+        with open(args.timeline, "w", newline="", encoding="utf-8") as file:
+            timeline = csv.writer(file)
+            timeline.writerow(["minute", *timelines])
+            for minute, depths in enumerate(
+                itertools.zip_longest(*timelines.values(), fillvalue=0)
+            ):
+                timeline.writerow([minute, *depths])
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay a rebase storm through stagger.py policies"
+    )
+    parser.add_argument("--runs", type=int, default=300, help="Synchronize events")
+    parser.add_argument(
+        "--arrival-s",
+        type=float,
+        default=300,
+        help="Seconds over which the storm's events arrive",
+    )
+    parser.add_argument("--runners", type=int, default=40, help="CI runners")
+    parser.add_argument(
+        "--job-s", type=float, default=1800, help="Seconds of CI work per run"
+    )
+    parser.add_argument("--open-prs", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--policy",
+        action="append",
+        help="NAME[:CONSTANT=VALUE,...] overriding stagger.py constants, repeatable",
+    )
+    parser.add_argument("--timeline", help="Write queue depth per minute to this CSV")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from ..dump_veristat_logs import dump_object_logs, main
+
+# Prints the -v output of veristat for every -f program: a log of LINES
+# instruction lines and an error, then the results table
+FAKE_VERISTAT = """#!/usr/bin/env python3
+import os
+import sys
+
+LINES = int(os.environ.get("FAKE_VERISTAT_LINES", "10"))
+args = sys.argv[1:]
+obj = os.path.basename(args[1])
+progs = [args[idx + 1] for idx, arg in enumerate(args) if arg == "-f"]
+for prog in progs:
+    print(f"PROCESSING {obj}/{prog}, DURATION US: 10, VERDICT: failure, "
+          "VERIFIER LOG:")
+    for idx in range(LINES):
+        print(f"{idx}: (b7) r0 = {idx}  ; \\u00e9")
+    print(f"error: {prog} failed")
+print("File        Program  Verdict  Duration (us)")
+print("----------  -------  -------  -------------")
+for prog in progs:
+    print(f"{obj}  {prog}  failure  10")
+print("Done. Processed 1 files, 0 programs.")
+"""
+
+
+class TestDumpVeristatLogs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.veristat = os.path.join(self.tmpdir, "veristat")
+        with open(self.veristat, "w", encoding="utf-8") as file:
+            file.write(FAKE_VERISTAT)
+        os.chmod(self.veristat, os.stat(self.veristat).st_mode | stat.S_IEXEC)
+        self.output_dir = os.path.join(self.tmpdir, "logs")
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        os.environ.pop("FAKE_VERISTAT_LINES", None)
+
+    def read_log(self, name):
+        with open(os.path.join(self.output_dir, name), encoding="utf-8") as file:
+            return file.read()
+
+    def test_split_logs(self):
+        logs = dump_object_logs(
+            self.veristat,
+            self.tmpdir,
+            "a.bpf.o",
+            ["prog_a", "prog_b"],
+            self.output_dir,
+            max_log_size=1024 * 1024,
+            excerpt_lines=2,
+        )
+        self.assertEqual(
+            logs,
+            [
+                (
+                    "a.bpf.o",
+                    "prog_a",
+                    ["9: (b7) r0 = 9  ; é\n", "error: prog_a failed\n"],
+                ),
+                (
+                    "a.bpf.o",
+                    "prog_b",
+                    ["9: (b7) r0 = 9  ; é\n", "error: prog_b failed\n"],
+                ),
+            ],
+        )
+        log = self.read_log("a.bpf.o-prog_a.log")
+        self.assertTrue(log.startswith("PROCESSING a.bpf.o/prog_a,"))
+        self.assertTrue(log.endswith("error: prog_a failed\n"))
+        # The results table is not part of the last log
+        self.assertTrue(self.read_log("a.bpf.o-prog_b.log").endswith("failed\n"))
+
+    def test_max_log_size(self):
+        os.environ["FAKE_VERISTAT_LINES"] = "1000"
+        max_log_size = 1000
+        logs = dump_object_logs(
+            self.veristat,
+            self.tmpdir,
+            "a.bpf.o",
+            ["prog_a"],
+            self.output_dir,
+            max_log_size=max_log_size,
+            excerpt_lines=1,
+        )
+        self.assertEqual(logs[0][2], ["error: prog_a failed\n"])
+
+        log = self.read_log("a.bpf.o-prog_a.log")
+        head, _, tail = log.partition("\n[... ")
+        self.assertTrue(head.startswith("PROCESSING a.bpf.o/prog_a,"))
+        self.assertTrue(tail.endswith("error: prog_a failed\n"))
+        # Sizes are counted in bytes, é is two of them
+        truncated = int(tail.split(" ", 1)[0])
+        kept = len(log.encode("utf-8")) - len(
+            f"\n[... {truncated} bytes truncated ...]\n\n"
+        )
+        self.assertLessEqual(kept, max_log_size)
+        full_size = sum(
+            len(line.encode("utf-8"))
+            for line in [
+                "PROCESSING a.bpf.o/prog_a, DURATION US: 10, VERDICT: failure, "
+                "VERIFIER LOG:\n",
+                *(f"{idx}: (b7) r0 = {idx}  ; é\n" for idx in range(1000)),
+                "error: prog_a failed\n",
+            ]
+        )
+        self.assertEqual(kept + truncated, full_size)
+
+    def test_no_excerpt(self):
+        logs = dump_object_logs(
+            self.veristat,
+            self.tmpdir,
+            "a.bpf.o",
+            ["prog_a"],
+            self.output_dir,
+            max_log_size=1024 * 1024,
+            excerpt_lines=0,
+        )
+        self.assertEqual(logs, [("a.bpf.o", "prog_a", [])])
+        self.assertTrue(self.read_log("a.bpf.o-prog_a.log").endswith("failed\n"))
+
+    def test_main(self):
+        progs_file = os.path.join(self.tmpdir, "failed_progs.txt")
+        with open(progs_file, "w", encoding="utf-8") as file:
+            file.write("a.bpf.o,prog_a\nb.bpf.o,prog_b\nb.bpf.o,prog_c\n")
+        args = argparse.Namespace(
+            progs_file=progs_file,
+            veristat=self.veristat,
+            objects_dir=self.tmpdir,
+            output_dir=self.output_dir,
+            archive=os.path.join(self.tmpdir, "logs.tar.gz"),
+            jobs=2,
+            max_log_size=1024 * 1024,
+            max_logs=2,
+            excerpt_lines=1,
+        )
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(main(args), 0)
+
+        self.assertEqual(
+            sorted(os.listdir(self.output_dir)),
+            ["a.bpf.o-prog_a.log", "b.bpf.o-prog_b.log"],
+        )
+        output = stdout.getvalue()
+        self.assertIn("3 programs failed, dumping logs of the first 2 only", output)
+        self.assertIn(
+            "VERIFIER LOG EXCERPT FOR b.bpf.o/prog_b:\n"
+            + "=" * 66
+            + "\nerror: prog_b failed\n",
+            output,
+        )
+        self.assertTrue(os.path.isfile(args.archive))
+
+        args.excerpt_lines = 0
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(main(args), 0)
+        self.assertNotIn("VERIFIER LOG EXCERPT", stdout.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
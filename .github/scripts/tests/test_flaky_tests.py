@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from ..flaky_tests import (
+    DAY_S,
+    connect,
+    expired_entries,
+    flake_rates,
+    ingest,
+    propose_denylist,
+    retry_list,
+)
+
+
+def summary(failed_subtests=(), failed_tests=()):
+    """A test_progs -J summary of two tests, failing the given ones."""
+    return {
+        "results": [
+            {
+                "name": "lru_lock_nmi",
+                "number": 1,
+                "failed": "lru_lock_nmi" in failed_tests,
+            },
+            {
+                "name": "fd_array_cnt",
+                "number": 2,
+                "failed": bool(failed_subtests),
+                "subtests": [
+                    {"name": name, "number": idx, "failed": name in failed_subtests}
+                    for idx, name in enumerate(
+                        ["fd-array-ref-btfs", "fd-array-cnt"], start=1
+                    )
+                ],
+            },
+            {"name": "skipped_test", "number": 3, "skipped": True},
+        ]
+    }
+
+
+class TestFlakyTests(unittest.TestCase):
+    def setUp(self):
+        self.conn = connect(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def ingest_runs(self, arch, failures, runs=10):
+        for idx in range(runs):
+            failed = ["fd-array-ref-btfs"] if idx < failures else []
+            ingest(
+                self.conn, summary(failed), f"run-{idx}", arch, "gcc-test_progs", 100
+            )
+
+    def test_retry_list(self):
+        self.assertEqual(
+            retry_list(summary(["fd-array-ref-btfs"], ["lru_lock_nmi"])),
+            ["lru_lock_nmi", "fd_array_cnt/fd-array-ref-btfs"],
+        )
+        self.assertEqual(retry_list(summary()), [])
+
+    def test_flake_rates(self):
+        self.ingest_runs("x86_64", failures=2)
+        self.ingest_runs("aarch64", failures=10)
+        # Ingesting a run again replaces it
+        ingest(self.conn, summary(), "run-0", "x86_64", "gcc-test_progs", 100)
+
+        rates = flake_rates(self.conn, since=0)
+        # aarch64 fails every run, it is broken rather than flaky
+        self.assertEqual(
+            [(flake.name, flake.arch, flake.runs, flake.failures) for flake in rates],
+            [
+                ("fd_array_cnt", "x86_64", 10, 1),
+                ("fd_array_cnt/fd-array-ref-btfs", "x86_64", 10, 1),
+            ],
+        )
+        self.assertEqual(flake_rates(self.conn, since=101), [])
+        self.assertEqual(flake_rates(self.conn, since=0, min_runs=11), [])
+
+    def test_propose_denylist(self):
+        self.ingest_runs("x86_64", failures=3)
+        self.ingest_runs("aarch64", failures=1)
+        rates = flake_rates(self.conn, since=0)
+
+        proposals = propose_denylist(rates, set(), 0.05, 0, 30 * DAY_S)
+        self.assertEqual(
+            proposals,
+            {
+                "DENYLIST": [
+                    "fd_array_cnt/fd-array-ref-btfs  # flaky: failed "
+                    "3/10 on x86_64/gcc-test_progs, 1/10 on aarch64/gcc-test_progs "
+                    "since 1970-01-01; expires 1970-01-31"
+                ]
+            },
+        )
+        proposals = propose_denylist(rates, set(), 0.2, 0, 30 * DAY_S)
+        self.assertEqual(list(proposals), ["DENYLIST.x86_64"])
+        denied = {"fd_array_cnt/fd-array-ref-btfs"}
+        self.assertEqual(propose_denylist(rates, denied, 0.05, 0, 0), {})
+
+    def test_expired_entries(self):
+        lines = [
+            "wq  # flaky; expires 2026-01-31\n",
+            "send_signal  # flaky; expires 2026-03-01\n",
+            "map_kptr\n",
+        ]
+        now = 1772236800  # 2026-02-28
+        self.assertEqual(
+            expired_entries(lines, "DENYLIST", now),
+            [("DENYLIST", 1, "wq  # flaky; expires 2026-01-31")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
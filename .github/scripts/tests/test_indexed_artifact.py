@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import indexed_artifact
+from ..indexed_artifact import (
+    extract,
+    extract_selected,
+    frame_runs,
+    matches,
+    normalize,
+    pack,
+)
+
+
+@unittest.skipUnless(shutil.which("zstd"), "needs the zstd CLI")
+class TestIndexedArtifact(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        tree = os.path.join(self.tmp, "tree")
+        files = {
+            "vmlinuz": os.urandom(4096),
+            "selftests/bpf/test_progs": b"test_progs" * 100,
+            "selftests/bpf/a.bpf.o": b"a" * 3000,
+            "selftests/sched_ext/runner": b"runner" * 100,
+        }
+        for name, data in files.items():
+            path = os.path.join(tree, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+        self.files = files
+        self.archive = os.path.join(self.tmp, "vmlinux.tar.zst")
+        subprocess.run(
+            f"tar -C {tree} -cf - . | zstd -q -o {self.archive}",
+            shell=True,
+            check=True,
+        )
+
+    def extracted(self, directory):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), directory)
+            for root, _, names in os.walk(directory)
+            for name in names
+        )
+
+    def test_pack_keeps_a_plain_tar_zst(self):
+        packed = os.path.join(self.tmp, "packed.tar.zst")
+        with mock.patch.object(indexed_artifact, "FRAME_SIZE", 1024):
+            index = pack(self.archive, packed)
+        self.assertGreater(len(index.frames), 2)
+
+        out = os.path.join(self.tmp, "full")
+        os.mkdir(out)
+        subprocess.run(
+            f"zstd -q -d -c {packed} | tar -C {out} -xf -", shell=True, check=True
+        )
+        self.assertEqual(self.extracted(out), sorted(self.files))
+
+    def test_extract_selected(self):
+        packed = os.path.join(self.tmp, "packed.tar.zst")
+        with mock.patch.object(indexed_artifact, "FRAME_SIZE", 1024):
+            pack(self.archive, packed)
+
+        out = os.path.join(self.tmp, "out")
+        os.mkdir(out)
+        stats = extract(packed, ["selftests/bpf"], ["*.bpf.o"], out)
+        self.assertTrue(stats.indexed)
+        self.assertLess(stats.read_bytes, stats.total_bytes)
+        self.assertEqual(self.extracted(out), ["selftests/bpf/test_progs"])
+        with open(os.path.join(out, "selftests/bpf/test_progs"), "rb") as file:
+            self.assertEqual(file.read(), self.files["selftests/bpf/test_progs"])
+
+    def test_frames_follow_directories(self):
+        packed = os.path.join(self.tmp, "packed.tar.zst")
+        index = pack(self.archive, packed)
+        frames = {}
+        for member in index.members:
+            frames.setdefault(member.frame, set()).add(normalize(member.name))
+        sched_ext = {
+            frame
+            for frame, names in frames.items()
+            if any(name.startswith("selftests/sched_ext") for name in names)
+        }
+        self.assertTrue(sched_ext)
+        for frame in sched_ext:
+            self.assertTrue(
+                all(name.startswith("selftests/sched_ext") for name in frames[frame])
+            )
+
+        out = os.path.join(self.tmp, "out")
+        os.mkdir(out)
+        stats = extract(packed, [], ["selftests/sched_ext"], out)
+        self.assertTrue(stats.indexed)
+        self.assertLess(stats.read_bytes, stats.total_bytes)
+        self.assertEqual(
+            self.extracted(out),
+            ["selftests/bpf/a.bpf.o", "selftests/bpf/test_progs", "vmlinuz"],
+        )
+
+    def test_extract_selected_fails_on_corrupt_frames(self):
+        packed = os.path.join(self.tmp, "packed.tar.zst")
+        index = pack(self.archive, packed)
+        frame = index.frames[0]
+        with open(packed, "r+b") as file:
+            file.seek(frame.offset + frame.size // 2)
+            file.write(b"\xff" * 16)
+
+        out = os.path.join(self.tmp, "out")
+        os.mkdir(out)
+        # extract() falls back to extracting everything on these errors
+        with open(packed, "rb") as file:
+            with self.assertRaises((RuntimeError, tarfile.TarError)):
+                extract_selected(file, index, index.members, out)
+
+    def test_extract_falls_back_without_index(self):
+        out = os.path.join(self.tmp, "out")
+        os.mkdir(out)
+        stats = extract(self.archive, ["vmlinuz"], ["selftests/sched_ext"], out)
+        self.assertFalse(stats.indexed)
+        self.assertEqual(
+            self.extracted(out),
+            ["selftests/bpf/a.bpf.o", "selftests/bpf/test_progs", "vmlinuz"],
+        )
+
+
+class TestSelection(unittest.TestCase):
+    def test_matches(self):
+        self.assertTrue(matches("selftests/bpf/test_progs", ["selftests/bpf"]))
+        self.assertTrue(matches("selftests/bpf/a.bpf.o", ["*.bpf.o"]))
+        self.assertTrue(matches("./selftests/bpf/test_progs", ["selftests/bpf/"]))
+        self.assertFalse(matches("selftests/bpf_gcc/x", ["selftests/bpf"]))
+
+    def test_frame_runs(self):
+        self.assertEqual(frame_runs([5, 1, 2, 2, 3, 7]), [(1, 3), (5, 5), (7, 7)])
+
+
+if __name__ == "__main__":
+    unittest.main()
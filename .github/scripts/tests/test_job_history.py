@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from ..job_history import (
+    BUILD,
+    TEST,
+    GitHubClient,
+    JobRecord,
+    collect,
+    job_durations,
+    parse_job,
+    write_test_durations,
+)
+from ..matrix import load_run_durations
+
+REPO = "kernel-patches/bpf"
+
+
+def make_job(name: str, minutes: int, conclusion: str = "success") -> Dict[str, Any]:
+    return {
+        "name": name,
+        "conclusion": conclusion,
+        "started_at": "2026-10-01T10:00:00Z",
+        "completed_at": f"2026-10-01T{10 + minutes // 60:02}:{minutes % 60:02}:00Z",
+    }
+
+
+def make_run_jobs(run_id: int) -> List[Dict[str, Any]]:
+    # Enough other jobs for the ones that count to be on the second page
+    jobs = [
+        make_job(f"x86_64 llvm-21 / veristat-kernel / veristat {idx}", 5)
+        for idx in range(120)
+    ]
+    jobs += [
+        make_job("x86_64 gcc-15 / build / build kernel and selftests ", 20 + run_id),
+        make_job("x86_64 gcc-15 / build-release / build kernel and selftests -O2", 60),
+        make_job(
+            "x86_64 gcc-15 / test (test_progs, false, 360) / "
+            "test_progs on x86_64 with gcc-15",
+            15 + run_id,
+        ),
+        make_job(
+            "x86_64 gcc-15 / test / test_maps on x86_64 with gcc-15", 99, "failure"
+        ),
+    ]
+    return jobs
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """Workflow runs and their paginated jobs."""
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        prefix = f"/repos/{REPO}/actions"
+        if url.path == f"{prefix}/workflows/test.yml/runs":
+            runs = [{"id": run_id} for run_id in (1, 2, 3)]
+            body = {"total_count": len(runs), "workflow_runs": runs}
+        elif url.path.startswith(f"{prefix}/runs/") and url.path.endswith("/jobs"):
+            jobs = make_run_jobs(int(url.path.split("/")[-2]))
+            per_page = int(query["per_page"][0])
+            page = int(query["page"][0])
+            body = {
+                "total_count": len(jobs),
+                "jobs": jobs[(page - 1) * per_page : page * per_page],
+            }
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestJobHistory(unittest.TestCase):
+    def test_parse_job(self):
+        self.assertEqual(
+            parse_job(
+                make_job(
+                    "aarch64 llvm-21 / test (test_verifier, false, 360) / "
+                    "test_verifier on aarch64 with llvm-21",
+                    90,
+                )
+            ),
+            JobRecord(TEST, "aarch64", "llvm", 90.0, test="test_verifier"),
+        )
+        self.assertEqual(
+            parse_job(
+                make_job("s390x gcc-15 / build / build kernel and selftests ", 5)
+            ),
+            JobRecord(BUILD, "s390x", "gcc", 5.0),
+        )
+        # Shards, release builds, other and unsuccessful jobs
+        for job in [
+            make_job(
+                "x86_64 gcc-15 / test / test_progs (1-of-4) on x86_64 with gcc", 5
+            ),
+            make_job(
+                "x86_64 gcc-15 / build-release / build kernel and selftests -O2", 5
+            ),
+            make_job("set-matrix", 1),
+            make_job(
+                "x86_64 gcc-15 / build / build kernel and selftests ", 5, "failure"
+            ),
+        ]:
+            self.assertIsNone(parse_job(job), job["name"])
+
+    def test_job_durations(self):
+        records = [
+            JobRecord(BUILD, "x86_64", "gcc", 20.0),
+            JobRecord(BUILD, "x86_64", "llvm", 30.0),
+            JobRecord(BUILD, "aarch64", "gcc", 40.0),
+            JobRecord(TEST, "x86_64", "gcc", 10.0, test="test_maps"),
+        ]
+        self.assertEqual(
+            job_durations(records),
+            {
+                "build": {"aarch64": 40.0, "x86_64": 25.0},
+                "test": {"x86_64": 10.0},
+            },
+        )
+
+    def test_write_test_durations(self):
+        records = [
+            JobRecord(BUILD, "x86_64", "gcc", 20.0),
+            JobRecord(TEST, "x86_64", "gcc", 4.53, test="test_maps"),
+            JobRecord(TEST, "s390x", "llvm", 30.0, test="test_progs"),
+        ]
+        out = io.StringIO()
+        write_test_durations(records, out)
+        # As matrix.py reads them back
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "d.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(out.getvalue())
+        self.assertEqual(
+            load_run_durations(path),
+            {
+                ("test_maps", "x86_64", "gcc"): [4.5],
+                ("test_progs", "s390x", "llvm"): [30.0],
+            },
+        )
+
+    def test_collect(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        client = GitHubClient(REPO, "token", f"http://{host}:{port}")
+        self.addCleanup(client.close)
+
+        since = datetime(2026, 10, 1, tzinfo=timezone.utc)
+        with contextlib.redirect_stdout(io.StringIO()):
+            records = collect(client, "test.yml", since, max_runs=2)
+        self.assertEqual(
+            job_durations(records),
+            {"build": {"x86_64": 21.5}, "test": {"x86_64": 16.5}},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
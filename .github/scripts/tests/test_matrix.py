@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from unittest import mock
+
+from ..matrix import (
+    Arch,
+    BuildConfig,
+    JobDurations,
+    PoolSnapshot,
+    adaptive_timeout,
+    apply_selection,
+    choose_test_shards,
+    default_matrix,
+    estimate_completions,
+    estimate_makespan,
+    generate_test_config,
+    load_run_durations,
+    load_matrix_rules,
+    lpt_shards,
+    path_glob_re,
+    place_builds,
+    query_runners_from_github,
+    select_matrix,
+    shard_tests,
+    threshold_placement,
+)
+
+RUNNER_COUNT = 437
+
+
+def make_runners(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": idx,
+            "name": f"runner-{idx}",
+            "status": "online" if idx % 7 else "offline",
+            "busy": idx % 3 == 0,
+            "labels": [{"name": "self-hosted"}, {"name": "x86_64"}],
+        }
+        for idx in range(count)
+    ]
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """Paginated org runners endpoint."""
+
+    runners: List[Dict[str, Any]] = []
+    requests: List[str] = []
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path != "/orgs/kernel-patches/actions/runners":
+            self.send_error(404)
+            return
+
+        type(self).requests.append(self.path)
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        runners = self.runners[(page - 1) * per_page : page * per_page]
+        body = json.dumps({"total_count": len(self.runners), "runners": runners})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestQueryRunners(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        FakeGitHubHandler.runners = make_runners(RUNNER_COUNT)
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeGitHubHandler.requests = []
+        host, port = self.server.server_address
+        self.env = mock.patch.dict(
+            os.environ,
+            {
+                "GITHUB_TOKEN": "token",
+                "GITHUB_REPOSITORY_OWNER": "kernel-patches",
+                "GITHUB_API_URL": f"http://{host}:{port}",
+            },
+        )
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+
+    def test_fetches_all_pages(self):
+        runners = query_runners_from_github()
+        self.assertEqual(sorted(r["id"] for r in runners), list(range(RUNNER_COUNT)))
+        self.assertEqual(len(FakeGitHubHandler.requests), 5)
+        self.assertTrue(all("per_page=100" in r for r in FakeGitHubHandler.requests))
+
+    def test_server_error(self):
+        with mock.patch.dict(os.environ, {"GITHUB_REPOSITORY_OWNER": "unknown"}):
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(query_runners_from_github(), [])
+        self.assertIn("Failed to query runners: 404", out.getvalue())
+
+
+class TestPlaceBuilds(unittest.TestCase):
+    def setUp(self):
+        self.configs = default_matrix()
+        self.durations = JobDurations()
+
+    def snapshot(self, x86_64, s390x=PoolSnapshot(online=5, busy=2)):
+        return {
+            Arch.X86_64: x86_64,
+            Arch.AARCH64: PoolSnapshot(online=10, busy=4),
+            Arch.S390X: s390x,
+        }
+
+    def place(self, snapshot):
+        placement = place_builds(self.configs, snapshot, self.durations)
+        self.assertLessEqual(
+            sum(
+                estimate_completions(self.configs, placement, snapshot, self.durations)
+            ),
+            sum(
+                estimate_completions(
+                    self.configs, [False] * 4, snapshot, self.durations
+                )
+            ),
+        )
+        return placement
+
+    def test_idle_runners_keep_builds_self_hosted(self):
+        snapshot = self.snapshot(PoolSnapshot(online=20, busy=5))
+        self.assertEqual(self.place(snapshot), [False] * 4)
+
+    def test_saturated_runners_move_builds_to_codebuild(self):
+        for queued in (0, 5, 30):
+            snapshot = self.snapshot(PoolSnapshot(online=10, busy=10, queued=queued))
+            self.assertEqual(self.place(snapshot), [True, True, False, False])
+
+    def test_offline_arch(self):
+        # No s390x runner online must not hide the saturated x86_64 pool
+        snapshot = self.snapshot(
+            PoolSnapshot(online=10, busy=10, queued=30), PoolSnapshot()
+        )
+        self.assertEqual(self.place(snapshot), [True, True, False, False])
+        self.assertEqual(
+            threshold_placement(self.configs, snapshot), [True, True, False, False]
+        )
+        self.assertLess(
+            estimate_makespan(self.configs, [False] * 4, snapshot, self.durations),
+            float("inf"),
+        )
+
+    def test_sharded_tests(self):
+        # Shards are shorter jobs of the same test
+        config = BuildConfig(arch=Arch.X86_64, test_timings={"a": 600.0, "b": 600.0})
+        unsharded = estimate_completions(
+            [config], [False], self.snapshot(PoolSnapshot(online=20)), self.durations
+        )
+        config.test_shards = 2
+        sharded = estimate_completions(
+            [config], [False], self.snapshot(PoolSnapshot(online=20)), self.durations
+        )
+        self.assertEqual(len(sharded), len(unsharded) + 3)
+        # Build, then 20 minute jobs or 10 minute shards of the test_progs flavors
+        self.assertEqual(sorted(set(unsharded[1:])), [45.0])
+        self.assertEqual(sorted(set(sharded[1:])), [35.0, 45.0])
+
+
+class TestShardTests(unittest.TestCase):
+    timings = {"a": 100.0, "b": 80.0, "c": 60.0, "d": 40.0, "e": 30.0, "f": 10.0}
+
+    def test_lpt_balances_load(self):
+        bins = lpt_shards(self.timings, 2)
+        loads = sorted(sum(self.timings[name] for name in tests) for tests in bins)
+        # LPT is within 4/3 of the optimum, here 150/170 vs 160/160
+        self.assertEqual(loads, [150.0, 170.0])
+        self.assertCountEqual(sum(bins, []), self.timings)
+
+    def test_shards_cover_unknown_tests(self):
+        configs = shard_tests(generate_test_config("test_progs"), self.timings, 3)
+        self.assertEqual(
+            [config["shard"] for config in configs], ["1-of-3", "2-of-3", "3-of-3"]
+        )
+        allowed = sum((config.get("allowlist", []) for config in configs), [])
+        rest = [config for config in configs if "denylist" in config]
+        self.assertEqual(len(rest), 1)
+        # The remaining shard skips exactly what the others run
+        self.assertCountEqual(rest[0]["denylist"], allowed)
+
+    def test_choose_test_shards(self):
+        self.assertEqual(choose_test_shards({}, 3, 100), 1)
+        self.assertEqual(choose_test_shards({"a": 3600.0}, 3, 100), 4)
+        self.assertEqual(choose_test_shards({"a": 3600.0}, 3, 6), 2)
+        self.assertEqual(choose_test_shards({"a": 400.0}, 3, 100), 1)
+
+
+class TestAdaptiveTimeout(unittest.TestCase):
+    def test_fallback_without_history(self):
+        self.assertEqual(generate_test_config("test_maps")["timeout_minutes"], 360)
+        self.assertEqual(
+            generate_test_config("test_progs_parallel", [5.0])["timeout_minutes"], 30
+        )
+
+    def test_percentile_with_floor_and_ceiling(self):
+        durations = [float(minutes) for minutes in range(1, 101)]
+        # p99 of 1..100 is 99, doubled
+        self.assertEqual(adaptive_timeout(durations, 360), 198)
+        self.assertEqual(adaptive_timeout(durations, 30), 30)
+        self.assertEqual(adaptive_timeout([1.0] * 20, 360), 10)
+
+    def test_load_run_durations(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write("test,arch,toolchain,minutes\n")
+            file.write("test_maps,x86_64,gcc,4.5\ntest_maps,x86_64,gcc,5\n")
+            file.write("test_maps,x86_64,llvm,oops\n")
+            file.flush()
+            durations = load_run_durations(file.name)
+        self.assertEqual(durations, {("test_maps", "x86_64", "gcc"): [4.5, 5.0]})
+
+
+class TestSelectMatrix(unittest.TestCase):
+    rules = [
+        {"name": "docs", "paths": ["Documentation/*"]},
+        {
+            "name": "maps",
+            "paths": ["tools/testing/selftests/bpf/map_tests/*"],
+            "arches": "all",
+            "tests": ["test_maps"],
+        },
+        {
+            "name": "s390 JIT",
+            "paths": ["arch/s390/net/*"],
+            "arches": ["s390x"],
+            "tests": "all",
+        },
+    ]
+
+    def matrix(self):
+        return [BuildConfig(arch=arch, run_veristat=True) for arch in Arch]
+
+    def test_path_glob(self):
+        docs = path_glob_re("Documentation/**")
+        self.assertTrue(docs.match("Documentation/bpf/index.rst"))
+        self.assertFalse(docs.match("tools/Documentation/a.rst"))
+        txt = path_glob_re("*.txt")
+        self.assertTrue(txt.match("a.txt"))
+        # "*" stays within a path component
+        self.assertFalse(txt.match("tools/testing/selftests/bpf/data.txt"))
+        self.assertTrue(path_glob_re("test_maps.?").match("test_maps.c"))
+
+    def test_default_rules(self):
+        rules = load_matrix_rules(
+            os.path.join(
+                os.path.dirname(__file__),
+                "../../../ci/vmtest/configs/matrix-rules.json",
+            )
+        )
+        selection = select_matrix(["tools/testing/selftests/bpf/data.txt"], rules)
+        self.assertTrue(selection.run_all)
+        selection = select_matrix(["Documentation/bpf/map_array.rst"], rules)
+        self.assertEqual(selection.tests, set())
+
+    def test_unmatched_path_runs_everything(self):
+        selection = select_matrix(
+            ["Documentation/a.rst", "kernel/bpf/core.c"], self.rules
+        )
+        self.assertTrue(selection.run_all)
+        self.assertEqual(selection.reasons, ["kernel/bpf/core.c matches no rule"])
+        self.assertTrue(select_matrix(None, self.rules).run_all)
+
+    def test_prune_to_needed_tests(self):
+        selection = select_matrix(
+            ["Documentation/a.rst", "tools/testing/selftests/bpf/map_tests/x.c"],
+            self.rules,
+        )
+        self.assertEqual(selection.to_dict()["tests"], ["test_maps"])
+        matrix = apply_selection(self.matrix(), selection)
+        self.assertEqual(len(matrix), 3)
+        for config in matrix:
+            self.assertEqual(
+                [test["test"] for test in config.tests["include"]],
+                [] if config.arch == Arch.S390X else ["test_maps"],
+            )
+            self.assertFalse(config.run_veristat)
+
+    def test_prune_arches(self):
+        selection = select_matrix(["arch/s390/net/bpf_jit_comp.c"], self.rules)
+        matrix = apply_selection(self.matrix(), selection)
+        self.assertEqual([config.arch for config in matrix], [Arch.S390X])
+        self.assertIsNone(matrix[0].selected_tests)
+
+    def test_docs_only_still_builds(self):
+        selection = select_matrix(["Documentation/a.rst"], self.rules)
+        matrix = apply_selection(self.matrix(), selection)
+        self.assertEqual(len(matrix), 1)
+        self.assertEqual(matrix[0].tests["include"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
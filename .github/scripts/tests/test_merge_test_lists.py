@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+
+from ..merge_test_lists import (
+    TestListMatcher,
+    dead_entries,
+    merge_lists,
+    parse_list,
+)
+
+DENYLIST = """
+verif_scale_pyperf600
+sockmap_basic/sockmap udp multi channels   # flaky
+tc_tunnel/ip6gre*		# glob
+verif_scale_pyperf600  # duplicate
+"""
+
+ALLOWLIST = """
+sockmap_basic
+verif_scale_pyperf600   # shadowed by the denylist
+tc_tunnel/ipip
+"""
+
+
+class TestMergeTestLists(unittest.TestCase):
+    def setUp(self):
+        self.merged = merge_lists(
+            parse_list(ALLOWLIST.splitlines(), "ALLOWLIST"),
+            parse_list(DENYLIST.splitlines(), "DENYLIST"),
+        )
+
+    def test_parse_strips_comments(self):
+        entries = parse_list(DENYLIST.splitlines(), "DENYLIST")
+        self.assertEqual(entries[1].pattern, "sockmap_basic/sockmap udp multi channels")
+        self.assertEqual(entries[1].lineno, 3)
+        self.assertEqual(entries[2].subtest, "ip6gre*")
+
+    def test_deny_wins_over_allow(self):
+        self.assertEqual(
+            [entry.pattern for entry in self.merged.shadowed], ["verif_scale_pyperf600"]
+        )
+        matcher = self.merged.matcher
+        self.assertTrue(matcher.runs("sockmap_basic"))
+        self.assertTrue(matcher.runs("sockmap_basic", "sockmap tcp"))
+        self.assertFalse(matcher.runs("sockmap_basic", "sockmap udp multi channels"))
+        self.assertFalse(matcher.runs("verif_scale_pyperf600"))
+        # Only an allowed subtest of tc_tunnel runs
+        self.assertTrue(matcher.runs("tc_tunnel"))
+        self.assertTrue(matcher.runs("tc_tunnel", "ipip"))
+        self.assertFalse(matcher.runs("tc_tunnel", "ip6gre_1"))
+        self.assertFalse(matcher.runs("map_kptr"))
+
+    def test_matcher_roundtrip(self):
+        data = json.loads(json.dumps(self.merged.matcher.to_dict()))
+        matcher = TestListMatcher.load(data)
+        self.assertFalse(matcher.runs("tc_tunnel", "ip6gre_1"))
+        self.assertTrue(matcher.runs("tc_tunnel", "ipip"))
+
+    def test_dead_entries(self):
+        inventory = ["sockmap_basic", "tc_tunnel", "tc_tunnel/ipip", "tc_tunnel/ip6gre"]
+        dead = dead_entries(self.merged.allow + self.merged.deny, inventory)
+        self.assertEqual(
+            [entry.pattern for entry in dead],
+            ["verif_scale_pyperf600", "sockmap_basic/sockmap udp multi channels"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
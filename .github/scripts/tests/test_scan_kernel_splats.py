@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import re
+import unittest
+
+from ..scan_kernel_splats import (
+    CompiledList,
+    common_prefix,
+    ere_to_python,
+    scan,
+)
+
+DENYLIST = [
+    r"^(\[[^]]*\] *)*(BUG|WARNING|UBSAN|Oops)[: ]",
+    r"^(\[[^]]*\] *)*kernel BUG at",
+    r"^(\[[^]]*\] *)*(rcu: )?INFO: (task .* blocked for more than|[_a-z]+ (self-)?detected stall)",
+]
+ALLOWLIST = [
+    "WARNING: Unprivileged eBPF is enabled",
+    r"BUG: KASAN: stack-out-of-bounds in (stack_trace_consume_entry|filter_irq_stacks)\+",
+]
+
+LOG = b"""WARNING: at boot, no timestamp yet
+[    1.100000] WARNING: Unprivileged eBPF is enabled, data leaks possible
+[    2.000000] bpf_testmod: loading
+[    3.000000] BUG: KASAN: slab-use-after-free in bpf_prog_run+0x10/0x20
+[    3.000001] Call Trace:
+[    3.000002] WARNING: inside the trace
+[    3.000003] ---[ end trace 0000000000000000 ]---
+[    4.000000] [ 12] not a splat: BUG
+[    5.000000] rcu: INFO: rcu_preempt self-detected stall on CPU
+"""
+
+
+class TestScanKernelSplats(unittest.TestCase):
+    def test_translation_keeps_lines_apart(self):
+        regex = re.compile(ere_to_python(r"^(\[[^]]*\] *)*BUG"), re.MULTILINE)
+        self.assertIsNone(regex.search("[ 1.0 \n] BUG"))
+        self.assertIsNotNone(regex.search("[ 1.0 ] [C1] BUG"))
+        self.assertEqual(ere_to_python("[[:digit:]]+"), "[0-9]+")
+
+    def test_common_prefix(self):
+        self.assertEqual(
+            common_prefix([pattern[1:] for pattern in DENYLIST]), r"(\[[^]]*\] *)*"
+        )
+        # Cutting inside an alternation or before a quantifier would change
+        # what the patterns mean
+        self.assertEqual(common_prefix(["ab|c", "ab"]), "")
+        self.assertEqual(common_prefix(["ab*", "abc"]), "a")
+
+    def test_anchored_list_matches_first_line(self):
+        hits = list(CompiledList(DENYLIST, "d").finditer(b"BUG: x\nok\n"))
+        self.assertEqual(hits, [(0, DENYLIST[0])])
+
+    def test_scan(self):
+        result = scan(LOG, DENYLIST, ALLOWLIST)
+        self.assertEqual([splat.lineno for splat in result.splats], [1, 4, 6, 9])
+        # A trace block stops at the next splat or at the end of trace
+        self.assertEqual(len(result.splats[0].trace), 3)
+        kasan = result.splats[1]
+        self.assertEqual(kasan.pattern, DENYLIST[0])
+        self.assertEqual(kasan.trace[-1], "[    3.000001] Call Trace:")
+        self.assertTrue(
+            result.splats[2].trace[-1].endswith("---[ end trace 0000000000000000 ]---")
+        )
+        self.assertEqual(result.deny_hits[DENYLIST[0]], 4)
+        self.assertEqual(result.deny_hits[DENYLIST[1]], 0)
+        self.assertEqual(result.allow_hits, {ALLOWLIST[0]: 1, ALLOWLIST[1]: 0})
+
+    def test_no_denylist(self):
+        with self.assertRaises(ValueError):
+            scan(LOG, [], ALLOWLIST)
+
+
+if __name__ == "__main__":
+    unittest.main()
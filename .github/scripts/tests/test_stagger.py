@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from ..stagger import WAIT_MAX_S, slot_fraction, wait_for_slot, window_s
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestStagger(unittest.TestCase):
+    def test_slots_are_spread(self):
+        slots = sorted(slot_fraction(pr) for pr in range(1000, 1100))
+        gaps = [b - a for a, b in zip(slots, slots[1:])]
+        self.assertLess(max(gaps), 3 / len(slots))
+
+    def test_waits_for_slot_under_constant_load(self):
+        clock = FakeClock()
+        waited = wait_for_slot(
+            1001, 500, 40, lambda: 500, clock=clock, sleep=clock.sleep
+        )
+        self.assertAlmostEqual(waited, slot_fraction(1001) * WAIT_MAX_S)
+
+    def test_starts_early_when_load_drops(self):
+        clock = FakeClock()
+        load = iter([300, 100, 3])
+        waited = wait_for_slot(
+            1001, 500, 40, lambda: next(load), clock=clock, sleep=clock.sleep
+        )
+        self.assertLess(waited, slot_fraction(1001) * window_s(500, 40))
+        self.assertEqual(waited, 90)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..stagger_sim import main
+
+
+class TestStaggerSim(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_main(self):
+        # 20 events within 10s for 5 runners, each busy for 10 minutes: four
+        # waves of CI jobs, whether or not stagger spreads the events
+        args = argparse.Namespace(
+            runs=20,
+            arrival_s=10,
+            runners=5,
+            job_s=600,
+            open_prs=20,
+            seed=0,
+            policy=["off:STORM_MIN_ACTIVE=1000000000", "default:RUN_CAPACITY=5"],
+            timeline=os.path.join(self.tmpdir, "timeline.csv"),
+        )
+        stdout = io.StringIO()
+        with mock.patch.dict(os.environ), contextlib.redirect_stdout(stdout):
+            self.assertEqual(main(args), 0)
+
+        reports = {
+            row.pop("policy"): row
+            for row in csv.DictReader(io.StringIO(stdout.getvalue()))
+        }
+        self.assertEqual(
+            reports["off"],
+            {
+                "p50_start_min": "14.9",
+                "p95_start_min": "29.9",
+                "stagger_runner_min": "0.0",
+                "max_queue_depth": "15",
+                "last_done_min": "40.1",
+            },
+        )
+        self.assertEqual(
+            reports["default"],
+            {
+                "p50_start_min": "14.9",
+                "p95_start_min": "30.0",
+                "stagger_runner_min": "60.5",
+                "max_queue_depth": "15",
+                "last_done_min": "40.1",
+            },
+        )
+
+        with open(args.timeline, newline="", encoding="utf-8") as file:
+            timeline = list(csv.reader(file))
+        self.assertEqual(timeline[0], ["minute", "off", "default"])
+        # Stagger holds the runs back instead of queueing them all at once
+        self.assertEqual(timeline[1], ["0", "15", "2"])
+        self.assertEqual(len(timeline), 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import unittest
+
+from ..veristat_bench import compare_to_baseline, generate_compare_csv, measure
+from ..veristat_compare import parse_table, VeristatFields
+
+
+class TestVeristatBench(unittest.TestCase):
+    def test_generate_compare_csv(self):
+        lines = list(generate_compare_csv(1000, seed=1, na_ratio=0.1))
+        self.assertEqual(lines[0], ",".join(VeristatFields.headers()))
+        self.assertEqual(len(lines), 1001)
+        self.assertEqual(lines, list(generate_compare_csv(1000, seed=1, na_ratio=0.1)))
+        self.assertNotEqual(lines, list(generate_compare_csv(1000, seed=2)))
+
+        info = parse_table(lines)
+        self.assertEqual(info.stats.programs, 1000)
+        # About na_ratio of the programs are added or removed
+        self.assertGreater(info.stats.added_or_removed, 50)
+        self.assertLess(info.stats.added_or_removed, 150)
+        self.assertTrue(info.new_failures)
+
+    def test_measure(self):
+        calls = []
+        stats = measure(lambda: calls.append(None), repeat=3)
+        # Timed runs and one under tracemalloc
+        self.assertEqual(len(calls), 4)
+        self.assertLessEqual(stats["seconds"], stats["median_seconds"])
+
+    def test_compare_to_baseline(self):
+        baseline = {
+            "1000": {
+                "summary_bytes": 100,
+                "parse_table": {"seconds": 1.0, "peak_bytes": 1024},
+                "format_table": {"seconds": 1.0, "peak_bytes": 1024},
+            },
+        }
+        results = {
+            "1000": {
+                "summary_bytes": 200,
+                "parse_table": {"seconds": 1.1, "peak_bytes": 1024},
+                "format_table": {"seconds": 1.5, "peak_bytes": 1024},
+                "render_summary": {"seconds": 9.0, "peak_bytes": 1024},
+            },
+            "10000": {"parse_table": {"seconds": 9.0, "peak_bytes": 1024}},
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            slower = compare_to_baseline(results, baseline, tolerance=0.2)
+        # Stages and row counts missing from the baseline are not compared
+        self.assertEqual(slower, ["format_table at 1000 rows: x1.50"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,30 @@
 #!/usr/bin/env python3
 
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
 import unittest
 from typing import Iterable, List
 
-from ..veristat_compare import parse_table, VeristatFields
+from ..veristat_compare import (
+    compare_cross,
+    compare_latency,
+    compare_plan,
+    join_results,
+    get_cross_summary,
+    load_durations,
+    load_metric,
+    parse_table,
+    parse_threshold,
+    render_grouped_summary,
+    Rollup,
+    SUMMARY_FOOTER_RESERVE,
+    Threshold,
+    VeristatFields,
+)
 
 
 def gen_csv_table(records: Iterable[str]) -> List[str]:
@@ -70,6 +91,408 @@ class TestVeristatCompare(unittest.TestCase):
         self.assertTrue(veristat_info.changes)
         self.assertFalse(veristat_info.new_failures)
 
+    def test_parse_table_max_rows(self):
+        table = gen_csv_table(
+            [
+                "prog_file.bpf.o,prog_small,success,success,MATCH,10,11,+1 (+10.00%)",
+                "prog_file.bpf.o,prog_failure,success,failure,MISMATCH,1,1,+0 (+0.00%)",
+                "prog_file.bpf.o,prog_same,success,success,MATCH,1,1,+0 (+0.00%)",
+                "prog_file.bpf.o,prog_large,success,success,MATCH,1,2,+1 (+100.00%)",
+                "prog_file.bpf.o,prog_new,N/A,success,N/A,N/A,1,N/A",
+            ]
+        )
+        veristat_info = parse_table(table, max_rows=2)
+        self.assertEqual(
+            veristat_info.table,
+            [
+                [
+                    "prog_file.bpf.o",
+                    "prog_failure",
+                    "success -> failure (!!)",
+                    "+0.00 %",
+                ],
+                ["prog_file.bpf.o", "prog_large", "success", "+100.00 %"],
+            ],
+        )
+        self.assertEqual(veristat_info.omitted, 1)
+        self.assertTrue(veristat_info.changes)
+        self.assertTrue(veristat_info.new_failures)
+        self.assertEqual(veristat_info.stats.programs, 5)
+        self.assertEqual(veristat_info.stats.added_or_removed, 1)
+        self.assertEqual(veristat_info.stats.new_failures, 1)
+        self.assertEqual(veristat_info.stats.metric_changes["total_states"], 2)
+
+    def test_parse_table_multiple_metrics(self):
+        table = [
+            "file_name,prog_name,verdict_base,verdict_comp,verdict_diff,"
+            "total_insns_base,total_insns_comp,total_insns_diff,"
+            "total_states_base,total_states_comp,total_states_diff",
+            "prog_file.bpf.o,prog_insns,success,success,MATCH,"
+            "100,200,+100 (+100.00%),1,1,+0 (+0.00%)",
+            "prog_file.bpf.o,prog_states,success,success,MATCH,"
+            "100,100,+0 (+0.00%),1,2,+1 (+100.00%)",
+        ]
+        veristat_info = parse_table(table)
+        self.assertEqual(
+            veristat_info.headers,
+            ["File", "Program", "Verdict", "Insns Diff (%)", "States Diff (%)"],
+        )
+        self.assertEqual(
+            veristat_info.table,
+            [["prog_file.bpf.o", "prog_states", "success", "+0.00 %", "+100.00 %"]],
+        )
+        self.assertFalse(veristat_info.regressions)
+
+        veristat_info = parse_table(
+            table, fail_thresholds={"total_insns": Threshold(50, 10)}
+        )
+        self.assertEqual(
+            veristat_info.table,
+            [
+                [
+                    "prog_file.bpf.o",
+                    "prog_insns",
+                    "success",
+                    "+100.00 % (!!)",
+                    "+0.00 %",
+                ],
+                ["prog_file.bpf.o", "prog_states", "success", "+0.00 %", "+100.00 %"],
+            ],
+        )
+        self.assertTrue(veristat_info.regressions)
+        self.assertFalse(veristat_info.new_failures)
+
+    def test_parse_table_unknown_fail_metric(self):
+        with self.assertRaises(ValueError):
+            parse_table(
+                gen_csv_table([]), fail_thresholds={"mem_peak": Threshold(0, 0)}
+            )
+
+    def test_parse_threshold(self):
+        self.assertEqual(
+            parse_threshold("total_insns:1000:5"), ("total_insns", Threshold(1000, 5))
+        )
+        self.assertEqual(
+            parse_threshold("mem_peak::10"), ("mem_peak", Threshold(0, 10))
+        )
+
+    def test_join_results(self):
+        baseline = [
+            "file_name,prog_name,verdict,total_states",
+            "prog_file.bpf.o,prog_same,success,10",
+            "prog_file.bpf.o,prog_failure,success,10",
+            "prog_file.bpf.o,prog_increase,success,10",
+            "prog_file.bpf.o,prog_removed,success,10",
+        ]
+        current = [
+            "file_name,prog_name,verdict,total_states",
+            "prog_file.bpf.o,prog_new,failure,1",
+            "prog_file.bpf.o,prog_increase,success,15",
+            "prog_file.bpf.o,prog_failure,failure,10",
+            "prog_file.bpf.o,prog_same,success,10",
+        ]
+        veristat_info, programs = join_results(baseline, current)
+        self.assertEqual(
+            veristat_info.table,
+            [
+                ["prog_file.bpf.o", "prog_increase", "success", "+50.00 %"],
+                [
+                    "prog_file.bpf.o",
+                    "prog_failure",
+                    "success -> failure (!!)",
+                    "+0.00 %",
+                ],
+            ],
+        )
+        self.assertTrue(veristat_info.new_failures)
+        self.assertEqual(veristat_info.stats.programs, 5)
+        self.assertEqual(programs.added, [("prog_file.bpf.o", "prog_new")])
+        self.assertEqual(programs.removed, [("prog_file.bpf.o", "prog_removed")])
+        self.assertEqual(
+            programs.failed,
+            [("prog_file.bpf.o", "prog_new"), ("prog_file.bpf.o", "prog_failure")],
+        )
+
+    def test_join_results_metrics(self):
+        baseline = [
+            "file_name,prog_name,verdict,duration,total_insns,total_states",
+            "prog_file.bpf.o,prog_a,success,100,10,N/A",
+            "prog_file.bpf.o,prog_b,success,100,10,5",
+        ]
+        current = [
+            "file_name,prog_name,verdict,duration,total_insns,total_states",
+            "prog_file.bpf.o,prog_a,success,900,10,7",
+            "prog_file.bpf.o,prog_b,success,900,20,5",
+        ]
+        # Only the stats with a threshold, the duration noise is ignored
+        veristat_info, _ = join_results(baseline, current)
+        self.assertEqual(veristat_info.metrics, ["total_states"])
+        self.assertEqual(veristat_info.table, [])
+
+        veristat_info, _ = join_results(
+            baseline, current, metrics=["total_insns", "total_states"]
+        )
+        self.assertEqual(veristat_info.metrics, ["total_insns", "total_states"])
+
+        veristat_info, _ = join_results(
+            baseline, current, report_thresholds={"total_insns": Threshold()}
+        )
+        self.assertEqual(
+            veristat_info.table,
+            [["prog_file.bpf.o", "prog_b", "success", "+100.00 %"]],
+        )
+
+    def test_join_results_matches_compare(self):
+        baseline = [
+            "file_name,prog_name,verdict,total_states",
+            "prog_file.bpf.o,prog_zero,success,0",
+            "prog_file.bpf.o,prog_decrease,success,3",
+        ]
+        current = [
+            "file_name,prog_name,verdict,total_states",
+            "prog_file.bpf.o,prog_zero,success,4",
+            "prog_file.bpf.o,prog_decrease,success,2",
+        ]
+        compare = gen_csv_table(
+            [
+                "prog_file.bpf.o,prog_zero,success,success,MATCH,0,4,+4 (+100.00%)",
+                "prog_file.bpf.o,prog_decrease,success,success,MATCH,3,2,-1 (-33.33%)",
+            ]
+        )
+        veristat_info, _ = join_results(baseline, current)
+        self.assertEqual(veristat_info.table, parse_table(compare).table)
+
+    def test_rollup(self):
+        baseline = [
+            "file_name,prog_name,verdict,total_insns",
+            "a.bpf.o,prog_increase,success,100",
+            "a.bpf.o,prog_failure,success,10",
+            "b.bpf.o,prog_removed,success,50",
+        ]
+        current = [
+            "file_name,prog_name,verdict,total_insns",
+            "a.bpf.o,prog_increase,success,200",
+            "a.bpf.o,prog_failure,failure,10",
+            "b.bpf.o,prog_new,success,890",
+        ]
+        records = io.StringIO()
+        rollup = Rollup(records)
+        veristat_info, _ = join_results(
+            baseline, current, rollup=rollup, metrics=["total_insns"]
+        )
+
+        lines = [json.loads(line) for line in records.getvalue().splitlines()]
+        self.assertEqual(
+            lines[0],
+            {
+                "file": "a.bpf.o",
+                "prog": "prog_increase",
+                "verdict_old": "success",
+                "verdict_new": "success",
+                "metrics": {
+                    "total_insns": {"old": 100, "new": 200, "diff": 100, "pct": 100}
+                },
+            },
+        )
+        self.assertEqual(
+            [(line["file"], line["prog"]) for line in lines[2:]],
+            [("b.bpf.o", "prog_new"), ("b.bpf.o", "prog_removed")],
+        )
+
+        result = rollup.to_dict(veristat_info.stats)
+        self.assertEqual(
+            result["files"]["a.bpf.o"],
+            {
+                "programs": 2,
+                "failures": 1,
+                "new_failures": 1,
+                "totals": {"total_insns": 210},
+                "deltas": {"total_insns": 100},
+            },
+        )
+        self.assertEqual(result["files"]["b.bpf.o"]["totals"], {"total_insns": 890})
+        pareto = result["pareto"]
+        self.assertEqual((pareto["metric"], pareto["total"]), ("total_insns", 1100))
+        # The costliest program, at least one, is 81% of the cost
+        self.assertEqual(pareto["shares"][0]["programs"], 1)
+        self.assertAlmostEqual(pareto["shares"][0]["cost_pct"], 890 * 100 / 1100)
+        self.assertEqual(pareto["shares"][-1]["programs"], 2)
+        self.assertEqual(
+            [program["prog"] for program in pareto["top"]],
+            ["prog_new", "prog_increase", "prog_failure"],
+        )
+
+    def test_compare_cross(self):
+        gcc = [
+            "file_name,prog_name,verdict,total_insns",
+            "a.bpf.o,prog_same,success,1000",
+            "a.bpf.o,prog_expensive,success,5000",
+            "a.bpf.o,prog_failure,failure,300",
+            "a.bpf.o,prog_gcc_only,success,10",
+        ]
+        llvm = [
+            "file_name,prog_name,verdict,total_insns",
+            "a.bpf.o,prog_same,success,1050",
+            "a.bpf.o,prog_expensive,success,2000",
+            "a.bpf.o,prog_failure,success,200",
+        ]
+        result_sets = [
+            load_metric(gcc, "total_insns"),
+            load_metric(llvm, "total_insns"),
+        ]
+        changes, common = compare_cross(result_sets)
+        self.assertEqual(
+            [(change.prog_name, change.verdicts) for change in changes],
+            [
+                ("prog_failure", ["failure", "success"]),
+                ("prog_expensive", ["success", "success"]),
+            ],
+        )
+        self.assertEqual(changes[1].spread.absolute, 3000)
+        self.assertEqual(changes[1].spread.percentage, 150)
+        self.assertEqual(changes[1].costliest, 0)
+        self.assertEqual((common.programs, common.totals), (2, [6000, 3050]))
+
+        summary = get_cross_summary(["gcc", "llvm"], "total_insns", changes, common)
+        self.assertIn(
+            "|a.bpf.o|prog_failure  |failure|200 |+0.00 % (!=)          |N/A", summary
+        )
+        # A verdict mismatch is not a new failure, no build is the baseline
+        markup = get_cross_summary(
+            ["gcc", "llvm"], "total_insns", changes, common, markup=True
+        )
+        self.assertIn("+0.00 % :warning:", markup)
+        self.assertNotIn(":bangbang:", markup)
+        self.assertIn(
+            "|a.bpf.o|prog_expensive|5000   |2000|+150.00 %             |gcc", summary
+        )
+        self.assertIn(
+            "2 programs verified by every build: gcc 6000, llvm 3050", summary
+        )
+
+    def test_compare_latency(self):
+        def runs(durations):
+            return [
+                [
+                    "file_name,prog_name,verdict,duration",
+                    *(
+                        f"prog_file.bpf.o,{prog},success,{duration}"
+                        for prog, duration in run.items()
+                    ),
+                ]
+                for run in durations
+            ]
+
+        baseline = load_durations(
+            runs(
+                [
+                    {"prog_slower": 10000, "prog_noisy": 10000, "prog_same": 500},
+                    {"prog_slower": 10500, "prog_noisy": 30000, "prog_same": 510},
+                    {"prog_slower": 9800, "prog_noisy": 9000, "prog_same": 490},
+                    {"prog_slower": 10100, "prog_noisy": 25000, "prog_same": 505},
+                    {"prog_slower": 10000, "prog_noisy": 11000, "prog_same": 500},
+                ]
+            )
+        )
+        candidate = load_durations(
+            runs(
+                [
+                    {"prog_slower": 20000, "prog_noisy": 33000, "prog_same": 900},
+                    {"prog_slower": 21000, "prog_noisy": 9500, "prog_same": 880},
+                    {"prog_slower": 19500, "prog_noisy": 29000, "prog_same": 910},
+                    {"prog_slower": 20500, "prog_noisy": 12000, "prog_same": 890},
+                    {"prog_slower": 20000, "prog_noisy": 31000, "prog_same": 900},
+                ]
+            )
+        )
+        regressions = compare_latency(baseline, candidate)
+        self.assertEqual([r.prog_name for r in regressions], ["prog_slower"])
+        self.assertEqual(regressions[0].median_old, 10000)
+        self.assertEqual(regressions[0].median_new, 20000)
+        self.assertGreater(regressions[0].ci_low, 0)
+
+    def test_compare_latency_min_runs(self):
+        key = ("prog_file.bpf.o", "prog_slower")
+        # One run per side, the bootstrap interval would be [10000, 10000]
+        self.assertEqual(compare_latency({key: [10000]}, {key: [20000]}), [])
+        self.assertEqual(compare_latency({key: [10000] * 5}, {key: [20000] * 4}), [])
+        regressions = compare_latency(
+            {key: [10000] * 4}, {key: [20000] * 5}, min_runs=4
+        )
+        self.assertEqual([r.median_new for r in regressions], [20000])
+
+    def test_render_grouped_summary(self):
+        table = gen_csv_table(
+            [
+                "file_a.bpf.o,prog_small,success,success,MATCH,10,11,+1 (+10.00%)",
+                "file_a.bpf.o,prog_same,success,success,MATCH,1,1,+0 (+0.00%)",
+                "file_b.bpf.o,prog_large,success,success,MATCH,10,110,+100 (+1000.00%)",
+                "file_b.bpf.o,prog_failure,success,failure,MISMATCH,1,1,+0 (+0.00%)",
+                "file_b.bpf.o,prog_medium,success,success,MATCH,10,60,+50 (+500.00%)",
+            ]
+        )
+        full_table = io.StringIO()
+        veristat_info = parse_table(table, table_sink=full_table)
+        self.assertEqual(len(full_table.getvalue().splitlines()), 5)
+
+        summary = render_grouped_summary(veristat_info)
+        self.assertEqual(summary.count("<details>"), 2)
+        self.assertLess(summary.index("file_b.bpf.o"), summary.index("file_a.bpf.o"))
+        self.assertLess(summary.index("prog_failure"), summary.index("prog_large"))
+        self.assertLess(summary.index("prog_large"), summary.index("prog_medium"))
+        self.assertIn("3 of 3 programs changed, 1 new failures, States +150", summary)
+        self.assertIn("1 of 2 programs changed, States +1", summary)
+        self.assertNotIn("more changed programs", summary)
+
+        # Room for the closing tag of the block, not for another row
+        budget = summary.index("prog_medium") + SUMMARY_FOOTER_RESERVE + 20
+        summary = render_grouped_summary(veristat_info, budget=budget)
+        self.assertLessEqual(len(summary.encode()), budget)
+        self.assertIn("prog_large", summary)
+        self.assertNotIn("file_a.bpf.o", summary)
+        self.assertIn("2 more changed programs are not shown", summary)
+
+    def test_compare_plan(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        files = {
+            "veristat-kernel": "file_name,prog_name,verdict,total_states\na,p,failure,1",
+            "base-veristat-kernel": "file_name,prog_name,verdict,total_states\na,p,success,1",
+            "veristat-scx": "file_name,prog_name,verdict,total_states\nb,q,success,2",
+        }
+        for name, data in files.items():
+            with open(os.path.join(tmp, name), "w") as file:
+                file.write(data + "\n")
+        plan = os.path.join(tmp, "plan.json")
+        with open(plan, "w") as file:
+            json.dump(
+                {
+                    "sets": [
+                        {"output": name, "baseline": f"base-{name}"}
+                        for name in ("veristat-kernel", "veristat-scx", "veristat-meta")
+                    ]
+                },
+                file,
+            )
+
+        summary = os.path.join(tmp, "summary.md")
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = compare_plan(plan, summary, results_dir=tmp, baselines_dir=tmp)
+        self.assertEqual(status, 1)
+        with open(summary) as file:
+            text = file.read()
+        self.assertIn("# veristat: 3 object sets, failing: veristat-kernel", text)
+        self.assertIn("## veristat-scx: no baseline, 1 programs, 0 failed", text)
+        self.assertIn("## veristat-meta: not run", text)
+        # The summaries of the sets are nested under their heading
+        headings = [line for line in text.splitlines() if line.startswith("#")]
+        self.assertEqual(headings[0].split(" ")[0], "#")
+        self.assertIn("## veristat-kernel", headings)
+        self.assertEqual(
+            headings[headings.index("## veristat-kernel") + 1].split(" ")[0], "###"
+        )
+        self.assertEqual([h for h in headings[1:] if h.startswith("# ")], [])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+
+from ..veristat_history import (
+    connect,
+    export_snapshot,
+    ingest,
+    resolve_ancestor,
+    series,
+    top_growth,
+)
+
+HEADER = "file_name,prog_name,verdict,total_insns,total_states"
+
+
+class TestVeristatHistory(unittest.TestCase):
+    def setUp(self):
+        self.conn = connect(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def ingest(self, commit, records):
+        return ingest(self.conn, [HEADER, *records], commit, "kernel", created_at=1)
+
+    def test_top_growth(self):
+        self.ingest(
+            "c1", ["a.bpf.o,grow,success,10,10", "a.bpf.o,shrink,success,10,10"]
+        )
+        self.ingest("c2", ["a.bpf.o,grow,success,10,15", "a.bpf.o,shrink,success,10,5"])
+        self.ingest("c3", ["a.bpf.o,grow,success,10,30", "a.bpf.o,shrink,success,10,1"])
+
+        self.assertEqual(
+            top_growth(self.conn, "kernel", last=3),
+            [("a.bpf.o", "grow", 10, 30, 20)],
+        )
+        self.assertEqual(
+            top_growth(self.conn, "kernel", last=2),
+            [("a.bpf.o", "grow", 15, 30, 15)],
+        )
+        self.assertEqual(top_growth(self.conn, "meta", last=3), [])
+
+    def test_series(self):
+        self.ingest("c1", ["a.bpf.o,prog,success,10,10"])
+        self.ingest("c2", ["a.bpf.o,prog,failure,N/A,12"])
+
+        self.assertEqual(
+            series(self.conn, "kernel", "a.bpf.o", "prog"),
+            [
+                ("c1", 1, 1, None, 10, 10, None, None),
+                ("c2", 1, 0, None, None, 12, None, None),
+            ],
+        )
+        self.assertEqual(len(series(self.conn, "kernel", "a.bpf.o", "prog", last=1)), 1)
+
+    def test_reingest_replaces_snapshot(self):
+        self.ingest("c1", ["a.bpf.o,prog,success,10,10"])
+        self.assertEqual(self.ingest("c1", ["a.bpf.o,prog,success,10,11"]), 1)
+
+        self.assertEqual(
+            [row[5] for row in series(self.conn, "kernel", "a.bpf.o", "prog")], [11]
+        )
+
+    def test_resolve_ancestor(self):
+        self.ingest("c1", ["a.bpf.o,prog,success,10,10"])
+        self.ingest("c3", ["a.bpf.o,prog,success,10,11"])
+
+        # Nearest first, c5 and c4 have no snapshot
+        distance, commit, snapshot_id = resolve_ancestor(
+            self.conn, "kernel", ["c5", "c4", "c3", "c2", "c1"]
+        )
+        self.assertEqual((distance, commit), (2, "c3"))
+        self.assertIsNone(resolve_ancestor(self.conn, "kernel", ["c5", "c4"]))
+        self.assertIsNone(resolve_ancestor(self.conn, "meta", ["c3"]))
+
+        csv_file = io.StringIO()
+        self.assertEqual(export_snapshot(self.conn, snapshot_id, csv_file), 1)
+        self.assertEqual(
+            csv_file.getvalue().splitlines(),
+            [
+                "file_name,prog_name,verdict,total_insns,total_states",
+                "a.bpf.o,prog,success,10,11",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from ..veristat_log_diff import diff_logs
+
+OLD_LOG = """\
+PROCESSING prog.bpf.o/prog, DURATION US: 10, VERDICT: success, VERIFIER LOG:
+func#0 @0
+0: (bf) r6 = r1                       ; R1=ctx() R6_w=ctx()
+1: (b7) r0 = 0                        ; R0_w=0
+2: (15) if r6 == 0x0 goto pc+1
+3: (95) exit
+verification time 12 usec
+stack depth 0
+processed 4 insns (limit 1000000) max_states_per_insn 0 total_states 0
+"""
+
+NEW_LOG = """\
+PROCESSING prog.bpf.o/prog, DURATION US: 12, VERDICT: failure, VERIFIER LOG:
+func#0 @0
+0: (bf) r6 = r1  ; R1=ctx() R6_w=ctx()
+1: (b7) r0 = 1                        ; R0_w=1
+2: (15) if r6 == 0x0 goto pc+1
+R1 invalid mem access 'scalar'
+verification time 15 usec
+stack depth 0+8
+processed 3 insns (limit 1000000) max_states_per_insn 0 total_states 0
+"""
+
+
+class TestVeristatLogDiff(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_log(self, name: str, content: str) -> str:
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def test_diff_logs(self):
+        diff = diff_logs(
+            self.write_log("old.log", OLD_LOG), self.write_log("new.log", NEW_LOG), 1
+        )
+        self.assertEqual(diff.divergence, 2)
+        self.assertEqual((diff.old_lineno, diff.new_lineno), (4, 4))
+        self.assertEqual(
+            diff.context,
+            [
+                ("0: (bf) r6 = r1 ; R1=ctx() R6_w=ctx()",) * 2,
+                ("1: (b7) r0 = 0 ; R0_w=0", "1: (b7) r0 = 1 ; R0_w=1"),
+                ("2: (15) if r6 == 0x0 goto pc+1",) * 2,
+            ],
+        )
+        self.assertEqual(diff.old.processed, 4)
+        self.assertEqual(diff.old.instructions, 4)
+        self.assertEqual(diff.new.processed, 3)
+        self.assertEqual(diff.new.error, "R1 invalid mem access 'scalar'")
+        self.assertEqual(diff.old.verdict, "success")
+        self.assertIsNone(diff.old.error)
+
+    def test_diff_logs_success(self):
+        # A raw log, without PROCESSING line, with source annotations
+        log = """\
+func#0 @0
+; int prog(void *ctx) @ prog.c:10
+0: (b7) r0 = 0                        ; R0_w=0
+; return 0; @ prog.c:12
+1: (95) exit
+processed 2 insns (limit 1000000) max_states_per_insn 0 total_states 0
+"""
+        diff = diff_logs(
+            self.write_log("old.log", log), self.write_log("new.log", NEW_LOG)
+        )
+        self.assertIsNone(diff.old.verdict)
+        self.assertIsNone(diff.old.error)
+        self.assertIn("processed 2 insns, error: none", diff.report())
+
+    def test_diff_logs_identical(self):
+        diff = diff_logs(
+            self.write_log("old.log", OLD_LOG), self.write_log("new.log", OLD_LOG)
+        )
+        self.assertIsNone(diff.divergence)
+        self.assertIn("identical", diff.report())
+
+    def test_diff_logs_empty(self):
+        diff = diff_logs(
+            self.write_log("old.log", ""), self.write_log("new.log", OLD_LOG)
+        )
+        self.assertEqual(diff.divergence, 1)
+        self.assertEqual(diff.context[0][0], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
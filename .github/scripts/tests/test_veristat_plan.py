@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from ..veristat_plan import load_sets, parse_cfg, render_script
+
+CONFIGS = os.path.join(os.path.dirname(__file__), "../../../ci/vmtest/configs")
+
+# Stands in for veristat, lists the objects it was given
+FAKE_VERISTAT = """#!/bin/bash
+echo file_name,prog_name,verdict
+for object in "$@"; do
+    [[ "$object" == *.o ]] && echo "$object,prog,success"
+done
+"""
+
+
+class TestVeristatPlan(unittest.TestCase):
+    def test_parse_cfg(self):
+        self.assertEqual(
+            parse_cfg(['VERISTAT_OBJECTS_DIR="${SELFTESTS_BPF}"\n', "# comment\n"]),
+            {"VERISTAT_OBJECTS_DIR": "${SELFTESTS_BPF}"},
+        )
+
+    def test_load_repo_sets(self):
+        sets = load_sets(CONFIGS, baseline_prefix="x86_64-gcc-baseline-")
+        self.assertEqual([s.target for s in sets], ["cilium", "kernel", "meta", "scx"])
+        kernel = sets[1]
+        self.assertEqual(kernel.objects_dir, "${SELFTESTS_BPF}")
+        self.assertEqual(kernel.cfg_file, "${SELFTESTS_BPF}/veristat.cfg")
+        self.assertEqual(kernel.baseline, "x86_64-gcc-baseline-veristat-kernel")
+        with self.assertRaises(ValueError):
+            load_sets(CONFIGS, targets=["nope"])
+
+    def test_script(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        selftests = os.path.join(tmp, "selftests")
+        os.makedirs(selftests)
+        for name in ("a.bpf.o", "b.bpf.o", "c.o"):
+            open(os.path.join(selftests, name), "w").close()
+        veristat = os.path.join(tmp, "veristat")
+        with open(veristat, "w") as file:
+            file.write(FAKE_VERISTAT)
+        os.chmod(veristat, 0o755)
+
+        script = os.path.join(tmp, "run.sh")
+        with open(script, "w") as file:
+            file.write(render_script(load_sets(CONFIGS, targets=["kernel", "scx"])))
+        env = dict(
+            os.environ,
+            OUTPUT_DIR=tmp,
+            SELFTESTS_BPF=selftests,
+            VERISTAT=veristat,
+            SCX_BUILD_OUTPUT=os.path.join(tmp, "missing"),
+        )
+        subprocess.run(["bash", script], env=env, check=True, capture_output=True)
+
+        with open(os.path.join(tmp, "veristat-kernel")) as file:
+            self.assertEqual(
+                file.read().splitlines(),
+                [
+                    "file_name,prog_name,verdict",
+                    "a.bpf.o,prog,success",
+                    "b.bpf.o,prog,success",
+                ],
+            )
+        self.assertFalse(os.path.exists(os.path.join(tmp, "veristat-scx")))
+
+
+if __name__ == "__main__":
+    unittest.main()
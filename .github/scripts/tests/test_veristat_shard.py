@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..veristat_shard import (
+    merge,
+    object_costs,
+    pack_shards,
+    parse_cfg,
+    shard_cfg,
+    split,
+)
+
+BASELINE = [
+    "file_name,prog_name,verdict,duration,total_insns",
+    "big.bpf.o,a,success,900,900",
+    "big.bpf.o,b,success,N/A,100",
+    "mid.bpf.o,c,success,500,500",
+    "small.bpf.o,d,success,100,100",
+    "tiny.bpf.o,e,failure,50,50",
+]
+
+CFG = [
+    "# comment",
+    "big.bpf.o",
+    "mid.bpf.o/c",
+    "small*",
+    "!small.bpf.o/skipped",
+    "!tiny.bpf.o",
+]
+
+
+class TestVeristatShard(unittest.TestCase):
+    def test_object_costs(self):
+        # b has no duration, it is costed by its insns at 1us per insn
+        self.assertEqual(
+            object_costs(BASELINE),
+            {"big.bpf.o": 1000, "mid.bpf.o": 500, "small.bpf.o": 100, "tiny.bpf.o": 50},
+        )
+
+    def test_pack_shards(self):
+        # "new" has no cost, it gets the median 5.5
+        costs = {"a": 10, "b": 6, "c": 5, "d": 4}
+        self.assertEqual(
+            pack_shards(["a", "b", "c", "d", "new"], costs, 2),
+            [(15.0, ["a", "c"]), (15.5, ["b", "d", "new"])],
+        )
+
+    def test_shard_cfg(self):
+        entries = parse_cfg(CFG)
+        self.assertEqual(
+            shard_cfg(["mid.bpf.o", "small.bpf.o"], entries),
+            ["mid.bpf.o/c", "small.bpf.o", "!small.bpf.o/skipped", "!tiny.bpf.o"],
+        )
+
+    def test_split(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        objects = ["tiny.bpf.o", "small.bpf.o", "mid.bpf.o", "big.bpf.o", "x.bpf.o"]
+        plan = split(objects, parse_cfg(CFG), object_costs(BASELINE), 2, tmp)
+        # x.bpf.o is matched by no entry, tiny.bpf.o is excluded
+        self.assertEqual(plan.objects, ["big.bpf.o", "mid.bpf.o", "small.bpf.o"])
+        self.assertEqual(
+            [shard.objects for shard in plan.shards],
+            [["big.bpf.o"], ["mid.bpf.o", "small.bpf.o"]],
+        )
+        with open(plan.shards[1].cfg) as file:
+            self.assertEqual(file.readline(), "mid.bpf.o/c\n")
+
+    def test_split_no_empty_shards(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan = split(["a.o", "b.o"], parse_cfg(["!x*"]), {}, 3, tmp)
+        # A shard cfg with only the exclusions would verify every object
+        self.assertEqual([shard.objects for shard in plan.shards], [["a.o"], ["b.o"]])
+        self.assertEqual(sorted(os.listdir(tmp)), ["shard-0.cfg", "shard-1.cfg"])
+        with open(plan.shards[1].cfg) as file:
+            self.assertEqual(file.read(), "b.o\n!x*\n")
+
+    def test_merge_restores_single_run_order(self):
+        header = "file_name,prog_name,verdict\n"
+        single = [header, "a.o,p2,success\n", "a.o,p1,success\n", "b.o,p,success\n"]
+        shards = [[header, "b.o,p,success\n"], [header, single[1], single[2]]]
+        self.assertEqual(merge(["a.o", "b.o"], shards), "".join(single))
+        with self.assertRaises(ValueError):
+            merge(["a.o"], [[header], ["file_name,prog_name\n"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# Benchmarks veristat_compare.py stages on synthetic comparison CSVs.
+#
+# For every requested row count, a seeded generator produces a veristat
+# --compare CSV (file,prog,verdict,states) with configurable ratios of
+# verdict mismatches, N/A (added/removed) programs and new failures. Each
+# stage is timed over --repeat runs, keeping the best one as the least
+# disturbed by other load, then run again under tracemalloc for its peak
+# memory:
+#
+#   parse_table             streaming the CSV into a VeristatInfo
+#   get_state_diff          parsing the states diff column
+#   format_table            rendering a table with as many rows
+#   github_markup_decorate  decorating that table
+#   render_summary          the size-budgeted step summary
+#
+# Usage, from the .github directory as it imports veristat_compare:
+#
+#   python3 -m scripts.veristat_bench --rows 1000 100000 1000000 --save bench.json
+#   python3 -m scripts.veristat_bench --rows 1000 100000 --baseline bench.json
+#
+# With --baseline, results are compared to a stored JSON and the script exits
+# with 1 if any stage became slower by more than --tolerance.
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Final, Iterator, List
+
+from .veristat_compare import (
+    VeristatFields,
+    format_table,
+    get_state_diff,
+    github_markup_decorate,
+    parse_table,
+)
+
+DEFAULT_ROWS: Final[List[int]] = [1000, 10000, 100000]
+DEFAULT_TOLERANCE: Final[float] = 0.2
+DEFAULT_REPEAT: Final[int] = 5
+
+
+def generate_compare_csv(
+    rows: int,
+    seed: int = 0,
+    mismatch_ratio: float = 0.01,
+    na_ratio: float = 0.01,
+    failure_ratio: float = 0.005,
+    change_ratio: float = 0.1,
+    progs_per_file: int = 20,
+) -> Iterator[str]:
+    """
+    Yield the lines of a synthetic `veristat --compare` CSV.
+    """
+    rng = random.Random(seed)
+    yield ",".join(VeristatFields.headers())
+    for idx in range(rows):
+        file_name = f"file_{idx // progs_per_file}.bpf.o"
+        prog_name = f"prog_{idx}"
+        states_old = rng.randint(1, 100000)
+
+        roll = rng.random()
+        if roll < na_ratio:
+            if rng.random() < 0.5:
+                yield f"{file_name},{prog_name},N/A,success,N/A,N/A,{states_old},N/A"
+            else:
+                yield f"{file_name},{prog_name},success,N/A,N/A,{states_old},N/A,N/A"
+            continue
+
+        verdict_old = verdict_new = "success"
+        roll -= na_ratio
+        if roll < failure_ratio:
+            verdict_new = "failure"
+        elif roll < failure_ratio + mismatch_ratio:
+            verdict_old = "failure"
+
+        states_new = states_old
+        if rng.random() < change_ratio:
+            states_new = max(0, states_old + rng.randint(-states_old // 2, states_old))
+        diff = states_new - states_old
+        verdict_diff = "MATCH" if verdict_old == verdict_new else "MISMATCH"
+        yield (
+            f"{file_name},{prog_name},{verdict_old},{verdict_new},{verdict_diff},"
+            f"{states_old},{states_new},{diff:+d} ({diff * 100.0 / states_old:+.2f}%)"
+        )
+
+
+def measure(stage: Callable[[], Any], repeat: int = DEFAULT_REPEAT) -> Dict[str, float]:
+    """Best wall time of `repeat` runs and the peak memory of one more."""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        elapsed.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": min(elapsed),
+        "median_seconds": statistics.median(elapsed),
+        "peak_bytes": peak,
+    }
+
+
+def run_benchmarks(
+    rows: int, seed: int, repeat: int = DEFAULT_REPEAT, **ratios: float
+) -> Dict[str, Any]:
+    def generate() -> Iterator[str]:
+        return generate_compare_csv(rows, seed, **ratios)
+
+    diffs = [line.rsplit(",", 1)[1] for line in generate()][1:]
+    info = parse_table(generate())
+    table = [
+        [f"file_{idx // 20}.bpf.o", f"prog_{idx}", "success", f"{idx % 200:+.2f} %"]
+        for idx in range(rows)
+    ]
+    formatted = format_table(info.headers, table)
+
+    stages = {
+        "parse_table": lambda: parse_table(generate()),
+        "get_state_diff": lambda: [get_state_diff(diff) for diff in diffs],
+        "format_table": lambda: format_table(info.headers, table),
+        "github_markup_decorate": lambda: github_markup_decorate(formatted),
+        "render_summary": lambda: info.get_results_summary(markup=True),
+    }
+
+    results: Dict[str, Any] = {
+        "summary_bytes": len(info.get_results_summary(markup=True).encode()),
+    }
+    for name, stage in stages.items():
+        stats = measure(stage, repeat)
+        stats["rows_per_second"] = rows / stats["seconds"] if stats["seconds"] else 0
+        results[name] = stats
+    return results
+
+
+def compare_to_baseline(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Stages that got slower than the baseline by more than `tolerance`.
+    """
+    slower = []
+    for rows, stages in results.items():
+        for name, stats in stages.items():
+            if not isinstance(stats, dict):
+                continue
+            old = baseline.get(rows, {}).get(name)
+            if not old or not old["seconds"]:
+                continue
+            ratio = stats["seconds"] / old["seconds"]
+            print(
+                f"{rows:>8} rows {name:<24} {stats['seconds']:.4f}s "
+                f"(baseline {old['seconds']:.4f}s, x{ratio:.2f}) "
+                f"peak {stats['peak_bytes'] / 1024:.0f}KiB "
+                f"(baseline {old['peak_bytes'] / 1024:.0f}KiB)"
+            )
+            if ratio > 1.0 + tolerance:
+                slower.append(f"{name} at {rows} rows: x{ratio:.2f}")
+    return slower
+
+
+def main(args: argparse.Namespace) -> int:
+    results = {
+        str(rows): run_benchmarks(
+            rows,
+            args.seed,
+            repeat=args.repeat,
+            mismatch_ratio=args.mismatch_ratio,
+            na_ratio=args.na_ratio,
+            failure_ratio=args.failure_ratio,
+        )
+        for rows in args.rows
+    }
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if not args.baseline:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    slower = compare_to_baseline(results, baseline, args.tolerance)
+    if slower:
+        print("Slower than baseline: " + ", ".join(slower))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark veristat_compare.py on synthetic veristat CSVs"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="Timed runs of every stage, the best one is kept",
+    )
+    parser.add_argument("--mismatch-ratio", type=float, default=0.01)
+    parser.add_argument("--na-ratio", type=float, default=0.01)
+    parser.add_argument("--failure-ratio", type=float, default=0.005)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare results to this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative slowdown against the baseline",
+    )
+    sys.exit(main(parser.parse_args()))
@@ -10,14 +10,51 @@
 # The summary is printed to standard output and appended to a file
 # pointed to by GITHUB_STEP_SUMMARY variable.
 #
+# Any --emit column set is accepted, the schema is detected from the CSV
+# header. Every emitted stat other than file and program name comes as a
+# triplet of '<stat>_base', '<stat>_comp' and '<stat>_diff' columns.
+#
+# Alternatively, with --baseline BASELINE, the script reads two plain
+# veristat CSVs (as emitted without --compare) and joins them on
+# (file_name, prog_name) itself, so no veristat binary is needed. Only the
+# stats with a --threshold or --fail-on are compared then (total_states by
+# default), as `--emit file,prog,verdict,states` would; more with --metric.
+#
+# With --latency-baseline and --latency-candidate, each taking the plain
+# CSVs of several repeated runs with the duration stat, a separate
+# verification latency table lists programs whose median duration grew
+# significantly, see compare_latency(). Programs with fewer than
+# LATENCY_MIN_RUNS runs on either side are not compared.
+#
+# With --records FILE, every compared program is also written to FILE as
+# one JSON object per line (NDJSON), and with --rollup FILE per object file
+# aggregates and a Pareto breakdown of verification cost (which share of
+# the cost the costliest 1%, 5%, ... of the programs account for) are
+# written as JSON. Both come out of the same pass over the CSV as the
+# markdown summary, see Rollup.
+#
+# With --cross LABEL=CSV given for two or more plain veristat CSVs of the
+# same objects built differently, e.g. x86_64-gcc=... x86_64-llvm=... or
+# x86_64-llvm=... aarch64-llvm=... s390x-llvm=..., the result sets are
+# joined on (file_name, prog_name) and programs whose verification cost
+# differs between the builds beyond --cross-threshold (default
+# total_insns:100:25) or whose verdict differs are listed instead, see
+# compare_cross(). Builds disagreeing on the verdict are marked (!=), not
+# with the (!!) of new failures and regressions: no build is the baseline.
+#
+# With --plan PLAN, the plan written by veristat_plan.py, every object set
+# of a single-boot veristat run (kernel, meta, scx, cilium) is joined
+# against its own baseline in one process, and the summaries of all sets
+# go into one combined summary, see compare_plan().
+#
 # Script exits with return code 1 if there are new failures in the
-# veristat results.
+# veristat results, or if a metric grew beyond a --fail-on threshold.
 #
 # For testing purposes invoke as follows:
 #
 #  GITHUB_STEP_SUMMARY=/dev/null python3 veristat-compare.py test.csv
 #
-# File format (columns):
+# File format for the default --emit file,prog,verdict,states (columns):
 #  0. file_name
 #  1. prog_name
 #  2. verdict_base
@@ -36,25 +73,90 @@
 # names etc.
 
 import io
+import json
 import os
 import sys
 import re
 import csv
+import heapq
 import logging
+import math
+import random
+import statistics
 import argparse
+import contextlib
 import enum
-from dataclasses import dataclass
-from typing import Dict, Iterable, List, Final
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Final, Optional, TextIO, Tuple
 
 TRESHOLD_PCT: Final[int] = 0
 
+# Upper bound on the number of rows kept for the summary table. Comparison
+# CSVs can have tens of thousands of programs, only the most significant
+# changes are kept, the rest are only counted.
+MAX_TABLE_ROWS: Final[int] = 1000
+
+# GitHub drops step summaries larger than 1MiB. Leave room for other tables
+# of the same step, e.g. verification latency.
+SUMMARY_BUDGET: Final[int] = 768 * 1024
+SUMMARY_FOOTER_RESERVE: Final[int] = 128
+
+# Within the same verdict change, rows are ranked by the absolute change of
+# this metric, then by the largest relative change of any metric.
+RANK_METRIC: Final[str] = "total_states"
+
 SUMMARY_HEADERS = ["File", "Program", "Verdict", "States Diff (%)"]
 
 # expected format: +0 (+0.00%) / -0 (-0.00%)
 TOTAL_STATES_DIFF_REGEX = (
     r"(?P<absolute_diff>[+-]\d+) \((?P<percentage_diff>[+-]\d+\.\d+)\%\)"
 )
+TOTAL_STATES_DIFF_RE: Final[re.Pattern] = re.compile(TOTAL_STATES_DIFF_REGEX)
 
+COMPARE_SUFFIX_OLD: Final[str] = "_base"
+COMPARE_SUFFIX_NEW: Final[str] = "_comp"
+COMPARE_SUFFIX_DIFF: Final[str] = "_diff"
+
+# Stats veristat emits as strings, their diff column is MATCH/MISMATCH.
+# Only the verdict is used, the rest are skipped.
+VERDICT_STAT: Final[str] = "verdict"
+STRING_STATS: Final[List[str]] = [VERDICT_STAT, "prog_type", "attach_type"]
+
+# Column titles for the summary table, other metrics use their CSV name.
+METRIC_TITLES: Final[Dict[str, str]] = {
+    "duration": "Duration",
+    "total_insns": "Insns",
+    "total_states": "States",
+    "peak_states": "Peak States",
+    "mem_peak": "Memory Peak",
+}
+
+# Verification cost for the Pareto breakdown of --rollup, the first of these
+# metrics present in the results
+COST_METRICS: Final[List[str]] = ["total_insns", "total_states", "duration"]
+# Shares of the costliest programs the breakdown reports
+PARETO_FRACTIONS: Final[List[float]] = [0.01, 0.05, 0.10, 0.20, 0.50]
+# Costliest programs listed by name in the breakdown
+PARETO_TOP_PROGRAMS: Final[int] = 20
+
+# Verification duration is wall-clock time, so it is only compared across
+# repeated runs: a regression has to exceed the threshold on medians and the
+# bootstrap confidence interval of the growth has to exclude zero.
+LATENCY_METRIC: Final[str] = "duration"
+LATENCY_CONFIDENCE: Final[float] = 0.95
+LATENCY_BOOTSTRAP_SAMPLES: Final[int] = 1000
+# With fewer runs, bootstrap resamples barely vary and the confidence
+# interval shrinks to the point estimate: one noisy run would be significant
+LATENCY_MIN_RUNS: Final[int] = 5
+LATENCY_TITLE: Final[str] = "Verification latency"
+LATENCY_HEADERS: Final[List[str]] = [
+    "File",
+    "Program",
+    "Baseline (us)",
+    "Candidate (us)",
+    "Diff (%)",
+    "95% CI (us)",
+]
 
 TEXT_SUMMARY_TEMPLATE: Final[str] = """
 # {title}
@@ -62,6 +164,14 @@ TEXT_SUMMARY_TEMPLATE: Final[str] = """
 {table}
 """.strip()
 
+GROUP_SUMMARY_TEMPLATE: Final[str] = """
+<details>
+<summary>{file_name}: {totals}</summary>
+
+{table}
+</details>
+"""
+
 HTML_SUMMARY_TEMPLATE: Final[str] = """
 # {title}
 
@@ -75,9 +185,12 @@ HTML_SUMMARY_TEMPLATE: Final[str] = """
 GITHUB_MARKUP_REPLACEMENTS: Final[Dict[str, str]] = {
     "->": "&rarr;",
     "(!!)": ":bangbang:",
+    "(!=)": ":warning:",
 }
 
 NEW_FAILURE_SUFFIX: Final[str] = "(!!)"
+REGRESSION_SUFFIX: Final[str] = "(!!)"
+VERDICT_MISMATCH_SUFFIX: Final[str] = "(!=)"
 
 
 class VeristatFields(str, enum.Enum):
@@ -104,98 +217,1125 @@ class VeristatFields(str, enum.Enum):
         ]
 
 
+@dataclass(frozen=True)
+class MetricDiff:
+    absolute: float = 0.0
+    percentage: float = 0.0
+
+
+@dataclass(frozen=True)
+class Threshold:
+    """
+    A change is significant when both its absolute and relative values are
+    above the limits.
+    """
+
+    absolute: float = 0.0
+    percentage: float = 0.0
+
+    def exceeded_by(self, diff: MetricDiff) -> bool:
+        return (
+            abs(diff.absolute) > self.absolute
+            and abs(diff.percentage) > self.percentage
+        )
+
+    def regressed_by(self, diff: MetricDiff) -> bool:
+        return diff.absolute > self.absolute and diff.percentage > self.percentage
+
+
+# Metrics for which a change is listed in the summary table by default
+REPORT_THRESHOLDS: Final[Dict[str, Threshold]] = {
+    "total_states": Threshold(percentage=TRESHOLD_PCT),
+}
+
+# Minimal growth of the median duration considered a latency regression
+LATENCY_THRESHOLD: Final[Threshold] = Threshold(absolute=1000, percentage=10)
+
+# Minimal spread of a program's cost between builds considered worth listing,
+# from the cheapest build to the costliest one
+CROSS_METRIC: Final[str] = "total_insns"
+CROSS_THRESHOLD: Final[Threshold] = Threshold(absolute=100, percentage=25)
+CROSS_TITLE: Final[str] = "Verification cost across builds"
+
+
+@dataclass(frozen=True)
+class StatColumns:
+    name: str
+    old: int
+    new: int
+    diff: int
+
+
+@dataclass(frozen=True)
+class CompareSchema:
+    """
+    Column positions of a `veristat --compare` CSV, detected from its header.
+    """
+
+    file_name: int
+    prog_name: int
+    verdict: Optional[StatColumns]
+    metrics: List[StatColumns]
+
+    @classmethod
+    def from_header(cls, header: List[str]) -> "CompareSchema":
+        column = {name: idx for idx, name in enumerate(header)}
+        for name in (VeristatFields.FILE_NAME.value, VeristatFields.PROG_NAME.value):
+            if name not in column:
+                raise ValueError(f"Missing '{name}' column in header: {header}")
+
+        stats = []
+        for name in header:
+            if not name.endswith(COMPARE_SUFFIX_OLD):
+                continue
+            stat = name[: -len(COMPARE_SUFFIX_OLD)]
+            try:
+                stats.append(
+                    StatColumns(
+                        name=stat,
+                        old=column[stat + COMPARE_SUFFIX_OLD],
+                        new=column[stat + COMPARE_SUFFIX_NEW],
+                        diff=column[stat + COMPARE_SUFFIX_DIFF],
+                    )
+                )
+            except KeyError as e:
+                raise ValueError(f"Incomplete columns for '{stat}': {header}") from e
+
+        verdict = next((s for s in stats if s.name == VERDICT_STAT), None)
+        return cls(
+            file_name=column[VeristatFields.FILE_NAME.value],
+            prog_name=column[VeristatFields.PROG_NAME.value],
+            verdict=verdict,
+            metrics=[s for s in stats if s.name not in STRING_STATS],
+        )
+
+    def metric_names(self) -> List[str]:
+        return [metric.name for metric in self.metrics]
+
+
+def summary_headers(metrics: List[str]) -> List[str]:
+    return SUMMARY_HEADERS[:3] + [
+        f"{METRIC_TITLES.get(metric, metric)} Diff (%)" for metric in metrics
+    ]
+
+
+@dataclass
+class VeristatStats:
+    """
+    Running counters over all records of the comparison, including the ones
+    that did not make it into the summary table.
+    """
+
+    programs: int = 0
+    added_or_removed: int = 0
+    verdict_changes: int = 0
+    new_failures: int = 0
+    regressions: int = 0
+    metric_changes: Dict[str, int] = field(default_factory=dict)
+
+
+class TopChanges:
+    """
+    Bounded collection of the most significant table rows.
+
+    Rows are kept in a min-heap keyed by significance, so memory stays
+    proportional to `limit` regardless of the number of pushed rows. On ties
+    the earlier row wins, and `rows()` returns the survivors in input order.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.seen = 0
+        self._heap: List[Tuple[Any, int, List[str]]] = []
+
+    def push(self, significance: Any, row: List[str]) -> None:
+        item = (significance, -self.seen, row)
+        self.seen += 1
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, item)
+        elif self.limit > 0:
+            heapq.heappushpop(self._heap, item)
+
+    @property
+    def omitted(self) -> int:
+        return self.seen - len(self._heap)
+
+    def rows(self) -> List[List[str]]:
+        return [row for _, _, row in sorted(self._heap, key=lambda item: -item[1])]
+
+    def ranked_rows(self) -> List[List[str]]:
+        """
+        Kept rows, most significant first.
+        """
+        return [row for _, _, row in sorted(self._heap, reverse=True)]
+
+
+@dataclass
+class FileTotals:
+    """
+    Per object file aggregates over all compared programs of the file.
+    """
+
+    programs: int = 0
+    changes: int = 0
+    new_failures: int = 0
+    # Sum of absolute diffs, one per metric
+    deltas: List[float] = field(default_factory=list)
+
+
 @dataclass
 class VeristatInfo:
     table: list
     changes: bool
     new_failures: bool
+    omitted: int = 0
+    stats: VeristatStats = field(default_factory=VeristatStats)
+    headers: List[str] = field(default_factory=lambda: list(SUMMARY_HEADERS))
+    regressions: bool = False
+    # Same rows as `table`, most significant first
+    ranked_table: list = field(default_factory=list)
+    metrics: List[str] = field(default_factory=list)
+    file_totals: Dict[str, FileTotals] = field(default_factory=dict)
 
     def get_results_title(self) -> str:
         if self.new_failures:
             return "There are new veristat failures"
 
+        if self.regressions:
+            return "There are veristat regressions above thresholds"
+
         if self.changes:
             return "There are changes in verification performance"
 
         return "No changes in verification performance"
 
-    def get_results_summary(self, markup: bool = False) -> str:
+    def get_results_summary(
+        self, markup: bool = False, budget: int = SUMMARY_BUDGET
+    ) -> str:
+        """
+        Plain text summary, or GitHub markup grouped per object file and
+        limited to `budget` bytes.
+        """
         title = self.get_results_title()
         if not self.table:
             return f"# {title}\n"
 
-        template = TEXT_SUMMARY_TEMPLATE
-        table = format_table(headers=SUMMARY_HEADERS, rows=self.table)
-
         if markup:
-            template = HTML_SUMMARY_TEMPLATE
-            table = github_markup_decorate(table)
+            return render_grouped_summary(self, budget)
 
-        return template.format(title=title, table=table)
+        table = format_table(headers=self.headers, rows=self.table)
 
+        if self.omitted:
+            table += f"\n{self.omitted} less significant changes are not shown\n"
 
-def get_state_diff(value: str) -> float:
-    if value == "N/A":
-        return 0.0
+        return TEXT_SUMMARY_TEMPLATE.format(title=title, table=table)
 
-    matches = re.match(TOTAL_STATES_DIFF_REGEX, value)
-    if not matches:
-        raise ValueError(f"Failed to parse total states diff field value '{value}'")
+    def describe_file_totals(self, file_name: str) -> str:
+        totals = self.file_totals.get(file_name, FileTotals())
+        parts = [f"{totals.changes} of {totals.programs} programs changed"]
+        if totals.new_failures:
+            parts.append(f"{totals.new_failures} new failures")
+        for metric, delta in zip(self.metrics, totals.deltas):
+            if delta:
+                parts.append(f"{METRIC_TITLES.get(metric, metric)} {delta:+.0f}")
+        return ", ".join(parts)
 
-    if percentage_diff := matches.group("percentage_diff"):
-        return float(percentage_diff)
 
-    raise ValueError(f"Invalid {VeristatFields.TOTAL_STATES_DIFF} field value: {value}")
+# Old and new value of every metric of a program, None where not available
+MetricValues = List[Tuple[Optional[float], Optional[float]]]
 
 
-def parse_table(csv_file: Iterable[str]) -> VeristatInfo:
-    reader = csv.DictReader(csv_file)
-    assert reader.fieldnames == VeristatFields.headers()
+@dataclass
+class ObjectRollup:
+    """
+    Per object file aggregates over all programs of the file, unlike
+    FileTotals also the added and removed ones.
+    """
 
-    new_failures = False
-    changes = False
-    table = []
+    programs: int = 0
+    failures: int = 0
+    new_failures: int = 0
+    # Sums of the new values, one per metric
+    totals: List[float] = field(default_factory=list)
+    # Sums of the differences, one per metric
+    deltas: List[float] = field(default_factory=list)
 
-    for record in reader:
-        add = False
 
-        verdict_old, verdict_new = (
-            record[VeristatFields.VERDICT_OLD],
-            record[VeristatFields.VERDICT_NEW],
+class Rollup:
+    """
+    Machine readable output of a comparison, fed by VeristatAccumulator in
+    the same pass as the summary table: per program records written to
+    `records` as NDJSON, per object aggregates and the distribution of
+    verification cost over programs.
+    """
+
+    def __init__(self, records: Optional[TextIO] = None) -> None:
+        self.records = records
+        self.metrics: List[str] = []
+        self.files: Dict[str, ObjectRollup] = {}
+        self.cost_metric: Optional[str] = None
+        self.cost_idx: Optional[int] = None
+        self.costs: List[float] = []
+        self.top: List[Tuple[float, str, str]] = []
+
+    def start(self, metrics: List[str]) -> None:
+        """Called with the metrics of the results before the first add()."""
+        self.metrics = metrics
+        self.cost_metric = next((m for m in COST_METRICS if m in metrics), None)
+        if self.cost_metric is not None:
+            self.cost_idx = metrics.index(self.cost_metric)
+
+    def add(
+        self,
+        file_name: str,
+        prog_name: str,
+        verdict_old: str,
+        verdict_new: str,
+        diffs: List[MetricDiff],
+        values: MetricValues,
+    ) -> None:
+        if self.records is not None:
+            record = {
+                "file": file_name,
+                "prog": prog_name,
+                "verdict_old": verdict_old,
+                "verdict_new": verdict_new,
+                "metrics": {
+                    metric: {
+                        "old": old,
+                        "new": new,
+                        "diff": diff.absolute,
+                        "pct": diff.percentage,
+                    }
+                    for metric, diff, (old, new) in zip(self.metrics, diffs, values)
+                },
+            }
+            self.records.write(json.dumps(record) + "\n")
+
+        totals = self.files.get(file_name)
+        if totals is None:
+            totals = ObjectRollup(
+                totals=[0.0] * len(self.metrics), deltas=[0.0] * len(self.metrics)
+            )
+            self.files[file_name] = totals
+        totals.programs += 1
+        if verdict_new == "failure":
+            totals.failures += 1
+            if verdict_old not in ("failure", "N/A"):
+                totals.new_failures += 1
+        for idx, (diff, (_, new)) in enumerate(zip(diffs, values)):
+            totals.totals[idx] += new or 0.0
+            totals.deltas[idx] += diff.absolute
+
+        if self.cost_idx is not None:
+            cost = values[self.cost_idx][1]
+            if cost is not None:
+                self.costs.append(cost)
+                item = (cost, file_name, prog_name)
+                if len(self.top) < PARETO_TOP_PROGRAMS:
+                    heapq.heappush(self.top, item)
+                else:
+                    heapq.heappushpop(self.top, item)
+
+    def pareto(self) -> Dict[str, Any]:
+        """Share of the total cost of the costliest PARETO_FRACTIONS of programs."""
+        costs = sorted(self.costs, reverse=True)
+        total = sum(costs)
+        shares = []
+        for fraction in PARETO_FRACTIONS:
+            count = min(len(costs), max(1, math.ceil(len(costs) * fraction)))
+            cost = sum(costs[:count])
+            shares.append(
+                {
+                    "programs_pct": fraction * 100,
+                    "programs": count,
+                    "cost": cost,
+                    "cost_pct": cost * 100 / total if total else 0.0,
+                }
+            )
+        return {
+            "metric": self.cost_metric,
+            "programs": len(costs),
+            "total": total,
+            "shares": shares,
+            "top": [
+                {"file": file_name, "prog": prog_name, "cost": cost}
+                for cost, file_name, prog_name in sorted(self.top, reverse=True)
+            ],
+        }
+
+    def to_dict(self, stats: VeristatStats) -> Dict[str, Any]:
+        return {
+            "stats": asdict(stats),
+            "metrics": self.metrics,
+            "files": {
+                file_name: {
+                    "programs": totals.programs,
+                    "failures": totals.failures,
+                    "new_failures": totals.new_failures,
+                    "totals": dict(zip(self.metrics, totals.totals)),
+                    "deltas": dict(zip(self.metrics, totals.deltas)),
+                }
+                for file_name, totals in sorted(self.files.items())
+            },
+            "pareto": self.pareto(),
+        }
+
+
+class VeristatAccumulator:
+    """
+    Single pass aggregation of per-program comparison records.
+    """
+
+    def __init__(
+        self,
+        metrics: List[str],
+        max_rows: int = MAX_TABLE_ROWS,
+        report_thresholds: Optional[Dict[str, Threshold]] = None,
+        fail_thresholds: Optional[Dict[str, Threshold]] = None,
+        table_sink: Optional[TextIO] = None,
+        rollup: Optional[Rollup] = None,
+    ) -> None:
+        if report_thresholds is None:
+            report_thresholds = REPORT_THRESHOLDS
+        if fail_thresholds is None:
+            fail_thresholds = {}
+        for metric in fail_thresholds:
+            if metric not in metrics:
+                raise ValueError(f"No '{metric}' metric in veristat results")
+
+        self.metrics = metrics
+        self.rollup = rollup
+        if rollup is not None:
+            rollup.start(metrics)
+        self.report_thresholds = [report_thresholds.get(m) for m in metrics]
+        self.fail_thresholds = [fail_thresholds.get(m) for m in metrics]
+        self.stats = VeristatStats(metric_changes={m: 0 for m in metrics})
+        self.top = TopChanges(max_rows)
+        self.file_totals: Dict[str, FileTotals] = {}
+        # Index of the metric used for ranking by absolute delta
+        self.rank_metric = (
+            metrics.index(RANK_METRIC) if RANK_METRIC in metrics else None
         )
+        # Every changed row also goes to the sink, not only the kept ones
+        self.table_writer = None
+        if table_sink is not None:
+            self.table_writer = csv.writer(table_sink)
+            self.table_writer.writerow(summary_headers(metrics))
+
+    def add(
+        self,
+        file_name: str,
+        prog_name: str,
+        verdict_old: str,
+        verdict_new: str,
+        diffs: List[MetricDiff],
+        values: Optional[MetricValues] = None,
+    ) -> None:
+        stats = self.stats
+        stats.programs += 1
+        if self.rollup is not None:
+            if values is None:
+                values = [(None, None)] * len(diffs)
+            self.rollup.add(
+                file_name, prog_name, verdict_old, verdict_new, diffs, values
+            )
 
         # Ignore results from completely new and removed programs
-        if "N/A" in [verdict_new, verdict_old]:
-            continue
+        if verdict_new == "N/A" or verdict_old == "N/A":
+            stats.added_or_removed += 1
+            return
 
-        if record[VeristatFields.VERDICT_DIFF] == "MISMATCH":
-            changes = True
-            add = True
+        totals = self.file_totals.get(file_name)
+        if totals is None:
+            totals = FileTotals(deltas=[0.0] * len(self.metrics))
+            self.file_totals[file_name] = totals
+        totals.programs += 1
+        for idx, diff in enumerate(diffs):
+            totals.deltas[idx] += diff.absolute
+
+        new_failure = False
+        verdict_changed = verdict_old != verdict_new
+        if verdict_changed:
+            stats.verdict_changes += 1
             verdict = f"{verdict_old} -> {verdict_new}"
             if verdict_new == "failure":
-                new_failures = True
+                new_failure = True
+                stats.new_failures += 1
                 verdict += f" {NEW_FAILURE_SUFFIX}"
         else:
-            verdict = record[VeristatFields.VERDICT_NEW]
+            verdict = verdict_new
+
+        changed = verdict_changed
+        regressed = False
+        cells = []
+        for metric, diff, report, fail in zip(
+            self.metrics, diffs, self.report_thresholds, self.fail_thresholds
+        ):
+            cell = f"{diff.percentage:+.2f} %"
+            if report is not None and report.exceeded_by(diff):
+                stats.metric_changes[metric] += 1
+                changed = True
+            if fail is not None and fail.regressed_by(diff):
+                regressed = changed = True
+                cell += f" {REGRESSION_SUFFIX}"
+            cells.append(cell)
+
+        if regressed:
+            stats.regressions += 1
+
+        if not changed:
+            return
+
+        totals.changes += 1
+        if new_failure:
+            totals.new_failures += 1
+
+        row = [file_name, prog_name, verdict, *cells]
+        if self.table_writer is not None:
+            self.table_writer.writerow(row)
+
+        delta = 0.0 if self.rank_metric is None else diffs[self.rank_metric].absolute
+        magnitude = max((abs(diff.percentage) for diff in diffs), default=0.0)
+        self.top.push(
+            (new_failure, verdict_changed, regressed, abs(delta), magnitude), row
+        )
+
+    def result(self) -> VeristatInfo:
+        return VeristatInfo(
+            table=self.top.rows(),
+            changes=self.top.seen > 0,
+            new_failures=self.stats.new_failures > 0,
+            omitted=self.top.omitted,
+            stats=self.stats,
+            headers=summary_headers(self.metrics),
+            regressions=self.stats.regressions > 0,
+            ranked_table=self.top.ranked_rows(),
+            metrics=self.metrics,
+            file_totals=self.file_totals,
+        )
+
+
+def parse_metric_diff(value: str) -> MetricDiff:
+    if value == "N/A":
+        return MetricDiff()
+
+    matches = TOTAL_STATES_DIFF_RE.match(value)
+    if not matches:
+        raise ValueError(f"Failed to parse metric diff field value '{value}'")
+
+    return MetricDiff(
+        absolute=float(matches.group("absolute_diff")),
+        percentage=float(matches.group("percentage_diff")),
+    )
+
+
+def get_state_diff(value: str) -> float:
+    try:
+        return parse_metric_diff(value).percentage
+    except ValueError as e:
+        raise ValueError(
+            f"Failed to parse total states diff field value '{value}'"
+        ) from e
+
 
-        diff = get_state_diff(record[VeristatFields.TOTAL_STATES_DIFF])
-        if abs(diff) > TRESHOLD_PCT:
-            changes = True
-            add = True
+def parse_threshold(spec: str) -> Tuple[str, Threshold]:
+    """
+    Parse a METRIC:ABS:PCT threshold specification, e.g. 'total_insns:1000:5'.
+    Either limit may be left empty, e.g. 'mem_peak::10'.
+    """
+    metric, _, limits = spec.partition(":")
+    absolute, _, percentage = limits.partition(":")
+    if not metric:
+        raise ValueError(f"Invalid threshold '{spec}'")
+    return metric, Threshold(
+        absolute=float(absolute or 0), percentage=float(percentage or 0)
+    )
+
+
+def parse_value(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_table(
+    csv_file: Iterable[str],
+    max_rows: int = MAX_TABLE_ROWS,
+    report_thresholds: Optional[Dict[str, Threshold]] = None,
+    fail_thresholds: Optional[Dict[str, Threshold]] = None,
+    table_sink: Optional[TextIO] = None,
+    rollup: Optional[Rollup] = None,
+) -> VeristatInfo:
+    """
+    Stream the comparison CSV once, keeping at most `max_rows` table rows.
+
+    Columns are accessed by position, as detected by `CompareSchema`. Rows
+    that do not fit into the table are still accounted for in the stats,
+    and written to `table_sink` as CSV if given. The `rollup` of the
+    comparison, if given, is fed in the same pass.
+    """
+    reader = csv.reader(csv_file)
+    schema = CompareSchema.from_header(next(reader, []))
+    if schema.verdict is None:
+        raise ValueError("veristat results have no verdict columns")
+
+    accumulator = VeristatAccumulator(
+        schema.metric_names(),
+        max_rows=max_rows,
+        report_thresholds=report_thresholds,
+        fail_thresholds=fail_thresholds,
+        table_sink=table_sink,
+        rollup=rollup,
+    )
+    verdict = schema.verdict
+
+    for record in reader:
+        values = None
+        if rollup is not None:
+            values = [
+                (parse_value(record[metric.old]), parse_value(record[metric.new]))
+                for metric in schema.metrics
+            ]
+        accumulator.add(
+            record[schema.file_name],
+            record[schema.prog_name],
+            record[verdict.old],
+            record[verdict.new],
+            [parse_metric_diff(record[metric.diff]) for metric in schema.metrics],
+            values,
+        )
+
+    return accumulator.result()
+
+
+@dataclass
+class ProgramSets:
+    """
+    Programs only present on one side of a comparison and programs that
+    failed verification in the current results.
+    """
+
+    added: List[Tuple[str, str]] = field(default_factory=list)
+    removed: List[Tuple[str, str]] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)
 
-        if not add:
+
+def compute_metric_diff(value_old: str, value_new: str) -> MetricDiff:
+    """
+    Same semantics as the diff column of `veristat --compare`.
+    """
+    old, new = parse_value(value_old), parse_value(value_new)
+    if old is None or new is None:
+        return MetricDiff()
+    absolute = new - old
+    if absolute == 0:
+        percentage = 0.0
+    elif old == 0:
+        percentage = 100.0 if absolute > 0 else -100.0
+    else:
+        percentage = absolute * 100.0 / old
+    return MetricDiff(absolute=absolute, percentage=percentage)
+
+
+def results_columns(header: List[str]) -> Dict[str, int]:
+    """
+    Column positions of a plain veristat CSV, as emitted without --compare.
+    """
+    column = {name: idx for idx, name in enumerate(header)}
+    for name in (VeristatFields.FILE_NAME.value, VeristatFields.PROG_NAME.value):
+        if name not in column:
+            raise ValueError(f"Missing '{name}' column in header: {header}")
+    if VERDICT_STAT not in column:
+        raise ValueError(f"veristat results have no verdict column: {header}")
+    return column
+
+
+def join_results(
+    baseline_csv: Iterable[str],
+    current_csv: Iterable[str],
+    max_rows: int = MAX_TABLE_ROWS,
+    report_thresholds: Optional[Dict[str, Threshold]] = None,
+    fail_thresholds: Optional[Dict[str, Threshold]] = None,
+    table_sink: Optional[TextIO] = None,
+    rollup: Optional[Rollup] = None,
+    metrics: Optional[List[str]] = None,
+) -> Tuple[VeristatInfo, ProgramSets]:
+    """
+    Compare two plain veristat CSVs without going through `veristat --compare`.
+
+    The baseline is loaded into a hash index on (file, prog), the current
+    results are streamed against it. Compared are the `metrics` present in
+    both files, by default those with a report or fail threshold.
+    """
+    if metrics is None:
+        metrics = [*(report_thresholds or REPORT_THRESHOLDS), *(fail_thresholds or {})]
+    wanted = set(metrics)
+    baseline_reader = csv.reader(baseline_csv)
+    baseline_column = results_columns(next(baseline_reader, []))
+    current_reader = csv.reader(current_csv)
+    current_header = next(current_reader, [])
+    current_column = results_columns(current_header)
+
+    metrics = [
+        name
+        for name in current_header
+        if name in wanted
+        and name in baseline_column
+        and name not in STRING_STATS
+        and name not in (VeristatFields.FILE_NAME.value, VeristatFields.PROG_NAME.value)
+    ]
+    file_idx = current_column[VeristatFields.FILE_NAME.value]
+    prog_idx = current_column[VeristatFields.PROG_NAME.value]
+    verdict_idx = current_column[VERDICT_STAT]
+    metric_idx = [current_column[metric] for metric in metrics]
+    base_file_idx = baseline_column[VeristatFields.FILE_NAME.value]
+    base_prog_idx = baseline_column[VeristatFields.PROG_NAME.value]
+    base_verdict_idx = baseline_column[VERDICT_STAT]
+    base_metric_idx = [baseline_column[metric] for metric in metrics]
+
+    baseline = {
+        (record[base_file_idx], record[base_prog_idx]): record
+        for record in baseline_reader
+    }
+
+    accumulator = VeristatAccumulator(
+        metrics,
+        max_rows=max_rows,
+        report_thresholds=report_thresholds,
+        fail_thresholds=fail_thresholds,
+        table_sink=table_sink,
+        rollup=rollup,
+    )
+    programs = ProgramSets()
+    no_diffs = [MetricDiff()] * len(metrics)
+
+    for record in current_reader:
+        key = (record[file_idx], record[prog_idx])
+        verdict_new = record[verdict_idx]
+        if verdict_new == "failure":
+            programs.failed.append(key)
+
+        base_record = baseline.pop(key, None)
+        if base_record is None:
+            programs.added.append(key)
+            values = None
+            if rollup is not None:
+                values = [(None, parse_value(record[new])) for new in metric_idx]
+            accumulator.add(*key, "N/A", verdict_new, no_diffs, values)
             continue
 
-        table.append(
-            [
-                record[VeristatFields.FILE_NAME],
-                record[VeristatFields.PROG_NAME],
-                verdict,
-                f"{diff:+.2f} %",
+        values = None
+        if rollup is not None:
+            values = [
+                (parse_value(base_record[old]), parse_value(record[new]))
+                for old, new in zip(base_metric_idx, metric_idx)
             ]
+        accumulator.add(
+            *key,
+            base_record[base_verdict_idx],
+            verdict_new,
+            [
+                compute_metric_diff(base_record[old], record[new])
+                for old, new in zip(base_metric_idx, metric_idx)
+            ],
+            values,
         )
 
-    return VeristatInfo(table=table, changes=changes, new_failures=new_failures)
+    for key, base_record in baseline.items():
+        programs.removed.append(key)
+        values = None
+        if rollup is not None:
+            values = [(parse_value(base_record[old]), None) for old in base_metric_idx]
+        accumulator.add(*key, base_record[base_verdict_idx], "N/A", no_diffs, values)
+
+    return accumulator.result(), programs
+
+
+@dataclass
+class LatencyChange:
+    file_name: str
+    prog_name: str
+    median_old: float
+    median_new: float
+    mad_old: float
+    mad_new: float
+    ci_low: float
+    ci_high: float
+
+    @property
+    def percentage(self) -> float:
+        if self.median_old == 0:
+            return 100.0
+        return (self.median_new - self.median_old) * 100.0 / self.median_old
+
+    def row(self) -> List[str]:
+        return [
+            self.file_name,
+            self.prog_name,
+            f"{self.median_old:.0f} ± {self.mad_old:.0f}",
+            f"{self.median_new:.0f} ± {self.mad_new:.0f}",
+            f"{self.percentage:+.2f} %",
+            f"[{self.ci_low:+.0f}, {self.ci_high:+.0f}]",
+        ]
+
+
+def load_durations(
+    csv_files: Iterable[Iterable[str]],
+) -> Dict[Tuple[str, str], List[float]]:
+    """
+    Collect per-program `duration` values from repeated plain veristat runs.
+    Failed verifications are skipped, their duration is meaningless.
+    """
+    durations: Dict[Tuple[str, str], List[float]] = {}
+    for csv_file in csv_files:
+        reader = csv.reader(csv_file)
+        column = results_columns(next(reader, []))
+        if LATENCY_METRIC not in column:
+            raise ValueError(f"veristat results have no '{LATENCY_METRIC}' column")
+        file_idx = column[VeristatFields.FILE_NAME.value]
+        prog_idx = column[VeristatFields.PROG_NAME.value]
+        verdict_idx = column[VERDICT_STAT]
+        duration_idx = column[LATENCY_METRIC]
+        for record in reader:
+            if record[verdict_idx] != "success":
+                continue
+            key = (record[file_idx], record[prog_idx])
+            durations.setdefault(key, []).append(float(record[duration_idx]))
+    return durations
+
+
+def median_abs_deviation(values: List[float]) -> float:
+    center = statistics.median(values)
+    return statistics.median(abs(value - center) for value in values)
+
+
+def bootstrap_median_diff(
+    old: List[float],
+    new: List[float],
+    rng: random.Random,
+    samples: int = LATENCY_BOOTSTRAP_SAMPLES,
+    confidence: float = LATENCY_CONFIDENCE,
+) -> Tuple[float, float]:
+    """
+    Percentile bootstrap confidence interval of median(new) - median(old).
+    """
+    diffs = sorted(
+        statistics.median(rng.choices(new, k=len(new)))
+        - statistics.median(rng.choices(old, k=len(old)))
+        for _ in range(samples)
+    )
+    tail = (1.0 - confidence) / 2
+    low = diffs[int(tail * (samples - 1))]
+    high = diffs[int((1.0 - tail) * (samples - 1))]
+    return low, high
+
+
+def compare_latency(
+    baseline_runs: Dict[Tuple[str, str], List[float]],
+    candidate_runs: Dict[Tuple[str, str], List[float]],
+    threshold: Threshold = LATENCY_THRESHOLD,
+    samples: int = LATENCY_BOOTSTRAP_SAMPLES,
+    confidence: float = LATENCY_CONFIDENCE,
+    seed: int = 0,
+    min_runs: int = LATENCY_MIN_RUNS,
+) -> List[LatencyChange]:
+    """
+    Programs whose median verification duration grew beyond `threshold` and
+    whose bootstrap confidence interval of the growth excludes zero. The
+    bootstrap only runs for programs past the threshold, the rest are
+    dismissed on their medians alone, and programs with fewer than
+    `min_runs` runs on either side are skipped. Sorted by relative growth.
+    """
+    rng = random.Random(seed)
+    regressions = []
+    for key, new in candidate_runs.items():
+        old = baseline_runs.get(key)
+        if not old or len(old) < min_runs or len(new) < min_runs:
+            continue
+
+        median_old, median_new = statistics.median(old), statistics.median(new)
+        diff = MetricDiff(
+            absolute=median_new - median_old,
+            percentage=(
+                (median_new - median_old) * 100.0 / median_old if median_old else 100.0
+            ),
+        )
+        if not threshold.regressed_by(diff):
+            continue
+
+        ci_low, ci_high = bootstrap_median_diff(old, new, rng, samples, confidence)
+        if ci_low <= 0:
+            continue
+
+        regressions.append(
+            LatencyChange(
+                file_name=key[0],
+                prog_name=key[1],
+                median_old=median_old,
+                median_new=median_new,
+                mad_old=median_abs_deviation(old),
+                mad_new=median_abs_deviation(new),
+                ci_low=ci_low,
+                ci_high=ci_high,
+            )
+        )
+
+    regressions.sort(key=lambda change: -change.percentage)
+    return regressions
+
+
+def get_latency_summary(
+    regressions: List[LatencyChange],
+    max_rows: int = MAX_TABLE_ROWS,
+    markup: bool = False,
+) -> str:
+    if not regressions:
+        return f"# {LATENCY_TITLE}\n\nNo significant verification latency regressions\n"
+
+    table = format_table(
+        headers=LATENCY_HEADERS,
+        rows=[change.row() for change in regressions[:max_rows]],
+    )
+    if len(regressions) > max_rows:
+        table += (
+            f"\n{len(regressions) - max_rows} less significant changes are not shown\n"
+        )
+
+    template = HTML_SUMMARY_TEMPLATE if markup else TEXT_SUMMARY_TEMPLATE
+    return template.format(title=LATENCY_TITLE, table=table)
+
+
+def parse_labeled(spec: str) -> Tuple[str, str]:
+    """Parse a LABEL=CSV result set, e.g. 'x86_64-gcc=veristat-kernel.csv'."""
+    label, sep, filename = spec.partition("=")
+    if not label or not sep or not filename:
+        raise ValueError(f"Invalid labeled result set '{spec}'")
+    return label, filename
+
+
+def load_metric(
+    csv_file: Iterable[str], metric: str
+) -> Dict[Tuple[str, str], Tuple[str, Optional[float]]]:
+    """Verdict and `metric` value of every program of a plain veristat CSV."""
+    reader = csv.reader(csv_file)
+    column = results_columns(next(reader, []))
+    if metric not in column:
+        raise ValueError(f"veristat results have no '{metric}' column")
+    file_idx = column[VeristatFields.FILE_NAME.value]
+    prog_idx = column[VeristatFields.PROG_NAME.value]
+    verdict_idx = column[VERDICT_STAT]
+    metric_idx = column[metric]
+    return {
+        (record[file_idx], record[prog_idx]): (
+            record[verdict_idx],
+            parse_value(record[metric_idx]),
+        )
+        for record in reader
+    }
+
+
+@dataclass
+class CrossChange:
+    file_name: str
+    prog_name: str
+    # Per result set, "N/A" and None where the program is missing
+    verdicts: List[str]
+    values: List[Optional[float]]
+    # From the cheapest successful verification to the costliest one, the
+    # indices are None with less than two successful verifications
+    spread: MetricDiff
+    cheapest: Optional[int]
+    costliest: Optional[int]
+
+    @property
+    def verdict_mismatch(self) -> bool:
+        return len({verdict for verdict in self.verdicts if verdict != "N/A"}) > 1
+
+    def row(self, labels: List[str]) -> List[str]:
+        cells = []
+        for verdict, value in zip(self.verdicts, self.values):
+            if verdict != "success":
+                cells.append(verdict)
+            else:
+                cells.append("N/A" if value is None else f"{value:.0f}")
+        suffix = f" {VERDICT_MISMATCH_SUFFIX}" if self.verdict_mismatch else ""
+        return [
+            self.file_name,
+            self.prog_name,
+            *cells,
+            f"{self.spread.percentage:+.2f} %{suffix}",
+            "N/A" if self.costliest is None else labels[self.costliest],
+        ]
+
+
+@dataclass
+class CrossTotals:
+    # Programs verified successfully by every build and their summed cost
+    programs: int
+    totals: List[float]
+
+
+def compare_cross(
+    result_sets: List[Dict[Tuple[str, str], Tuple[str, Optional[float]]]],
+    threshold: Threshold = CROSS_THRESHOLD,
+) -> Tuple[List[CrossChange], CrossTotals]:
+    """
+    Programs found in at least two result sets whose cost spread between
+    the sets' successful verifications exceeds `threshold`, or whose
+    verdicts differ. Verdict mismatches come first, then the widest spreads.
+    """
+    keys: Dict[Tuple[str, str], None] = {}
+    for results in result_sets:
+        keys.update(dict.fromkeys(results))
+
+    changes = []
+    common = CrossTotals(programs=0, totals=[0.0] * len(result_sets))
+    for key in keys:
+        found = [results.get(key, ("N/A", None)) for results in result_sets]
+        verdicts = [verdict for verdict, _ in found]
+        values = [value for _, value in found]
+        if len(verdicts) - verdicts.count("N/A") < 2:
+            continue
+
+        costs = [
+            (value, idx)
+            for idx, (verdict, value) in enumerate(found)
+            if verdict == "success" and value is not None
+        ]
+        if len(costs) == len(result_sets):
+            common.programs += 1
+            for value, idx in costs:
+                common.totals[idx] += value
+
+        spread, cheapest, costliest = MetricDiff(), None, None
+        if len(costs) >= 2:
+            (low, cheapest), (high, costliest) = min(costs), max(costs)
+            spread = MetricDiff(
+                absolute=high - low,
+                percentage=(high - low) * 100.0 / low if low else 100.0,
+            )
+        change = CrossChange(
+            key[0], key[1], verdicts, values, spread, cheapest, costliest
+        )
+        if change.verdict_mismatch or threshold.exceeded_by(spread):
+            changes.append(change)
+
+    changes.sort(
+        key=lambda change: (not change.verdict_mismatch, -change.spread.percentage)
+    )
+    return changes, common
+
+
+def get_cross_summary(
+    labels: List[str],
+    metric: str,
+    changes: List[CrossChange],
+    common: CrossTotals,
+    max_rows: int = MAX_TABLE_ROWS,
+    markup: bool = False,
+) -> str:
+    totals = ", ".join(
+        f"{label} {total:.0f}" for label, total in zip(labels, common.totals)
+    )
+    overview = (
+        f"{metric} of the {common.programs} programs verified by every build: "
+        f"{totals}\n"
+    )
+    if not changes:
+        return f"# {CROSS_TITLE}\n\nNo differences between builds\n\n{overview}"
+
+    headers = ["File", "Program", *labels, f"{metric} Spread (%)", "Costliest"]
+    table = format_table(
+        headers=headers,
+        rows=[change.row(labels) for change in changes[:max_rows]],
+    )
+    if len(changes) > max_rows:
+        table += f"\n{len(changes) - max_rows} smaller differences are not shown\n"
+
+    if markup:
+        summary = HTML_SUMMARY_TEMPLATE.format(title=CROSS_TITLE, table=table)
+        return github_markup_decorate(f"{summary}\n\n{overview}")
+    # The table ends with a newline already
+    summary = TEXT_SUMMARY_TEMPLATE.format(title=CROSS_TITLE, table=table)
+    return f"{summary}\n{overview}"
+
+
+def compare_cross_files(
+    labeled_filenames: List[Tuple[str, os.PathLike]],
+    output_filename: os.PathLike,
+    metric: str = CROSS_METRIC,
+    threshold: Threshold = CROSS_THRESHOLD,
+    max_rows: int = MAX_TABLE_ROWS,
+) -> int:
+    """Differences are reported, they are not failures, this always returns 0."""
+    labels = [label for label, _ in labeled_filenames]
+    result_sets = []
+    for _, filename in labeled_filenames:
+        with open(filename, newline="", encoding="utf-8") as csv_file:
+            result_sets.append(load_metric(csv_file, metric))
+    changes, common = compare_cross(result_sets, threshold)
+
+    sys.stdout.write(get_cross_summary(labels, metric, changes, common, max_rows))
+    with open(output_filename, encoding="utf-8", mode="a") as file:
+        file.write(
+            get_cross_summary(labels, metric, changes, common, max_rows, markup=True)
+        )
+    return 0
+
+
+def render_grouped_summary(info: VeristatInfo, budget: int = SUMMARY_BUDGET) -> str:
+    """
+    Render the table grouped per object file in collapsible blocks.
+
+    Groups are ordered by their most significant row and rows by significance
+    within a group. Rows stop being added once the summary would exceed
+    `budget` bytes, a footer tells how many rows were left out.
+    """
+    groups: Dict[str, List[List[str]]] = {}
+    for row in info.ranked_table or info.table:
+        groups.setdefault(row[0], []).append(row[1:])
+
+    title = f"# {info.get_results_title()}\n"
+    blocks = [title]
+    used = len(title.encode()) + SUMMARY_FOOTER_RESERVE
+    shown = 0
+
+    for file_name, rows in groups.items():
+        totals = info.describe_file_totals(file_name)
+
+        def render(count: int) -> str:
+            table = format_table(headers=info.headers[1:], rows=rows[:count])
+            return github_markup_decorate(
+                GROUP_SUMMARY_TEMPLATE.format(
+                    file_name=file_name, totals=totals, table=table
+                )
+            )
+
+        # Block size grows with the row count, find the most rows that fit
+        low, high = 0, len(rows)
+        while low < high:
+            count = (low + high + 1) // 2
+            if used + len(render(count).encode()) <= budget:
+                low = count
+            else:
+                high = count - 1
+
+        if low == 0:
+            break
+        block = render(low)
+        blocks.append(block)
+        used += len(block.encode())
+        shown += low
+        if low < len(rows):
+            break
+
+    not_shown = len(info.table) - shown + info.omitted
+    if not_shown:
+        blocks.append(f"\n{not_shown} more changed programs are not shown\n")
+
+    return "".join(blocks)
 
 
 def github_markup_decorate(input_str: str) -> str:
@@ -230,16 +1370,210 @@ def format_table(headers: List[str], rows: List[List[str]]) -> str:
         return out.getvalue()
 
 
-def main(compare_csv_filename: os.PathLike, output_filename: os.PathLike) -> None:
-    with open(compare_csv_filename, newline="", encoding="utf-8") as csv_file:
-        veristat_results = parse_table(csv_file)
+def write_program_list(filename: os.PathLike, programs: List[Tuple[str, str]]) -> None:
+    with open(filename, encoding="utf-8", mode="w") as file:
+        for file_name, prog_name in programs:
+            file.write(f"{file_name},{prog_name}\n")
+
+
+def load_duration_files(
+    filenames: List[os.PathLike],
+) -> Dict[Tuple[str, str], List[float]]:
+    csv_files = []
+    try:
+        for filename in filenames:
+            csv_files.append(open(filename, newline="", encoding="utf-8"))
+        return load_durations(csv_files)
+    finally:
+        for csv_file in csv_files:
+            csv_file.close()
+
+
+@dataclass
+class SetResult:
+    name: str
+    info: Optional[VeristatInfo] = None
+    # Why the set was not compared
+    note: str = ""
+
+
+def count_results(csv_file: Iterable[str]) -> Tuple[int, int]:
+    """Programs and failed programs of a plain veristat CSV."""
+    reader = csv.reader(csv_file)
+    verdict_idx = results_columns(next(reader, []))[VERDICT_STAT]
+    programs = failed = 0
+    for record in reader:
+        programs += 1
+        failed += record[verdict_idx] == "failure"
+    return programs, failed
+
+
+def compare_sets(
+    sets: List[Dict[str, str]],
+    results_dir: os.PathLike,
+    baselines_dir: os.PathLike,
+    **options: Any,
+) -> List[SetResult]:
+    """
+    Join the results of every set of a veristat_plan.py plan against its
+    baseline. Sets without results were skipped by the run, sets without a
+    baseline are only counted.
+    """
+    results = []
+    for veristat_set in sets:
+        name = veristat_set["output"]
+        current = os.path.join(results_dir, veristat_set["output"])
+        baseline = os.path.join(baselines_dir, veristat_set["baseline"])
+        if not os.path.isfile(current):
+            results.append(SetResult(name, note="not run"))
+            continue
+        with open(current, newline="", encoding="utf-8") as csv_file:
+            if not os.path.isfile(baseline):
+                programs, failed = count_results(csv_file)
+                note = f"no baseline, {programs} programs, {failed} failed"
+                results.append(SetResult(name, note=note))
+                continue
+            with open(baseline, newline="", encoding="utf-8") as baseline_file:
+                info, _ = join_results(baseline_file, csv_file, **options)
+        results.append(SetResult(name, info=info))
+    return results
+
+
+def demote_headings(text: str, levels: int) -> str:
+    """Move the markdown headings of `text` `levels` levels down."""
+    return re.sub(r"^(#+ )", "#" * levels + r"\1", text, flags=re.MULTILINE)
+
+
+def get_sets_summary(
+    results: List[SetResult], markup: bool = False, budget: int = SUMMARY_BUDGET
+) -> str:
+    """One summary for all sets, each set gets an even share of `budget`."""
+    failing = [
+        result.name
+        for result in results
+        if result.info and (result.info.new_failures or result.info.regressions)
+    ]
+    title = f"# veristat: {len(results)} object sets"
+    title += f", failing: {', '.join(failing)}\n" if failing else "\n"
+    blocks = [title]
+    share = (budget - len(title.encode())) // max(len(results), 1)
+    for result in results:
+        if result.info is None:
+            blocks.append(f"\n## {result.name}: {result.note}\n")
+            continue
+        summary = result.info.get_results_summary(markup=markup, budget=share)
+        # Below the set's own heading
+        summary = demote_headings(summary, 2)
+        blocks.append(f"\n## {result.name}\n\n{summary}\n")
+    return "".join(blocks)
+
+
+def compare_plan(
+    plan_filename: os.PathLike,
+    output_filename: os.PathLike,
+    results_dir: os.PathLike = ".",
+    baselines_dir: os.PathLike = ".",
+    summary_budget: int = SUMMARY_BUDGET,
+    **options: Any,
+) -> int:
+    with open(plan_filename, encoding="utf-8") as file:
+        sets = json.load(file)["sets"]
+    results = compare_sets(sets, results_dir, baselines_dir, **options)
+
+    sys.stdout.write(get_sets_summary(results))
+    with open(output_filename, encoding="utf-8", mode="a") as file:
+        file.write(get_sets_summary(results, markup=True, budget=summary_budget))
+
+    for result in results:
+        if result.info and (result.info.new_failures or result.info.regressions):
+            return 1
+    return 0
+
+
+def main(
+    csv_filename: os.PathLike,
+    output_filename: os.PathLike,
+    baseline_filename: Optional[os.PathLike] = None,
+    failed_progs_filename: Optional[os.PathLike] = None,
+    latency_baseline_filenames: Optional[List[os.PathLike]] = None,
+    latency_candidate_filenames: Optional[List[os.PathLike]] = None,
+    fail_on_latency: bool = False,
+    full_table_filename: Optional[os.PathLike] = None,
+    summary_budget: int = SUMMARY_BUDGET,
+    records_filename: Optional[os.PathLike] = None,
+    rollup_filename: Optional[os.PathLike] = None,
+    metrics: Optional[List[str]] = None,
+    **options: Any,
+) -> None:
+    """
+    Without a baseline `csv_filename` is the output of `veristat --compare`,
+    otherwise it is plain veristat output joined against the baseline here.
+    With repeated runs for both sides, a verification latency table follows.
+    `metrics` are the stats joined against the baseline. Per program records
+    and the rollup are written in the same pass, if their files are given.
+    Remaining keyword arguments are passed to `parse_table`/`join_results`.
+    """
+    rollup = None
+    with contextlib.ExitStack() as stack:
+        if full_table_filename is not None:
+            options["table_sink"] = stack.enter_context(
+                open(full_table_filename, "w", newline="", encoding="utf-8")
+            )
+        if records_filename is not None or rollup_filename is not None:
+            records = None
+            if records_filename is not None:
+                records = stack.enter_context(
+                    open(records_filename, "w", encoding="utf-8")
+                )
+            rollup = options["rollup"] = Rollup(records)
+        csv_file = stack.enter_context(open(csv_filename, newline="", encoding="utf-8"))
+        if baseline_filename is None:
+            veristat_results = parse_table(csv_file, **options)
+            programs = None
+        else:
+            baseline_file = stack.enter_context(
+                open(baseline_filename, newline="", encoding="utf-8")
+            )
+            veristat_results, programs = join_results(
+                baseline_file, csv_file, metrics=metrics, **options
+            )
+
+    if rollup is not None and rollup_filename is not None:
+        with open(rollup_filename, "w", encoding="utf-8") as file:
+            json.dump(rollup.to_dict(veristat_results.stats), file, indent=2)
+
+    if programs is not None:
+        print(
+            f"{len(programs.added)} new and {len(programs.removed)} removed "
+            f"programs, {len(programs.failed)} failed verification"
+        )
+        if failed_progs_filename is not None:
+            write_program_list(failed_progs_filename, programs.failed)
 
     sys.stdout.write(veristat_results.get_results_summary())
 
     with open(output_filename, encoding="utf-8", mode="a") as file:
-        file.write(veristat_results.get_results_summary(markup=True))
+        file.write(
+            veristat_results.get_results_summary(markup=True, budget=summary_budget)
+        )
+
+    latency_regressions = []
+    if latency_baseline_filenames and latency_candidate_filenames:
+        latency_regressions = compare_latency(
+            load_duration_files(latency_baseline_filenames),
+            load_duration_files(latency_candidate_filenames),
+        )
+        max_rows = options.get("max_rows", MAX_TABLE_ROWS)
+        sys.stdout.write("\n" + get_latency_summary(latency_regressions, max_rows))
+        with open(output_filename, encoding="utf-8", mode="a") as file:
+            file.write(
+                "\n" + get_latency_summary(latency_regressions, max_rows, markup=True)
+            )
 
-    if veristat_results.new_failures:
+    if veristat_results.new_failures or veristat_results.regressions:
+        return 1
+
+    if fail_on_latency and latency_regressions:
         return 1
 
     return 0
@@ -249,10 +1583,181 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Print veristat comparison output as markdown step summary"
     )
-    parser.add_argument("filename")
+    parser.add_argument(
+        "filename",
+        nargs="?",
+        help="veristat --compare output, or plain veristat output with --baseline",
+    )
+    parser.add_argument(
+        "--plan",
+        help="Compare every object set of this veristat_plan.py plan instead",
+    )
+    parser.add_argument(
+        "--cross",
+        type=parse_labeled,
+        action="append",
+        metavar="LABEL=CSV",
+        help="Compare plain veristat outputs of differently built objects, "
+        "e.g. x86_64-gcc=gcc.csv x86_64-llvm=llvm.csv, instead",
+    )
+    parser.add_argument(
+        "--cross-threshold",
+        type=parse_threshold,
+        default=(CROSS_METRIC, CROSS_THRESHOLD),
+        metavar="METRIC:ABS:PCT",
+        help="With --cross, list programs whose METRIC differs between builds "
+        "by more than ABS and PCT%% (default: total_insns:100:25)",
+    )
+    parser.add_argument(
+        "--results-dir",
+        default=".",
+        help="With --plan, directory with the CSVs of the sets",
+    )
+    parser.add_argument(
+        "--baselines-dir",
+        default=".",
+        help="With --plan, directory with the baselines of the sets",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Plain veristat output to compare against, instead of running "
+        "veristat --compare beforehand",
+    )
+    parser.add_argument(
+        "--metric",
+        action="append",
+        help="With --baseline or --plan, compare this stat too, e.g. total_insns; "
+        "only the --threshold and --fail-on stats are compared by default",
+    )
+    parser.add_argument(
+        "--failed-progs",
+        help="With --baseline, write 'file,prog' of failed programs to this file",
+    )
+    parser.add_argument(
+        "--max-rows",
+        type=int,
+        default=MAX_TABLE_ROWS,
+        help="Maximum number of changed programs listed in the summary table",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=parse_threshold,
+        action="append",
+        default=[],
+        metavar="METRIC:ABS:PCT",
+        help="List programs whose METRIC changed by more than ABS and PCT%% "
+        "(default: total_states:0:0)",
+    )
+    parser.add_argument(
+        "--fail-on",
+        type=parse_threshold,
+        action="append",
+        default=[],
+        metavar="METRIC:ABS:PCT",
+        help="Fail if METRIC of any program grew by more than ABS and PCT%%",
+    )
+    parser.add_argument(
+        "--latency-baseline",
+        nargs="+",
+        metavar="CSV",
+        help=(
+            "Plain veristat outputs of repeated baseline runs, with duration, "
+            f"at least {LATENCY_MIN_RUNS}"
+        ),
+    )
+    parser.add_argument(
+        "--latency-candidate",
+        nargs="+",
+        metavar="CSV",
+        help=(
+            "Plain veristat outputs of repeated candidate runs, with duration, "
+            f"at least {LATENCY_MIN_RUNS}"
+        ),
+    )
+    parser.add_argument(
+        "--fail-on-latency",
+        action="store_true",
+        help="Fail on statistically significant verification latency regressions",
+    )
+    parser.add_argument(
+        "--full-table",
+        help="Write every changed program to this CSV, not only the ones shown",
+    )
+    parser.add_argument(
+        "--records",
+        help="Write every compared program to this file as NDJSON",
+    )
+    parser.add_argument(
+        "--rollup",
+        help="Write per object file aggregates and the Pareto breakdown of "
+        "verification cost to this file as JSON",
+    )
+    parser.add_argument(
+        "--summary-budget",
+        type=int,
+        default=SUMMARY_BUDGET,
+        help="Maximum size of the GITHUB_STEP_SUMMARY table in bytes",
+    )
     args = parser.parse_args()
+    if bool(args.latency_baseline) != bool(args.latency_candidate):
+        parser.error("--latency-baseline and --latency-candidate go together")
+    if [bool(args.filename), bool(args.plan), bool(args.cross)].count(True) != 1:
+        parser.error("either a veristat output, --plan or --cross is required")
+    if args.cross and len(args.cross) < 2:
+        parser.error("--cross needs at least two result sets")
+    report_thresholds = dict(args.threshold) if args.threshold else None
+    fail_thresholds = dict(args.fail_on)
+    metrics = None
+    if args.metric:
+        metrics = [
+            *(report_thresholds or REPORT_THRESHOLDS),
+            *fail_thresholds,
+            *args.metric,
+        ]
     summary_filename = os.getenv("GITHUB_STEP_SUMMARY")
     if not summary_filename:
         logging.error("GITHUB_STEP_SUMMARY environment variable is not set")
         sys.exit(1)
-    sys.exit(main(args.filename, summary_filename))
+    if args.cross:
+        sys.exit(
+            compare_cross_files(
+                args.cross,
+                summary_filename,
+                metric=args.cross_threshold[0],
+                threshold=args.cross_threshold[1],
+                max_rows=args.max_rows,
+            )
+        )
+    if args.plan:
+        sys.exit(
+            compare_plan(
+                args.plan,
+                summary_filename,
+                results_dir=args.results_dir,
+                baselines_dir=args.baselines_dir,
+                summary_budget=args.summary_budget,
+                max_rows=args.max_rows,
+                report_thresholds=report_thresholds,
+                fail_thresholds=fail_thresholds,
+                metrics=metrics,
+            )
+        )
+    sys.exit(
+        main(
+            args.filename,
+            summary_filename,
+            baseline_filename=args.baseline,
+            failed_progs_filename=args.failed_progs,
+            latency_baseline_filenames=args.latency_baseline,
+            latency_candidate_filenames=args.latency_candidate,
+            fail_on_latency=args.fail_on_latency,
+            full_table_filename=args.full_table,
+            summary_budget=args.summary_budget,
+            records_filename=args.records,
+            rollup_filename=args.rollup,
+            metrics=metrics,
+            max_rows=args.max_rows,
+            report_thresholds=report_thresholds,
+            fail_thresholds=fail_thresholds,
+        )
+    )
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+
+# Keeps a history of veristat results in a local SQLite database, one
+# snapshot per pushed commit and object set (kernel, meta, scx, cilium),
+# and answers trend queries over it.
+#
+# Usage:
+#
+#   veristat_history.py --db history.db ingest \
+#       --commit SHA --object-set x86_64-gcc-baseline-veristat-meta veristat-meta
+#
+#   veristat_history.py --db history.db top-growth \
+#       --object-set x86_64-gcc-baseline-veristat-meta --last 50 --metric total_states
+#
+#   veristat_history.py --db history.db series \
+#       --object-set x86_64-gcc-baseline-veristat-meta --file prog.bpf.o --prog prog
+#
+#   veristat_history.py --db history.db resolve \
+#       --object-set x86_64-gcc-baseline-veristat-meta --commit BASE_SHA \
+#       --output baseline.csv
+#
+# Query results are written to standard output as CSV.
+#
+# resolve finds the snapshot of the nearest first-parent ancestor of a
+# commit, for when the baseline of the exact base commit is not available,
+# and writes it out as plain veristat CSV. Ancestors come from `git
+# rev-list`, the repository needs that much history, and every lookup is a
+# range read on the (object_set, commit_sha) index, O(log n) in the number
+# of snapshots. The distance in commits is printed along with the commit.
+#
+# Snapshots are ordered by ingestion, which follows the order of pushes.
+# Programs are interned into their own table and results are stored in a
+# WITHOUT ROWID table clustered on (snapshot, program), with a secondary
+# index on (program, snapshot), so both per-snapshot and per-program scans
+# stay index-only range reads with millions of rows.
+
+import argparse
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Dict, Final, Iterable, List, Optional, TextIO, Tuple
+
+# Ancestors looked up per query when resolving a baseline, below SQLite's
+# limit on bound parameters
+RESOLVE_BATCH: Final[int] = 500
+
+# Numeric veristat stats kept in the history, missing columns are stored as NULL
+METRICS: Final[List[str]] = [
+    "duration",
+    "total_insns",
+    "total_states",
+    "peak_states",
+    "mem_peak",
+]
+
+SCHEMA: Final[str] = f"""
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    commit_sha TEXT NOT NULL,
+    object_set TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    UNIQUE (object_set, commit_sha)
+);
+CREATE TABLE IF NOT EXISTS programs (
+    id INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    prog_name TEXT NOT NULL,
+    UNIQUE (file_name, prog_name)
+);
+CREATE TABLE IF NOT EXISTS results (
+    snapshot_id INTEGER NOT NULL,
+    program_id INTEGER NOT NULL,
+    success INTEGER NOT NULL,
+    {", ".join(f"{metric} INTEGER" for metric in METRICS)},
+    PRIMARY KEY (snapshot_id, program_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_program ON results (program_id, snapshot_id);
+"""
+
+
+def connect(db_filename: os.PathLike) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_filename)
+    # The database is carried between runs as a single file in the Actions
+    # cache, a WAL file next to it would be left behind
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def intern_programs(
+    conn: sqlite3.Connection, programs: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], int]:
+    conn.executemany(
+        "INSERT OR IGNORE INTO programs (file_name, prog_name) VALUES (?, ?)",
+        programs,
+    )
+    return {
+        (file_name, prog_name): program_id
+        for program_id, file_name, prog_name in conn.execute(
+            "SELECT id, file_name, prog_name FROM programs"
+        )
+    }
+
+
+def parse_int(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def ingest(
+    conn: sqlite3.Connection,
+    csv_file: Iterable[str],
+    commit_sha: str,
+    object_set: str,
+    created_at: Optional[int] = None,
+) -> int:
+    """
+    Store plain veristat CSV output as a snapshot. Ingesting the same commit
+    and object set again replaces the previous snapshot. Returns the number
+    of stored results.
+    """
+    reader = csv.reader(csv_file)
+    column = {name: idx for idx, name in enumerate(next(reader, []))}
+    for name in ("file_name", "prog_name", "verdict"):
+        if name not in column:
+            raise ValueError(f"Missing '{name}' column in veristat results")
+    metric_idx = [column.get(metric) for metric in METRICS]
+
+    records = [
+        (
+            (record[column["file_name"]], record[column["prog_name"]]),
+            record[column["verdict"]] == "success",
+            [None if idx is None else parse_int(record[idx]) for idx in metric_idx],
+        )
+        for record in reader
+    ]
+
+    with conn:
+        conn.execute(
+            "DELETE FROM results WHERE snapshot_id IN "
+            "(SELECT id FROM snapshots WHERE object_set = ? AND commit_sha = ?)",
+            (object_set, commit_sha),
+        )
+        conn.execute(
+            "DELETE FROM snapshots WHERE object_set = ? AND commit_sha = ?",
+            (object_set, commit_sha),
+        )
+        snapshot_id = conn.execute(
+            "INSERT INTO snapshots (commit_sha, object_set, created_at) "
+            "VALUES (?, ?, ?)",
+            (commit_sha, object_set, created_at or int(time.time())),
+        ).lastrowid
+        program_ids = intern_programs(conn, (key for key, _, _ in records))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO results "
+            f"(snapshot_id, program_id, success, {', '.join(METRICS)}) "
+            f"VALUES (?, ?, ?, {', '.join('?' * len(METRICS))})",
+            (
+                (snapshot_id, program_ids[key], success, *metrics)
+                for key, success, metrics in records
+            ),
+        )
+
+    return len(records)
+
+
+def last_snapshots(conn: sqlite3.Connection, object_set: str, count: int) -> List[int]:
+    rows = conn.execute(
+        "SELECT id FROM snapshots WHERE object_set = ? ORDER BY id DESC LIMIT ?",
+        (object_set, count),
+    )
+    return [snapshot_id for (snapshot_id,) in rows][::-1]
+
+
+def top_growth(
+    conn: sqlite3.Connection,
+    object_set: str,
+    last: int,
+    metric: str = "total_states",
+    limit: int = 20,
+) -> List[Tuple]:
+    """
+    Programs whose `metric` grew the most between the oldest and the newest
+    of the `last` snapshots of `object_set`.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'")
+
+    snapshots = last_snapshots(conn, object_set, last)
+    if len(snapshots) < 2:
+        return []
+
+    return conn.execute(
+        f"""
+        SELECT p.file_name, p.prog_name, old.{metric}, new.{metric},
+               new.{metric} - old.{metric} AS growth
+        FROM results AS new
+        JOIN results AS old
+            ON old.snapshot_id = ? AND old.program_id = new.program_id
+        JOIN programs AS p ON p.id = new.program_id
+        WHERE new.snapshot_id = ? AND growth > 0
+        ORDER BY growth DESC
+        LIMIT ?
+        """,
+        (snapshots[0], snapshots[-1], limit),
+    ).fetchall()
+
+
+def series(
+    conn: sqlite3.Connection,
+    object_set: str,
+    file_name: str,
+    prog_name: str,
+    last: Optional[int] = None,
+) -> List[Tuple]:
+    """
+    Per-snapshot results of a single program, oldest first.
+    """
+    rows = conn.execute(
+        f"""
+        SELECT s.commit_sha, s.created_at, r.success,
+               {", ".join(f"r.{metric}" for metric in METRICS)}
+        FROM programs AS p
+        JOIN results AS r ON r.program_id = p.id
+        JOIN snapshots AS s ON s.id = r.snapshot_id
+        WHERE p.file_name = ? AND p.prog_name = ? AND s.object_set = ?
+        ORDER BY s.id DESC
+        LIMIT ?
+        """,
+        (file_name, prog_name, object_set, -1 if last is None else last),
+    ).fetchall()
+    return rows[::-1]
+
+
+def git_ancestors(commit: str, max_count: int, git_dir: str = ".") -> List[str]:
+    """First-parent ancestors of `commit`, itself first."""
+    output = subprocess.run(
+        [
+            "git",
+            "-C",
+            git_dir,
+            "rev-list",
+            "--first-parent",
+            f"--max-count={max_count}",
+            commit,
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    ).stdout
+    return output.split()
+
+
+def resolve_ancestor(
+    conn: sqlite3.Connection, object_set: str, ancestors: List[str]
+) -> Optional[Tuple[int, str, int]]:
+    """
+    (distance, commit, snapshot id) of the first of `ancestors`, nearest
+    first, with a snapshot of `object_set`.
+    """
+    for start in range(0, len(ancestors), RESOLVE_BATCH):
+        batch = ancestors[start : start + RESOLVE_BATCH]
+        rows = conn.execute(
+            f"SELECT commit_sha, id FROM snapshots "
+            f"WHERE object_set = ? AND commit_sha IN ({', '.join('?' * len(batch))})",
+            (object_set, *batch),
+        )
+        found = dict(rows)
+        for distance, commit in enumerate(batch, start=start):
+            if commit in found:
+                return distance, commit, found[commit]
+    return None
+
+
+def export_snapshot(
+    conn: sqlite3.Connection, snapshot_id: int, csv_file: TextIO
+) -> int:
+    """
+    Write a snapshot as plain veristat CSV, with the metrics every program
+    of it has. Returns the number of programs.
+    """
+    counts = conn.execute(
+        f"SELECT COUNT(*), {', '.join(f'COUNT({metric})' for metric in METRICS)} "
+        f"FROM results WHERE snapshot_id = ?",
+        (snapshot_id,),
+    ).fetchone()
+    metrics = [
+        metric for metric, count in zip(METRICS, counts[1:]) if count == counts[0]
+    ]
+    rows = conn.execute(
+        f"""
+        SELECT p.file_name, p.prog_name, r.success
+               {"".join(f", r.{metric}" for metric in metrics)}
+        FROM results AS r
+        JOIN programs AS p ON p.id = r.program_id
+        WHERE r.snapshot_id = ?
+        ORDER BY p.file_name, p.prog_name
+        """,
+        (snapshot_id,),
+    )
+    writer = csv.writer(csv_file)
+    writer.writerow(["file_name", "prog_name", "verdict", *metrics])
+    for file_name, prog_name, success, *values in rows:
+        writer.writerow(
+            [file_name, prog_name, "success" if success else "failure", *values]
+        )
+    return counts[0]
+
+
+def write_csv(header: List[str], rows: Iterable[Tuple]) -> None:
+    writer = csv.writer(sys.stdout)
+    writer.writerow(header)
+    writer.writerows(rows)
+
+
+def main(args: argparse.Namespace) -> int:
+    conn = connect(args.db)
+    try:
+        return run_command(conn, args)
+    finally:
+        conn.close()
+
+
+def run_command(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    if args.command == "ingest":
+        with open(args.filename, newline="", encoding="utf-8") as csv_file:
+            count = ingest(conn, csv_file, args.commit, args.object_set)
+        print(f"Stored {count} results for {args.object_set} at {args.commit}")
+    elif args.command == "top-growth":
+        write_csv(
+            ["file_name", "prog_name", "old", "new", "growth"],
+            top_growth(conn, args.object_set, args.last, args.metric, args.limit),
+        )
+    elif args.command == "series":
+        write_csv(
+            ["commit", "created_at", "success", *METRICS],
+            series(conn, args.object_set, args.file, args.prog, args.last),
+        )
+    elif args.command == "resolve":
+        ancestors = git_ancestors(args.commit, args.max_distance + 1, args.git_dir)
+        resolved = resolve_ancestor(conn, args.object_set, ancestors)
+        if resolved is None:
+            print(
+                f"No snapshot of {args.object_set} within {args.max_distance} "
+                f"commits of {args.commit}"
+            )
+            return 1
+        distance, commit, snapshot_id = resolved
+        with open(args.output, "w", newline="", encoding="utf-8") as csv_file:
+            count = export_snapshot(conn, snapshot_id, csv_file)
+        print(
+            f"Baseline of {args.object_set} at {commit}, {distance} commits "
+            f"before {args.commit}, {count} programs"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store veristat results per commit and query their trends"
+    )
+    parser.add_argument("--db", required=True, help="SQLite database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Store veristat results")
+    ingest_parser.add_argument("filename", help="Plain veristat CSV output")
+    ingest_parser.add_argument("--commit", required=True)
+    ingest_parser.add_argument("--object-set", required=True)
+
+    top_parser = subparsers.add_parser(
+        "top-growth", help="Programs whose metric grew the most"
+    )
+    top_parser.add_argument("--object-set", required=True)
+    top_parser.add_argument("--last", type=int, default=50)
+    top_parser.add_argument("--metric", default="total_states", choices=METRICS)
+    top_parser.add_argument("--limit", type=int, default=20)
+
+    series_parser = subparsers.add_parser("series", help="Results of one program")
+    series_parser.add_argument("--object-set", required=True)
+    series_parser.add_argument("--file", required=True)
+    series_parser.add_argument("--prog", required=True)
+    series_parser.add_argument("--last", type=int)
+
+    resolve_parser = subparsers.add_parser(
+        "resolve", help="Write the snapshot of the nearest ancestor as CSV"
+    )
+    resolve_parser.add_argument("--object-set", required=True)
+    resolve_parser.add_argument("--commit", required=True, help="e.g. the PR base")
+    resolve_parser.add_argument("--output", required=True)
+    resolve_parser.add_argument("--max-distance", type=int, default=500)
+    resolve_parser.add_argument("--git-dir", default=".")
+
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+# Compares baseline and candidate verifier logs of a regressed program,
+# e.g. as dumped by dump_veristat_logs.py, and points to the first
+# instruction where verification went differently, plus the final error
+# and processed instruction count of each log.
+#
+# Usage:
+#
+#   veristat_log_diff.py BASELINE_LOG CANDIDATE_LOG
+#   veristat_log_diff.py --baseline-dir DIR --candidate-dir DIR
+#
+# The second form compares every *.log file present in both directories.
+#
+# Verbose verifier logs can be hundreds of MB, so both logs are mmap-ed and
+# streamed side by side through generators. Only a few lines of context are
+# kept in memory, never the logs themselves.
+#
+# Instruction lines ("12: (bf) r6 = r1 ; R1=ctx() R6_w=ctx()") and branch
+# lines ("from 12 to 15: ...") are compared in order, with whitespace
+# normalized. Any other line is treated as a message. A message between the
+# last instruction and the "processed N insns" line is taken as the final
+# error, unless the PROCESSING line of the log has a success verdict. The
+# "verification time" and "stack depth" lines the kernel prints right
+# before "processed" (veristat -v always asks for BPF_LOG_STATS) are not
+# messages.
+
+import argparse
+import collections
+import itertools
+import mmap
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Deque, Final, Iterator, List, Optional, Tuple
+
+DEFAULT_CONTEXT: Final[int] = 3
+
+INSN_LINE_RE: Final[re.Pattern] = re.compile(
+    rb"^(\d+: \([0-9a-f]{2}\)|from \d+ to \d+:)"
+)
+PROCESSED_LINE_RE: Final[re.Pattern] = re.compile(rb"^processed (\d+) insns")
+STATS_LINE_RE: Final[re.Pattern] = re.compile(
+    rb"^(verification time \d+ usec|stack depth \d)"
+)
+VERDICT_RE: Final[re.Pattern] = re.compile(rb"^PROCESSING .*, VERDICT: (\w+)")
+WHITESPACE_RE: Final[re.Pattern] = re.compile(rb"\s+")
+
+
+@dataclass
+class LogSummary:
+    path: str
+    instructions: int = 0
+    processed: Optional[int] = None
+    error: Optional[str] = None
+    # From the PROCESSING line of dump_veristat_logs.py output, if any
+    verdict: Optional[str] = None
+    # Last message since the last instruction
+    last_message: Optional[str] = None
+
+    def describe(self) -> str:
+        processed = "unknown" if self.processed is None else self.processed
+        return (
+            f"{self.path}: {self.instructions} instruction lines, "
+            f"processed {processed} insns, "
+            f"error: {self.error or 'none'}"
+        )
+
+
+@dataclass
+class LogDiff:
+    old: LogSummary
+    new: LogSummary
+    # 1-based position in the instruction stream, None if the streams match
+    divergence: Optional[int] = None
+    context: List[Tuple[Optional[str], Optional[str]]] = field(default_factory=list)
+    old_lineno: Optional[int] = None
+    new_lineno: Optional[int] = None
+
+    def report(self) -> str:
+        lines = [
+            f"Baseline:  {self.old.describe()}",
+            f"Candidate: {self.new.describe()}",
+        ]
+        if self.divergence is None:
+            lines.append("Instruction streams are identical")
+            return "\n".join(lines) + "\n"
+
+        lines.append(
+            f"First divergence at instruction #{self.divergence} "
+            f"(baseline line {self.old_lineno}, candidate line {self.new_lineno}):"
+        )
+        for old, new in self.context:
+            if old == new:
+                lines.append(f"  {old}")
+                continue
+            if old is not None:
+                lines.append(f"- {old}")
+            if new is not None:
+                lines.append(f"+ {new}")
+        return "\n".join(lines) + "\n"
+
+
+def read_lines(path: str) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (line number, line) of a file without loading it into memory.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for lineno, line in enumerate(iter(mm.readline, b""), start=1):
+                yield lineno, line.rstrip(b"\r\n")
+
+
+def instructions(summary: LogSummary) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (line number, normalized line) of the instruction stream of a log,
+    updating `summary` with messages and counters on the way.
+    """
+    for lineno, line in read_lines(summary.path):
+        if INSN_LINE_RE.match(line):
+            summary.instructions += 1
+            summary.last_message = None
+            yield lineno, WHITESPACE_RE.sub(b" ", line).strip().decode(
+                "utf-8", "replace"
+            )
+            continue
+
+        processed = PROCESSED_LINE_RE.match(line)
+        verdict = VERDICT_RE.match(line)
+        if processed:
+            summary.processed = int(processed.group(1))
+            if summary.verdict != "success":
+                summary.error = summary.last_message
+        elif verdict:
+            summary.verdict = verdict.group(1).decode("utf-8", "replace")
+        elif line.strip() and not STATS_LINE_RE.match(line):
+            summary.last_message = line.strip().decode("utf-8", "replace")
+
+
+def diff_logs(old_path: str, new_path: str, context: int = DEFAULT_CONTEXT) -> LogDiff:
+    result = LogDiff(old=LogSummary(old_path), new=LogSummary(new_path))
+    old_insns = instructions(result.old)
+    new_insns = instructions(result.new)
+
+    before: Deque[Tuple[Optional[str], Optional[str]]] = collections.deque(
+        maxlen=context
+    )
+    pairs = itertools.zip_longest(old_insns, new_insns)
+    for position, (old, new) in enumerate(pairs, start=1):
+        old_text = None if old is None else old[1]
+        new_text = None if new is None else new[1]
+        if old_text == new_text:
+            before.append((old_text, new_text))
+            continue
+
+        result.divergence = position
+        result.old_lineno = None if old is None else old[0]
+        result.new_lineno = None if new is None else new[0]
+        result.context = [*before, (old_text, new_text)]
+        for old, new in itertools.islice(pairs, context):
+            result.context.append(
+                (None if old is None else old[1], None if new is None else new[1])
+            )
+        break
+
+    # Drain both logs for the final errors and counters
+    collections.deque(old_insns, maxlen=0)
+    collections.deque(new_insns, maxlen=0)
+    return result
+
+
+def log_pairs(baseline_dir: str, candidate_dir: str) -> Iterator[Tuple[str, str]]:
+    for name in sorted(os.listdir(candidate_dir)):
+        baseline_path = os.path.join(baseline_dir, name)
+        if name.endswith(".log") and os.path.isfile(baseline_path):
+            yield baseline_path, os.path.join(candidate_dir, name)
+
+
+def main(args: argparse.Namespace) -> int:
+    if args.baseline_dir:
+        pairs = list(log_pairs(args.baseline_dir, args.candidate_dir))
+    else:
+        pairs = [(args.baseline_log, args.candidate_log)]
+
+    for old_path, new_path in pairs:
+        sys.stdout.write(diff_logs(old_path, new_path, args.context).report())
+        sys.stdout.write("\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find where verification diverges between two verifier logs"
+    )
+    parser.add_argument("baseline_log", nargs="?")
+    parser.add_argument("candidate_log", nargs="?")
+    parser.add_argument("--baseline-dir")
+    parser.add_argument("--candidate-dir")
+    parser.add_argument("--context", type=int, default=DEFAULT_CONTEXT)
+    args = parser.parse_args()
+    if bool(args.baseline_dir) != bool(args.candidate_dir):
+        parser.error("--baseline-dir and --candidate-dir go together")
+    if not args.baseline_dir and not (args.baseline_log and args.candidate_log):
+        parser.error("either two log files or two directories are required")
+    sys.exit(main(args))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+# Plans the veristat runs of all run_veristat.*.cfg files (kernel, meta, scx,
+# cilium) for a single VM boot, instead of one boot per object set.
+#
+# Usage:
+#
+#   veristat_plan.py --configs ci/vmtest/configs \
+#       --baseline-prefix "${ARCH_AND_TOOL}-baseline-" \
+#       --plan veristat-plan.json --script run-veristat-plan.sh
+#
+# Each cfg file is the set of shell variables run-vmtest's run_veristat
+# sources: VERISTAT_OBJECTS_DIR, VERISTAT_OBJECTS_GLOB, VERISTAT_OUTPUT and
+# optionally VERISTAT_CFG_FILE. Values may refer to variables only defined
+# inside the VM, like ${SELFTESTS_BPF}, so they are kept as they are and
+# expanded by the generated script at run time.
+#
+# The script runs veristat once per set inside the VM, one set after the
+# other so that durations stay comparable with the per-set baselines, and
+# writes every set's CSV to $OUTPUT_DIR under its own VERISTAT_OUTPUT name.
+# A set whose objects directory does not exist in this run is skipped, so
+# one plan works whether or not the meta, scx or cilium objects were
+# fetched.
+#
+# The plan is JSON with the same sets and their baseline names, for
+# `veristat_compare.py --plan` to compare all of them in one process.
+
+import argparse
+import glob
+import json
+import os
+import re
+import shlex
+import sys
+from dataclasses import asdict, dataclass
+from typing import Dict, Final, Iterable, List, Optional
+
+CFG_PREFIX: Final[str] = "run_veristat."
+CFG_SUFFIX: Final[str] = ".cfg"
+REQUIRED_VARIABLES: Final[List[str]] = [
+    "VERISTAT_OBJECTS_DIR",
+    "VERISTAT_OBJECTS_GLOB",
+    "VERISTAT_OUTPUT",
+]
+ASSIGNMENT_RE: Final[re.Pattern] = re.compile(r"^([A-Z_][A-Z0-9_]*)=(.*)$")
+
+SCRIPT_HEADER: Final[str] = """#!/bin/bash
+# Generated by .github/scripts/veristat_plan.py from {sources}
+
+set -o pipefail
+
+OUTPUT_DIR="${{OUTPUT_DIR:-$(pwd)}}"
+VERISTAT="${{VERISTAT:-${{SELFTESTS_BPF}}/veristat}}"
+status=0
+
+run_set() {{
+    local target="$1" objects_dir="$2" objects_glob="$3" cfg_file="$4" output="$5"
+    if [[ ! -d "$objects_dir" ]]; then
+        echo "veristat $target: no $objects_dir, skipped"
+        return
+    fi
+    echo "veristat $target: $objects_dir/$objects_glob -> $OUTPUT_DIR/$output"
+    local start=$SECONDS
+    # The glob is expanded in the objects directory, as run_veristat does
+    if ! (cd "$objects_dir" && "$VERISTAT" -o csv -q ${{cfg_file:+-f "$cfg_file"}} \\
+            $objects_glob) > "$OUTPUT_DIR/$output"; then
+        echo "veristat $target failed"
+        status=1
+    fi
+    echo "veristat $target took $((SECONDS - start))s"
+}}
+
+"""
+
+
+@dataclass
+class VeristatSet:
+    target: str
+    objects_dir: str
+    objects_glob: str
+    output: str
+    cfg_file: str = ""
+    baseline: str = ""
+
+
+def parse_cfg(lines: Iterable[str]) -> Dict[str, str]:
+    """Variable assignments of a cfg file, with their quotes removed."""
+    variables = {}
+    for line in lines:
+        match = ASSIGNMENT_RE.match(line.strip())
+        if not match:
+            continue
+        name, value = match.groups()
+        # shlex drops the quotes and leaves ${VAR} references alone
+        words = shlex.split(value, comments=True)
+        variables[name] = words[0] if words else ""
+    return variables
+
+
+def cfg_target(filename: str) -> str:
+    return os.path.basename(filename)[len(CFG_PREFIX) : -len(CFG_SUFFIX)]
+
+
+def load_sets(
+    configs_dir: str,
+    targets: Optional[List[str]] = None,
+    baseline_prefix: str = "",
+) -> List[VeristatSet]:
+    """
+    One set per run_veristat.<target>.cfg of `configs_dir`, in target order,
+    only `targets` if given.
+    """
+    filenames = sorted(
+        glob.glob(os.path.join(configs_dir, f"{CFG_PREFIX}*{CFG_SUFFIX}"))
+    )
+    by_target = {cfg_target(filename): filename for filename in filenames}
+    if targets:
+        for target in targets:
+            if target not in by_target:
+                raise ValueError(
+                    f"No {CFG_PREFIX}{target}{CFG_SUFFIX} in {configs_dir}"
+                )
+        by_target = {target: by_target[target] for target in targets}
+
+    sets = []
+    for target, filename in by_target.items():
+        with open(filename, encoding="utf-8") as file:
+            variables = parse_cfg(file)
+        for name in REQUIRED_VARIABLES:
+            if not variables.get(name):
+                raise ValueError(f"{filename} does not set {name}")
+        output = variables["VERISTAT_OUTPUT"]
+        sets.append(
+            VeristatSet(
+                target=target,
+                objects_dir=variables["VERISTAT_OBJECTS_DIR"],
+                objects_glob=variables["VERISTAT_OBJECTS_GLOB"],
+                output=output,
+                cfg_file=variables.get("VERISTAT_CFG_FILE", ""),
+                baseline=f"{baseline_prefix}{output}",
+            )
+        )
+
+    outputs = [veristat_set.output for veristat_set in sets]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError(f"Sets would overwrite each other's output: {outputs}")
+    return sets
+
+
+def shell_word(value: str) -> str:
+    """
+    Double quoted, so that ${VAR} references of the cfg files still expand
+    in the VM while nothing else does.
+    """
+    escaped = re.sub(r'(["\\`])', r"\\\1", value)
+    escaped = re.sub(r"\$(?!\{)", r"\\$", escaped)
+    return f'"{escaped}"'
+
+
+def render_script(sets: List[VeristatSet]) -> str:
+    sources = ", ".join(f"{CFG_PREFIX}{s.target}{CFG_SUFFIX}" for s in sets)
+    lines = [SCRIPT_HEADER.format(sources=sources)]
+    for veristat_set in sets:
+        words = [
+            veristat_set.target,
+            veristat_set.objects_dir,
+            veristat_set.objects_glob,
+            veristat_set.cfg_file,
+            veristat_set.output,
+        ]
+        lines.append("run_set " + " ".join(shell_word(word) for word in words) + "\n")
+    lines.append("\nexit $status\n")
+    return "".join(lines)
+
+
+def main(args: argparse.Namespace) -> int:
+    sets = load_sets(args.configs, args.target, args.baseline_prefix)
+    print(f"Planned {len(sets)} veristat sets: {', '.join(s.target for s in sets)}")
+
+    if args.plan:
+        with open(args.plan, "w", encoding="utf-8") as file:
+            json.dump({"sets": [asdict(s) for s in sets]}, file, indent=2)
+    if args.script:
+        with open(args.script, "w", encoding="utf-8") as file:
+            file.write(render_script(sets))
+        os.chmod(args.script, 0o755)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plan all veristat object sets for a single VM boot"
+    )
+    parser.add_argument(
+        "--configs",
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "../../ci/vmtest/configs"
+        ),
+        help="Directory with the run_veristat.*.cfg files",
+    )
+    parser.add_argument(
+        "--target",
+        action="append",
+        help="Only plan this set, e.g. kernel, repeatable",
+    )
+    parser.add_argument(
+        "--baseline-prefix",
+        default="",
+        help="Baseline file name of a set is this prefix and its output name",
+    )
+    parser.add_argument("--plan", help="Write the plan as JSON here")
+    parser.add_argument("--script", help="Write the script to run in the VM here")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+# Splits a veristat object set into N shards of similar verification time,
+# one veristat cfg file per shard, and merges the shard outputs back into
+# the CSV a single run would have written.
+#
+# Usage:
+#
+#   veristat_shard.py split --shards 4 \
+#       --baseline x86_64-gcc-baseline-veristat-meta \
+#       --objects-dir bpf_objects --glob '*.o' \
+#       --cfg ci/vmtest/configs/veristat_meta.cfg \
+#       --output-dir shards --plan shards/plan.json
+#
+#   veristat_shard.py merge --plan shards/plan.json \
+#       --output veristat-meta shard-0/veristat-meta shard-1/veristat-meta ...
+#
+# The cost of an object is the sum of the `duration` of its programs in the
+# previous baseline. Programs without a duration are costed by their
+# `total_insns` at the median duration per instruction of the baseline, and
+# objects missing from the baseline, e.g. new ones, at the median object
+# cost. Objects are then packed longest first into the least loaded shard.
+#
+# Shard cfg files keep every exclusion ("!" entry) of the original cfg and
+# list the shard's objects, so `veristat -f shard-<i>.cfg <glob>` in the same
+# objects directory verifies exactly that shard. Program level entries of
+# the original cfg ("obj.o/prog") are kept for their object only. There are
+# never more shards than objects: the cfg of a shard without objects would
+# hold only exclusions, and veristat would verify everything else.
+#
+# veristat writes programs object by object, in the order its arguments
+# came in, i.e. sorted by the shell glob. merge puts the shard rows back in
+# the order of the objects in the plan, keeping the program order of each
+# object, so the result is the same CSV as a single run's.
+
+import argparse
+import csv
+import fnmatch
+import glob
+import heapq
+import io
+import json
+import os
+import statistics
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Final, Iterable, List, Optional, Tuple
+
+DURATION: Final[str] = "duration"
+TOTAL_INSNS: Final[str] = "total_insns"
+# Cost of every object when there is no baseline at all, only the object
+# count gets balanced then
+DEFAULT_COST: Final[float] = 1.0
+
+
+@dataclass
+class CfgEntry:
+    negated: bool
+    file_glob: str
+    prog_glob: Optional[str]
+
+
+def parse_cfg(lines: Iterable[str]) -> List[CfgEntry]:
+    """Entries of a veristat -f file, "[!]file_glob[/prog_glob]" per line."""
+    entries = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        negated = line.startswith("!")
+        file_glob, sep, prog_glob = line.lstrip("!").partition("/")
+        entries.append(CfgEntry(negated, file_glob, prog_glob if sep else None))
+    return entries
+
+
+def format_entry(entry: CfgEntry) -> str:
+    prefix = "!" if entry.negated else ""
+    suffix = f"/{entry.prog_glob}" if entry.prog_glob is not None else ""
+    return f"{prefix}{entry.file_glob}{suffix}"
+
+
+def selected_objects(objects: List[str], entries: List[CfgEntry]) -> List[str]:
+    """
+    Objects veristat verifies anything of under `entries`: with positive
+    entries only the objects they match, never the whole-object exclusions.
+    """
+    positive = [entry for entry in entries if not entry.negated]
+    excluded = [entry for entry in entries if entry.negated and entry.prog_glob is None]
+    selected = []
+    for name in objects:
+        if any(fnmatch.fnmatchcase(name, entry.file_glob) for entry in excluded):
+            continue
+        if positive and not any(
+            fnmatch.fnmatchcase(name, entry.file_glob) for entry in positive
+        ):
+            continue
+        selected.append(name)
+    return selected
+
+
+def shard_cfg(objects: List[str], entries: List[CfgEntry]) -> List[str]:
+    """
+    Lines of the cfg file verifying `objects` as `entries` would: all the
+    exclusions, and every object either whole or with the programs the
+    original entries select in it.
+    """
+    positive = [entry for entry in entries if not entry.negated]
+    lines = []
+    for name in objects:
+        matching = [e for e in positive if fnmatch.fnmatchcase(name, e.file_glob)]
+        if not matching or any(entry.prog_glob is None for entry in matching):
+            lines.append(name)
+        else:
+            lines += [
+                format_entry(CfgEntry(False, name, entry.prog_glob))
+                for entry in matching
+            ]
+    lines += [format_entry(entry) for entry in entries if entry.negated]
+    return lines
+
+
+def parse_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def object_costs(baseline_csv: Iterable[str]) -> Dict[str, float]:
+    """Estimated verification time of every object of a baseline CSV."""
+    reader = csv.reader(baseline_csv)
+    column = {name: idx for idx, name in enumerate(next(reader, []))}
+    if "file_name" not in column:
+        raise ValueError("Missing 'file_name' column in veristat baseline")
+    duration_idx = column.get(DURATION)
+    insns_idx = column.get(TOTAL_INSNS)
+
+    durations: Dict[str, float] = {}
+    # Instructions of the programs without a duration, per object
+    uncosted: Dict[str, float] = {}
+    per_insn = []
+    for record in reader:
+        file_name = record[column["file_name"]]
+        duration = None if duration_idx is None else parse_float(record[duration_idx])
+        insns = None if insns_idx is None else parse_float(record[insns_idx])
+        durations.setdefault(file_name, 0.0)
+        if duration is not None:
+            durations[file_name] += duration
+            if insns:
+                per_insn.append(duration / insns)
+        elif insns is not None:
+            uncosted[file_name] = uncosted.get(file_name, 0.0) + insns
+
+    insn_cost = statistics.median(per_insn) if per_insn else 0.0
+    for file_name, insns in uncosted.items():
+        durations[file_name] += insns * insn_cost
+    if not any(durations.values()):
+        return {file_name: DEFAULT_COST for file_name in durations}
+    return durations
+
+
+def pack_shards(
+    objects: List[str], costs: Dict[str, float], shards: int
+) -> List[Tuple[float, List[str]]]:
+    """
+    (cost, objects) of `shards` bins, filled longest first into the least
+    loaded bin. Objects without a cost get the median cost.
+    """
+    known = [costs[name] for name in objects if name in costs]
+    default = statistics.median(known) if known else DEFAULT_COST
+    weighted = sorted(
+        ((costs.get(name, default), name) for name in objects),
+        key=lambda item: (-item[0], item[1]),
+    )
+    bins: List[List[str]] = [[] for _ in range(shards)]
+    loads = [(0.0, idx) for idx in range(shards)]
+    for cost, name in weighted:
+        load, idx = heapq.heappop(loads)
+        bins[idx].append(name)
+        heapq.heappush(loads, (load + cost, idx))
+    totals = {idx: load for load, idx in loads}
+    return [(totals[idx], sorted(bins[idx])) for idx in range(shards)]
+
+
+@dataclass
+class Shard:
+    index: int
+    cfg: str
+    cost: float
+    objects: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ShardPlan:
+    # Every selected object, in the order a single veristat run takes them
+    objects: List[str]
+    shards: List[Shard]
+
+    def describe(self) -> str:
+        total = sum(shard.cost for shard in self.shards)
+        longest = max((shard.cost for shard in self.shards), default=0.0)
+        speedup = total / longest if longest else 1.0
+        return (
+            f"{len(self.objects)} objects in {len(self.shards)} shards, "
+            f"longest shard {longest / 1e6:.1f}s of {total / 1e6:.1f}s total "
+            f"({speedup:.2f}x)"
+        )
+
+
+def split(
+    objects: List[str],
+    entries: List[CfgEntry],
+    costs: Dict[str, float],
+    shards: int,
+    output_dir: str,
+) -> ShardPlan:
+    """
+    Write shard-<i>.cfg files to `output_dir`, at most one per selected
+    object.
+    """
+    if shards < 1:
+        raise ValueError("At least one shard is needed")
+    selected = selected_objects(sorted(objects), entries)
+    if len(selected) < shards:
+        print(f"Only {len(selected)} objects, writing as many shards")
+        shards = len(selected)
+    plan = ShardPlan(selected, [])
+    for idx, (cost, shard_objects) in enumerate(pack_shards(selected, costs, shards)):
+        cfg = os.path.join(output_dir, f"shard-{idx}.cfg")
+        with open(cfg, "w", encoding="utf-8") as file:
+            file.writelines(f"{line}\n" for line in shard_cfg(shard_objects, entries))
+        plan.shards.append(Shard(idx, cfg, cost, shard_objects))
+    return plan
+
+
+def merge(objects: List[str], shard_outputs: List[Iterable[str]]) -> str:
+    """
+    One veristat CSV out of shard outputs, with the rows of every object
+    in the order of `objects` and programs in their shard order.
+    """
+    header = None
+    rows: Dict[str, List[str]] = {}
+    for shard_output in shard_outputs:
+        lines = iter(shard_output)
+        shard_header = next(lines, None)
+        if shard_header is None:
+            continue
+        if header is None:
+            header = shard_header
+        elif shard_header != header:
+            raise ValueError(f"Shard outputs have different columns: {shard_header}")
+        for line in lines:
+            if not line.strip():
+                continue
+            # The file name never contains a comma, veristat does not quote it
+            rows.setdefault(line.split(",", 1)[0], []).append(line)
+
+    if header is None:
+        return ""
+    order = {name: idx for idx, name in enumerate(objects)}
+    out = io.StringIO()
+    out.write(header)
+    for name in sorted(rows, key=lambda name: (order.get(name, len(order)), name)):
+        out.writelines(rows[name])
+    return out.getvalue()
+
+
+def main(args: argparse.Namespace) -> int:
+    if args.command == "split":
+        costs: Dict[str, float] = {}
+        if args.baseline and os.path.isfile(args.baseline):
+            with open(args.baseline, newline="", encoding="utf-8") as file:
+                costs = object_costs(file)
+        else:
+            print("No baseline, balancing the object count only")
+
+        if args.objects_dir:
+            objects = [
+                os.path.basename(path)
+                for path in glob.glob(os.path.join(args.objects_dir, args.glob))
+            ]
+        else:
+            objects = list(costs)
+
+        entries: List[CfgEntry] = []
+        if args.cfg:
+            with open(args.cfg, encoding="utf-8") as file:
+                entries = parse_cfg(file)
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        plan = split(objects, entries, costs, args.shards, args.output_dir)
+        print(plan.describe())
+        with open(args.plan, "w", encoding="utf-8") as file:
+            json.dump(asdict(plan), file, indent=2)
+    elif args.command == "merge":
+        with open(args.plan, encoding="utf-8") as file:
+            objects = json.load(file)["objects"]
+        outputs = []
+        for filename in args.shard_outputs:
+            if not os.path.isfile(filename):
+                print(f"Missing shard output {filename}", file=sys.stderr)
+                return 1
+            with open(filename, newline="", encoding="utf-8") as file:
+                outputs.append(file.readlines())
+        with open(args.output, "w", newline="", encoding="utf-8") as file:
+            file.write(merge(objects, outputs))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Shard veristat object sets by cost and merge the results"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = subparsers.add_parser("split", help="Write per-shard cfg files")
+    split_parser.add_argument("--shards", type=int, required=True)
+    split_parser.add_argument(
+        "--baseline", help="Previous plain veristat CSV with duration, total_insns"
+    )
+    split_parser.add_argument(
+        "--objects-dir", help="Objects to shard, those of the baseline otherwise"
+    )
+    split_parser.add_argument("--glob", default="*.o", help="VERISTAT_OBJECTS_GLOB")
+    split_parser.add_argument("--cfg", help="Original veristat -f file to shard")
+    split_parser.add_argument("--output-dir", required=True)
+    split_parser.add_argument("--plan", required=True, help="Write the plan here")
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="Merge shard outputs into one veristat CSV"
+    )
+    merge_parser.add_argument("--plan", required=True)
+    merge_parser.add_argument("--output", required=True)
+    merge_parser.add_argument("shard_outputs", nargs="+")
+
+    sys.exit(main(parser.parse_args()))